@@ -1,6 +1,7 @@
 import os
 from flask import Flask
 from app.extensions import db, migrate
+from app import admission, assets, budgets, compression, counters, documents, exports, facets, images, metrics, models, prerender, profiling, rating_events, read_snapshot, recommendations, reconcile, releases, rendering, rollups, routing, similarity, singleflight, sitemaps, snapshot, trending
 from config import config
 from flask_bootstrap import Bootstrap
 
@@ -15,12 +16,46 @@ def create_app(config_name=None):
     app.config.from_object(config.get(config_name, config['development']))
 
     # Initialize extensions
+    metrics.instrument_pool(app)
     db.init_app(app)
     migrate.init_app(app, db)
+    routing.init_app(app)
+    metrics.init_app(app, db)
+    profiling.init_app(app)
+    admission.init_app(app)
+    budgets.init_app(app)
+    singleflight.init_app(app)
+    documents.init_app(app)
+    images.init_app(app)
+    assets.init_app(app)
+    rendering.init_app(app)
+    compression.init_app(app)
+    exports.init_app(app)
+    similarity.init_app(app)
+    recommendations.init_app(app)
+    snapshot.init_app(app)
+    read_snapshot.init_app(app)
+    facets.init_app(app)
+    releases.init_app(app)
+    counters.init_app(app)
+    rollups.init_app(app)
+    reconcile.init_app(app)
+    sitemaps.init_app(app)
+    prerender.init_app(app)
+    rating_events.init_app(app)
+    trending.init_app(app)
 
     # Register blueprints
     from app.routes.main import main_blueprint
     app.register_blueprint(main_blueprint)
+    from app.routes.ops import ops_blueprint
+    app.register_blueprint(ops_blueprint)
+    from app.routes.images import images_blueprint
+    app.register_blueprint(images_blueprint)
+    from app.routes.assets import assets_blueprint
+    app.register_blueprint(assets_blueprint)
+    from app.routes.sitemaps import sitemaps_blueprint
+    app.register_blueprint(sitemaps_blueprint)
 
     # Create tables
     with app.app_context():
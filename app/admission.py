@@ -0,0 +1,141 @@
+import threading
+import time
+from collections import OrderedDict
+from flask import Response, current_app, g, request, session
+from sqlalchemy import exc
+from app.metrics import ADMISSION_IN_FLIGHT, ADMISSION_QUEUED, ADMISSION_REJECTED, ADMISSION_WAIT, RATE_LIMITED
+from app.rendering import prerendering
+
+# Blueprints that are never queued: health checks and static files must answer under load
+EXEMPT_BLUEPRINTS = {'ops', 'assets', 'sitemaps'}
+
+
+def route_class(name):
+    # 'cheap' (the default), 'heavy' (aggregate pages) or 'write'
+    def decorator(view):
+        view.route_class = name
+        return view
+    return decorator
+
+
+def rate_limited(bucket, methods=('GET', 'POST')):
+    def decorator(view):
+        view.rate_limit = (bucket, methods)
+        return view
+    return decorator
+
+
+class Gate:
+    # A counting semaphore with a bounded queue: at most `limit` requests run, at most `queue`
+    # wait, and none waits longer than `timeout` seconds
+    def __init__(self, name, limit, queue, timeout):
+        self.name = name
+        self.semaphore = threading.BoundedSemaphore(limit)
+        self.queue = queue
+        self.timeout = timeout
+        self.waiting = 0
+        self.lock = threading.Lock()
+
+    def enter(self):
+        if self.semaphore.acquire(blocking=False):
+            ADMISSION_IN_FLIGHT.labels(self.name).inc()
+            return None
+        with self.lock:
+            if self.waiting >= self.queue:
+                return 'queue_full'
+            self.waiting += 1
+        ADMISSION_QUEUED.labels(self.name).inc()
+        start = time.perf_counter()
+        try:
+            admitted = self.semaphore.acquire(timeout=self.timeout)
+        finally:
+            with self.lock:
+                self.waiting -= 1
+            ADMISSION_QUEUED.labels(self.name).dec()
+            ADMISSION_WAIT.labels(self.name).observe(time.perf_counter() - start)
+        if not admitted:
+            return 'timeout'
+        ADMISSION_IN_FLIGHT.labels(self.name).inc()
+        return None
+
+    def leave(self):
+        ADMISSION_IN_FLIGHT.labels(self.name).dec()
+        self.semaphore.release()
+
+
+class TokenBuckets:
+    # One bucket per (client, bucket name) in this worker's memory, so RATE_LIMITS apply per worker;
+    # least recently used clients are forgotten past max_clients
+    def __init__(self, max_clients=100000):
+        self.buckets = OrderedDict()
+        self.max_clients = max_clients
+        self.lock = threading.Lock()
+
+    def take(self, key, rate, burst):
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated = self.buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self.buckets[key] = (tokens, now)
+            if len(self.buckets) > self.max_clients:
+                self.buckets.popitem(last=False)
+        return allowed, 0 if allowed else (1 - tokens) / rate
+
+
+def overloaded(retry_after):
+    response = Response('The server is busy, please try again shortly.\n', 503, mimetype='text/plain')
+    response.headers['Retry-After'] = str(max(1, round(retry_after)))
+    return response
+
+
+def too_many_requests(retry_after):
+    response = Response('Too many requests, please slow down.\n', 429, mimetype='text/plain')
+    response.headers['Retry-After'] = str(max(1, round(retry_after)))
+    return response
+
+
+def client_key():
+    return session.get('username') or request.remote_addr
+
+
+def init_app(app):
+    gates = {name: Gate(name, *settings) for name, settings in app.config['ADMISSION_LIMITS'].items()}
+    buckets = TokenBuckets()
+
+    @app.before_request
+    def admit():
+        if request.blueprint in EXEMPT_BLUEPRINTS or request.endpoint in (None, 'static'):
+            return None
+        view = current_app.view_functions[request.endpoint]
+
+        rate_limit = getattr(view, 'rate_limit', None)
+        if rate_limit and request.method in rate_limit[1] and not prerendering():
+            bucket = rate_limit[0]
+            rate, burst = app.config['RATE_LIMITS'][bucket]
+            allowed, retry_after = buckets.take((bucket, client_key()), rate, burst)
+            if not allowed:
+                RATE_LIMITED.labels(bucket).inc()
+                return too_many_requests(retry_after)
+
+        gate = gates[getattr(view, 'route_class', 'cheap')]
+        rejected = gate.enter()
+        if rejected:
+            ADMISSION_REJECTED.labels(gate.name, rejected).inc()
+            return overloaded(gate.timeout)
+        g.admission_gate = gate
+        return None
+
+    @app.teardown_request
+    def release(error=None):
+        gate = g.pop('admission_gate', None)
+        if gate is not None:
+            gate.leave()
+
+    @app.errorhandler(exc.TimeoutError)
+    def pool_exhausted(error):
+        # Admission limits should keep us clear of pool_timeout; if not, fail fast rather than hang
+        ADMISSION_REJECTED.labels('pool', 'pool_timeout').inc()
+        return overloaded(app.config['ADMISSION_LIMITS']['heavy'][2])
@@ -0,0 +1,171 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+import tempfile
+import time
+import brotli
+import click
+from flask import current_app, url_for
+from flask.cli import with_appcontext
+
+# Bundle name -> source files under app/static, concatenated in order
+BUNDLES = {
+    'css/site.css': ['vendor/bootstrap/bootstrap.min.css', 'css/styles.css'],
+    'js/site.js': ['vendor/bootstrap/popper.min.js', 'vendor/bootstrap/bootstrap.min.js', 'js/fragments.js', 'js/includes.js'],
+}
+
+SOURCE_MAP = re.compile(r'^\s*(//|/\*)# sourceMappingURL=.*$', re.MULTILINE)
+# Strings, url() values and comments are copied or dropped whole; only the CSS between them is squeezed
+CSS_STRING = r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\''
+CSS_TOKEN = re.compile(rf'{CSS_STRING}|url\(\s*(?:{CSS_STRING}|[^)]*)\s*\)|/\*.*?\*/', re.DOTALL | re.IGNORECASE)
+CSS_SPACE = re.compile(r'\s*([{};,>])\s*')
+# Another process building at the same time may still be writing these; ones this old were abandoned
+TEMP_PREFIX = '.tmp-'
+TEMP_MAX_AGE = 3600
+
+
+def squeeze_css(css, depth):
+    # Space before ':' is a descendant combinator in selectors (`.a :valid`), so only the space after
+    # a property's ':' goes, and only inside a block
+    parts = re.split(r'([{}])', re.sub(r'\s+', ' ', css))
+    for i, part in enumerate(parts):
+        if part == '{':
+            depth += 1
+        elif part == '}':
+            depth -= 1
+        elif depth:
+            parts[i] = part.replace(': ', ':')
+    return CSS_SPACE.sub(r'\1', ''.join(parts)).replace(';}', '}'), depth
+
+
+def minify_css(css):
+    out, pending, depth, pos = [], '', 0, 0
+    for token in CSS_TOKEN.finditer(css):
+        pending += css[pos:token.start()]
+        pos = token.end()
+        if token.group().startswith('/*') and not token.group().startswith('/*!'):
+            continue
+        squeezed, depth = squeeze_css(pending, depth)
+        out += [squeezed, token.group()]
+        pending = ''
+    squeezed, _ = squeeze_css(pending + css[pos:], depth)
+    out.append(squeezed)
+    return ''.join(out).strip()
+
+
+def dist_dir(app):
+    return os.path.join(app.static_folder, 'dist')
+
+
+def manifest_path(app):
+    return os.path.join(dist_dir(app), 'manifest.json')
+
+
+def write_atomic(path, data):
+    fd, tmp = tempfile.mkstemp(prefix=TEMP_PREFIX, dir=os.path.dirname(path))
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def build(app):
+    os.makedirs(dist_dir(app), exist_ok=True)
+    manifest = {}
+    for bundle, sources in BUNDLES.items():
+        parts = []
+        for source in sources:
+            with open(os.path.join(app.static_folder, source), encoding='utf-8') as f:
+                content = SOURCE_MAP.sub('', f.read())
+            if source.endswith('.css') and '.min.' not in source:
+                content = minify_css(content)
+            parts.append(content.strip())
+        data = ('\n' if bundle.endswith('.css') else ';\n').join(parts).encode('utf-8')
+
+        stem, ext = os.path.splitext(bundle)
+        filename = f'{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+        path = os.path.join(dist_dir(app), filename)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_atomic(path, data)
+        write_atomic(path + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+        write_atomic(path + '.br', brotli.compress(data, quality=11))
+        manifest[bundle] = filename
+
+    previous = load_manifest(app)
+    write_atomic(manifest_path(app), json.dumps(manifest, indent=2).encode('utf-8'))
+    prune(app, set(manifest.values()) | set(previous.values()))
+    app.extensions['asset_manifest'] = manifest
+    return manifest
+
+
+def prune(app, keep):
+    # Keep the previous build as well so pages rendered by old workers during a deploy still load
+    for dirpath, _, filenames in os.walk(dist_dir(app)):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            name = os.path.relpath(path, dist_dir(app)).replace(os.sep, '/')
+            if name == 'manifest.json':
+                continue
+            try:
+                if filename.startswith(TEMP_PREFIX):
+                    if time.time() - os.path.getmtime(path) > TEMP_MAX_AGE:
+                        os.remove(path)
+                elif re.sub(r'\.(gz|br)$', '', name) not in keep:
+                    os.remove(path)
+            except FileNotFoundError:
+                # Renamed into place or pruned by a concurrent build
+                pass
+
+
+def is_bundle_file(filename):
+    # A fingerprinted build of a known bundle, from this build or an earlier one another worker still links to
+    for bundle in BUNDLES:
+        stem, ext = os.path.splitext(bundle)
+        if re.fullmatch(rf'{re.escape(stem)}\.[0-9a-f]{{12}}{re.escape(ext)}', filename):
+            return True
+    return False
+
+
+def load_manifest(app):
+    try:
+        with open(manifest_path(app), encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def is_stale(app, manifest):
+    if set(manifest) != set(BUNDLES):
+        return True
+    built = os.path.getmtime(manifest_path(app))
+    return any(os.path.getmtime(os.path.join(app.static_folder, source)) > built
+               for sources in BUNDLES.values() for source in sources)
+
+
+def asset_url(filename):
+    manifest = current_app.extensions['asset_manifest']
+    if filename in manifest:
+        return url_for('assets.asset', filename=manifest[filename])
+    return url_for('static', filename=filename)
+
+
+@click.group('assets')
+def assets_cli():
+    """Build the fingerprinted CSS/JS bundles."""
+
+
+@assets_cli.command('build')
+@with_appcontext
+def build_command():
+    for bundle, filename in build(current_app).items():
+        click.echo(f'{bundle} -> {filename}')
+
+
+def init_app(app):
+    manifest = load_manifest(app)
+    if not manifest or (app.debug and is_stale(app, manifest)):
+        manifest = build(app)
+    app.extensions['asset_manifest'] = manifest
+    app.jinja_env.globals['asset_url'] = asset_url
+    app.cli.add_command(assets_cli)
@@ -0,0 +1,155 @@
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app, g, has_request_context, render_template, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app.extensions import db
+from app.metrics import STATEMENT_TIMEOUTS
+
+SELECT_STATEMENT = re.compile(r'^\s*SELECT\b', re.IGNORECASE)
+# ER_QUERY_TIMEOUT: "maximum statement execution time exceeded"
+MYSQL_QUERY_TIMEOUT = 3024
+
+
+class StatementTimeout(Exception):
+    pass
+
+
+class StaleResults:
+    # Last good result per statement key, bounded by total rows, served when a later run times out
+    def __init__(self, max_rows):
+        self.max_rows = max_rows
+        self.entries = OrderedDict()
+        self.rows = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            rows = self.entries.get(key)
+            if rows is not None:
+                self.entries.move_to_end(key)
+            return rows
+
+    def put(self, key, rows):
+        size = len(rows) + 1
+        if size > self.max_rows:
+            return
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.rows -= len(previous) + 1
+            self.entries[key] = rows
+            self.rows += size
+            while self.rows > self.max_rows:
+                _, evicted = self.entries.popitem(last=False)
+                self.rows -= len(evicted) + 1
+
+
+def remaining():
+    # Seconds left in this request's statement budget, or None when it has none
+    if not has_request_context():
+        return None
+    deadline = g.get('statement_deadline')
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def check_budget(sql):
+    # Raised before the statement reaches a connection, so no cursor or query timer is left half set up
+    left = remaining()
+    if left is not None and left <= 0 and SELECT_STATEMENT.match(sql):
+        raise StatementTimeout('Statement budget already spent')
+
+
+def with_stale_fallback(key, compute):
+    stale = current_app.extensions['stale_results']
+    try:
+        rows = compute()
+    except StatementTimeout:
+        rows = stale.get(key)
+        if rows is None:
+            raise
+        current_app.logger.warning('Statement budget exceeded on %s, serving a stale result', request.endpoint)
+        STATEMENT_TIMEOUTS.labels(request.endpoint, 'stale').inc()
+        g.served_stale = True
+        return rows
+    stale.put(key, rows)
+    return rows
+
+
+def route_budget(app, endpoint):
+    budgets = app.config['STATEMENT_BUDGETS']
+    if endpoint in budgets:
+        return budgets[endpoint]
+    view = app.view_functions.get(endpoint)
+    return budgets.get(getattr(view, 'route_class', 'cheap'))
+
+
+@event.listens_for(Engine, 'before_cursor_execute', retval=True)
+def enforce_budget(conn, cursor, statement, parameters, context, executemany):
+    # Only reads are cut short; a write is never interrupted halfway through a transaction
+    left = remaining()
+    budgeted = left is not None and conn.get_execution_options().get('statement_budget', True)
+    if not budgeted or not SELECT_STATEMENT.match(statement):
+        return statement, parameters
+    # Never raise here: this runs outside SQLAlchemy's error handling. A spent budget becomes the shortest
+    # limit the database accepts, and its timeout comes back through translate_timeout
+    left = max(left, 0)
+    dialect = conn.dialect.name
+    if dialect == 'mysql':
+        statement = SELECT_STATEMENT.sub(f'SELECT /*+ MAX_EXECUTION_TIME({max(1, int(left * 1000))}) */',
+                                         statement, count=1)
+    elif dialect == 'sqlite':
+        deadline = time.monotonic() + left
+        conn.connection.dbapi_connection.set_progress_handler(lambda: time.monotonic() > deadline, 10000)
+    return statement, parameters
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def clear_progress_handler(conn, cursor, statement, parameters, context, executemany):
+    if conn.dialect.name == 'sqlite' and remaining() is not None:
+        conn.connection.dbapi_connection.set_progress_handler(None, 0)
+
+
+@event.listens_for(Engine, 'handle_error')
+def translate_timeout(context):
+    error = context.original_exception
+    if context.dialect.name == 'sqlite' and isinstance(error, sqlite3.OperationalError):
+        if remaining() is None:
+            return
+        context.connection.connection.dbapi_connection.set_progress_handler(None, 0)
+        if str(error) == 'interrupted':
+            return StatementTimeout(str(error))
+    elif getattr(error, 'args', None) and error.args[0] == MYSQL_QUERY_TIMEOUT:
+        return StatementTimeout(str(error))
+
+
+def init_app(app):
+    app.extensions['stale_results'] = StaleResults(app.config['STALE_RESULTS_MAX_ROWS'])
+
+    @app.before_request
+    def start_budget():
+        if request.endpoint is None:
+            return
+        budget = route_budget(app, request.endpoint)
+        if budget:
+            g.statement_deadline = time.monotonic() + budget
+
+    @app.after_request
+    def mark_stale(response):
+        if g.get('served_stale'):
+            response.headers['Warning'] = '110 - "Response is Stale"'
+            response.headers['Cache-Control'] = 'no-store'
+        return response
+
+    @app.errorhandler(StatementTimeout)
+    def degraded(error):
+        db.session.rollback()
+        current_app.logger.warning('Statement budget exceeded on %s with no stale result: %s',
+                                   request.endpoint, error)
+        STATEMENT_TIMEOUTS.labels(request.endpoint, 'degraded').inc()
+        response = current_app.make_response((render_template('degraded.html'), 503))
+        response.headers['Retry-After'] = '30'
+        return response
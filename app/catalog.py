@@ -0,0 +1,19 @@
+import numpy as np
+
+FACET_TYPES = ['genre', 'setting', 'gameplay', 'interface', 'perspective', 'visual', 'art', 'narrative', 'pacing']
+
+
+def facet_tables(facet_type):
+    # e.g. 'genre' -> ('Genre', 'GameGenre'); the link table's value column is named after the facet table
+    table_name = facet_type.title()
+    return table_name, 'Game' + table_name
+
+
+def descending_rank(values):
+    # Rank docs by value DESC with NULLs last, then by name (docs are numbered in name order)
+    missing = np.array([value is None for value in values], dtype=bool)
+    keys = np.array([0.0 if value is None else -float(value) for value in values])
+    order = np.lexsort((np.arange(len(values)), keys, missing))
+    rank = np.empty(len(values), dtype=np.int64)
+    rank[order] = np.arange(len(values))
+    return rank
@@ -0,0 +1,113 @@
+import time
+import click
+from flask.cli import AppGroup
+from sqlalchemy import text
+from app.extensions import db
+
+# (table, ID column of its source table, recompute one entity, recompute an ID range)
+COUNTERS = (
+    ('DirectorCounts', 'Director', """
+        DELETE FROM DirectorCounts WHERE DirectorID = {id};
+        INSERT INTO DirectorCounts (DirectorID, `Name`, Games)
+        SELECT d.ID, COALESCE(d.`Name`, ''), COUNT(*)
+        FROM Director d INNER JOIN GameDirectors gd ON gd.DirectorID = d.ID
+        WHERE d.ID = {id}
+        GROUP BY d.ID, d.`Name`;
+    """, """
+        INSERT INTO DirectorCounts (DirectorID, `Name`, Games)
+        SELECT d.ID, COALESCE(d.`Name`, ''), COUNT(*)
+        FROM Director d INNER JOIN GameDirectors gd ON gd.DirectorID = d.ID
+        WHERE d.ID BETWEEN :lo AND :hi
+        GROUP BY d.ID, d.`Name`
+    """),
+    ('CompanyCounts', 'Company', """
+        DELETE FROM CompanyCounts WHERE CompanyID = {id};
+        INSERT INTO CompanyCounts (CompanyID, `Name`, Developed, Published)
+        SELECT c.ID, COALESCE(c.`Name`, ''),
+            (SELECT COUNT(DISTINCT GameID) FROM CompanyDevelopGame WHERE CompanyID = c.ID),
+            (SELECT COUNT(DISTINCT GameID) FROM CompanyPublishGame WHERE CompanyID = c.ID)
+        FROM Company c
+        WHERE c.ID = {id};
+    """, """
+        INSERT INTO CompanyCounts (CompanyID, `Name`, Developed, Published)
+        SELECT c.ID, COALESCE(c.`Name`, ''),
+            (SELECT COUNT(DISTINCT GameID) FROM CompanyDevelopGame WHERE CompanyID = c.ID),
+            (SELECT COUNT(DISTINCT GameID) FROM CompanyPublishGame WHERE CompanyID = c.ID)
+        FROM Company c
+        WHERE c.ID BETWEEN :lo AND :hi
+    """),
+)
+KEY_COLUMNS = {'DirectorCounts': 'DirectorID', 'CompanyCounts': 'CompanyID'}
+# (table whose rows change a counter, column holding the entity ID, counter table)
+SOURCES = (
+    ('Director', 'ID', 'DirectorCounts'),
+    ('GameDirectors', 'DirectorID', 'DirectorCounts'),
+    ('Company', 'ID', 'CompanyCounts'),
+    ('CompanyDevelopGame', 'CompanyID', 'CompanyCounts'),
+    ('CompanyPublishGame', 'CompanyID', 'CompanyCounts'),
+)
+
+
+def triggers():
+    bodies = {table: body for table, _, body, _ in COUNTERS}
+    for source, column, counter in SOURCES:
+        body = bodies[counter]
+        yield f'{source}_counts_insert', f"""
+            CREATE TRIGGER {source}_counts_insert AFTER INSERT ON {source}
+            FOR EACH ROW BEGIN {body.format(id=f'NEW.{column}')} END
+        """
+        # Renames and moved links change the row the entity had before as well as the one it has now
+        yield f'{source}_counts_update', f"""
+            CREATE TRIGGER {source}_counts_update AFTER UPDATE ON {source}
+            FOR EACH ROW BEGIN
+                {body.format(id=f'OLD.{column}')}
+                IF OLD.{column} <> NEW.{column} THEN
+                    {body.format(id=f'NEW.{column}')}
+                END IF;
+            END
+        """
+        yield f'{source}_counts_delete', f"""
+            CREATE TRIGGER {source}_counts_delete AFTER DELETE ON {source}
+            FOR EACH ROW BEGIN {body.format(id=f'OLD.{column}')} END
+        """
+
+
+entity_counts_cli = AppGroup('entity-counts', help='Maintain the DirectorCounts and CompanyCounts tables.')
+
+
+@entity_counts_cli.command('rebuild')
+@click.option('--chunk-size', default=10000, show_default=True, help='Entity IDs recomputed per transaction.')
+def rebuild_command(chunk_size):
+    """Recompute every director's and company's game counts."""
+    start = time.perf_counter()
+    for table, source, _, insert_sql in COUNTERS:
+        with db.engine.connect() as connection:
+            lo, hi = connection.execute(text(f"SELECT MIN(ID), MAX(ID) FROM {source}")).first()
+        if lo is None:
+            continue
+        key = KEY_COLUMNS[table]
+        for chunk_lo in range(lo, hi + 1, chunk_size):
+            with db.engine.begin() as connection:
+                params = {'lo': chunk_lo, 'hi': chunk_lo + chunk_size - 1}
+                connection.execute(text(f"DELETE FROM {table} WHERE {key} BETWEEN :lo AND :hi"), params)
+                connection.execute(text(insert_sql), params)
+        with db.engine.connect() as connection:
+            rows = connection.execute(text(f"SELECT COUNT(*) FROM {table}")).scalar()
+        click.echo(f'{table}: {rows} rows')
+    click.echo(f'Rebuilt entity counts in {time.perf_counter() - start:.1f}s')
+
+
+@entity_counts_cli.command('install-triggers')
+def install_triggers_command():
+    """Keep DirectorCounts and CompanyCounts current from triggers on their source tables (MySQL)."""
+    installed = 0
+    with db.engine.begin() as connection:
+        for name, sql in triggers():
+            connection.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+            connection.execute(text(sql))
+            installed += 1
+    click.echo(f'Installed {installed} triggers')
+
+
+def init_app(app):
+    app.cli.add_command(entity_counts_cli)
@@ -0,0 +1,107 @@
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app, g
+from app.extensions import db
+from app.metrics import record_cache
+from app.singleflight import coalesce
+
+VERSION_SQL = "SELECT Version FROM DocumentVersions WHERE Kind = :kind AND EntityKey = :key"
+
+# Every document a rating on :game_id changes: the game, its directors and companies, and the rated platforms
+AFFECTED_SQL = """
+    SELECT 'game' AS Kind, CAST(:game_id AS CHAR) AS EntityKey FROM Game WHERE ID = :game_id
+    UNION SELECT 'director', CAST(DirectorID AS CHAR) FROM GameDirectors WHERE GameID = :game_id
+    UNION SELECT 'company', CAST(CompanyID AS CHAR) FROM CompanyDevelopGame WHERE GameID = :game_id
+    UNION SELECT 'company', CAST(CompanyID AS CHAR) FROM CompanyPublishGame WHERE GameID = :game_id
+    UNION SELECT 'platform', PlatformName FROM GamesPlatform WHERE GameID = :game_id AND PlatformName IN :platforms
+"""
+BUMP_SQL = {
+    'mysql': """
+        INSERT INTO DocumentVersions (Kind, EntityKey, Version)
+        SELECT Kind, EntityKey, 1 FROM ({affected}) affected
+        ON DUPLICATE KEY UPDATE Version = Version + 1
+    """,
+    'sqlite': """
+        INSERT INTO DocumentVersions (Kind, EntityKey, Version)
+        SELECT Kind, EntityKey, 1 FROM ({affected}) affected WHERE true
+        ON CONFLICT (Kind, EntityKey) DO UPDATE SET Version = Version + 1
+    """,
+}
+
+
+class DocumentCache:
+    # LRU over assembled documents, bounded by the number of rows they hold rather than by entry count,
+    # since one company document can list thousands of games
+    def __init__(self, max_rows, max_age):
+        self.max_rows = max_rows
+        self.max_age = max_age
+        self.entries = OrderedDict()
+        self.rows = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, version):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            stored_version, document, size, stored_at = entry
+            if stored_version != version or time.monotonic() - stored_at > self.max_age:
+                return None
+            self.entries.move_to_end(key)
+            return document
+
+    def put(self, key, version, document):
+        # One entry per entity: a newer version replaces the old one, a slow build of an older one is dropped
+        size = document_rows(document)
+        if size > self.max_rows:
+            return
+        with self.lock:
+            previous = self.entries.get(key)
+            if previous is not None:
+                if previous[0] > version:
+                    return
+                del self.entries[key]
+                self.rows -= previous[2]
+            self.entries[key] = (version, document, size, time.monotonic())
+            self.rows += size
+            while self.rows > self.max_rows:
+                _, evicted = self.entries.popitem(last=False)
+                self.rows -= evicted[2]
+
+
+def document_rows(document):
+    return 1 + sum(len(value) for value in document.values() if isinstance(value, (list, tuple)))
+
+
+def version(kind, key):
+    # Read from the same session as the document so a replica never pairs a new version with old rows
+    return db.session.execute(db.text(VERSION_SQL), {'kind': kind, 'key': str(key)}).scalar() or 0
+
+
+def cached_document(kind, key, build):
+    # build() returns a dict of entity-level data, or None if the entity does not exist (never cached)
+    cache_key = (kind, str(key))
+    current = version(kind, key)
+    cache = current_app.extensions['documents']
+    document = cache.get(cache_key, current)
+    record_cache(f'{kind}_document', document is not None)
+    if document is None:
+        document = coalesce(f'document|{kind}|{key}|{current}', build)
+        # A document assembled from stale fallbacks is served once but never cached
+        if document is not None and not g.get('served_stale'):
+            cache.put(cache_key, current, document)
+    return document
+
+
+def invalidate_rating(game_id, platforms, connection=None):
+    # Runs inside the rating transaction, so the new versions commit together with the new totals
+    dialect = db.engine.dialect.name
+    sql = db.text(BUMP_SQL[dialect].format(affected=AFFECTED_SQL)).bindparams(
+        db.bindparam('platforms', expanding=True))
+    (connection or db.session).execute(sql, {'game_id': game_id, 'platforms': sorted(set(platforms))})
+
+
+def init_app(app):
+    app.extensions['documents'] = DocumentCache(app.config['DOCUMENT_CACHE_MAX_ROWS'],
+                                                app.config['DOCUMENT_CACHE_MAX_AGE'])
@@ -0,0 +1,111 @@
+import csv
+import io
+import json
+import time
+from decimal import Decimal
+import click
+import pyarrow as pa
+import pyarrow.parquet as pq
+from flask.cli import with_appcontext
+from sqlalchemy import text
+from app.extensions import db
+
+USER_RATINGS_SQL = """
+    SELECT ur.GameID, g.`Name`, ur.PlatformName, ur.Rating
+    FROM UserRatings ur INNER JOIN Game g
+    ON ur.GameID = g.ID
+    WHERE ur.Username = :username
+    ORDER BY ur.GameID
+"""
+USER_RATINGS_COLUMNS = ['game_id', 'name', 'platform', 'rating']
+
+DATASET_SQL = """
+    SELECT ur.Username, ur.GameID, ur.PlatformName, ur.Rating,
+        gp.DateOfRelease, gp.BusinessModel, gp.MaturityRating, gp.Price,
+        gp.AvgCriticRatingPercentage, gp.TotalPlayerRating, gp.NumPlayersRated
+    FROM UserRatings ur INNER JOIN GamesPlatform gp
+    ON ur.GameID = gp.GameID AND ur.PlatformName = gp.PlatformName
+"""
+DATASET_SCHEMA = pa.schema([
+    ('username', pa.string()),
+    ('game_id', pa.int64()),
+    ('platform', pa.string()),
+    ('rating', pa.float64()),
+    ('date_of_release', pa.date32()),
+    ('business_model', pa.string()),
+    ('maturity_rating', pa.string()),
+    ('price', pa.float64()),
+    ('avg_critic_rating_percentage', pa.float64()),
+    ('total_player_rating', pa.float64()),
+    ('num_players_rated', pa.int64()),
+])
+
+
+def plain(value):
+    return float(value) if isinstance(value, Decimal) else value
+
+
+def user_rating_rows(username, batch_size):
+    # Server-side cursor: rows arrive in batches instead of being buffered in full by the driver
+    result = db.session.execute(db.text(USER_RATINGS_SQL), {'username': username},
+                                execution_options={'stream_results': True, 'yield_per': batch_size})
+    for row in result:
+        yield [plain(value) for value in row]
+
+
+def csv_lines(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(USER_RATINGS_COLUMNS)
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() > 8192:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def json_lines(rows):
+    yield '['
+    separator = '\n'
+    for row in rows:
+        yield separator + json.dumps(dict(zip(USER_RATINGS_COLUMNS, row)))
+        separator = ',\n'
+    yield '\n]\n'
+
+
+def dataset_batches(connection, chunk_size):
+    result = connection.execution_options(stream_results=True, yield_per=chunk_size).execute(text(DATASET_SQL))
+    for rows in result.partitions(chunk_size):
+        columns = list(zip(*rows))
+        arrays = [pa.array([plain(value) for value in column], type=field.type)
+                  for column, field in zip(columns, DATASET_SCHEMA)]
+        yield pa.RecordBatch.from_arrays(arrays, schema=DATASET_SCHEMA)
+
+
+@click.command('export-ratings')
+@click.argument('output', type=click.Path(dir_okay=False, writable=True))
+@click.option('--chunk-size', default=50000, show_default=True, help='Rows fetched and written per batch.')
+@click.option('--bind', default=None, help='Bind key to read from, e.g. replica_0. Defaults to the primary.')
+@with_appcontext
+def export_ratings_command(output, chunk_size, bind):
+    """Dump UserRatings joined with GamesPlatform to Parquet (.parquet) or Arrow IPC (.arrow)."""
+    engine = db.engines[bind]
+    start = time.perf_counter()
+    rows = 0
+    with engine.connect() as connection:
+        if output.endswith('.arrow'):
+            writer = pa.ipc.new_file(output, DATASET_SCHEMA)
+        else:
+            writer = pq.ParquetWriter(output, DATASET_SCHEMA, compression='zstd')
+        with writer:
+            for batch in dataset_batches(connection, chunk_size):
+                writer.write_batch(batch)
+                rows += batch.num_rows
+    elapsed = time.perf_counter() - start
+    click.echo(f'Wrote {rows} rows to {output} in {elapsed:.1f}s ({rows / max(elapsed, 1e-9):.0f} rows/s)')
+
+
+def init_app(app):
+    app.cli.add_command(export_ratings_command)
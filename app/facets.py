@@ -0,0 +1,212 @@
+import threading
+import time
+import numpy as np
+from flask import current_app
+from pyroaring import BitMap, FrozenBitMap
+from sqlalchemy import text
+from app.catalog import FACET_TYPES, descending_rank, facet_tables
+from app.extensions import db
+from app.releases import RELEASE_YEARS_SQL
+from app.routing import choose_replica, read_engine
+from app.singleflight import coalesce
+from app.snapshot import catalog_snapshot
+
+GAMES_SQL = "SELECT ID, `Name`, MobyScore FROM Game"
+GAME_STATS_SQL = """
+    SELECT GameID,
+        AVG(AvgCriticRatingPercentage) AS AvgCritic,
+        SUM(TotalPlayerRating) / NULLIF(SUM(NumPlayersRated), 0) AS AvgUser
+    FROM GamesPlatform
+    GROUP BY GameID
+"""
+PLATFORMS_SQL = "SELECT DISTINCT GameID, PlatformName FROM GamesPlatform"
+PAGE_SQL = db.text("SELECT ID, CoverPhoto, `Name`, MobyScore FROM Game WHERE ID IN :ids").bindparams(
+    db.bindparam('ids', expanding=True))
+
+FILTERS = FACET_TYPES + ['platform']
+ORDERS = ('None', 'MobyScore', 'CriticRating', 'UserRating')
+
+
+def facet_label(facet_type):
+    return 'Platform' if facet_type == 'platform' else facet_tables(facet_type)[0]
+
+
+class FacetIndex:
+    # Games are numbered 0..n-1 in name order ("docs"), so the default listing is a slice of a bitmap.
+    # Each facet value, platform and release year maps to the FrozenBitMap of docs carrying it.
+    def __init__(self, game_ids, by_id, ranks, version=None):
+        self.game_ids = game_ids
+        self.by_id = by_id
+        self.all = FrozenBitMap(range(len(game_ids)))
+        self.ranks = ranks
+        self.years = {}
+        self.values = {}
+        self.version = version
+        self.built_at = time.time()
+
+    @classmethod
+    def from_connection(cls, connection):
+        games = sorted(connection.execute(text(GAMES_SQL)).fetchall(),
+                       key=lambda game: ((game.Name or '').casefold(), game.ID))
+        game_ids = np.array([game.ID for game in games], dtype=np.int64)
+        stats = {row.GameID: row for row in connection.execute(text(GAME_STATS_SQL))}
+        game_stats = [stats.get(game.ID) for game in games]
+        index = cls(game_ids, np.argsort(game_ids), {
+            'MobyScore': descending_rank([game.MobyScore for game in games]),
+            'CriticRating': descending_rank([row.AvgCritic if row else None for row in game_stats]),
+            'UserRating': descending_rank([row.AvgUser if row else None for row in game_stats]),
+        })
+
+        years = {}
+        for game_id, year in connection.execute(text(RELEASE_YEARS_SQL)):
+            years.setdefault(year, []).append(game_id)
+        index.years = {year: FrozenBitMap(index.docs(ids)) for year, ids in sorted(years.items())}
+
+        for facet_type in FILTERS:
+            if facet_type == 'platform':
+                sql = PLATFORMS_SQL
+            else:
+                table_name, game_table = facet_tables(facet_type)
+                sql = f"SELECT GameID, `{table_name}` FROM {game_table}"
+            postings = {}
+            for game_id, value in connection.execute(text(sql)):
+                postings.setdefault(value, []).append(game_id)
+            index.values[facet_type] = {value: FrozenBitMap(index.docs(ids))
+                                        for value, ids in sorted(postings.items(), key=lambda item: str(item[0]))}
+        return index
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        # Arrays stay memory-mapped and shared; only the bitmaps are deserialized into this worker
+        index = cls(snapshot.array('games.ID'), snapshot.array('games.by_id'),
+                    {order: snapshot.array(f'games.rank.{order}') for order in ORDERS[1:]}, snapshot.version)
+        years = snapshot.postings('year')
+        index.years = dict(sorted((years.key(i), years.bitmap(i)) for i in range(len(years))))
+        for facet_type in FILTERS:
+            postings = snapshot.postings(facet_type)
+            index.values[facet_type] = {postings.key(i): postings.bitmap(i) for i in range(len(postings))}
+        return index
+
+    def docs(self, game_ids):
+        game_ids = np.asarray(game_ids, dtype=np.int64)
+        sorted_ids = self.game_ids[self.by_id]
+        positions = np.searchsorted(sorted_ids, game_ids)
+        known = positions < len(sorted_ids)
+        known[known] = sorted_ids[positions[known]] == game_ids[known]
+        return self.by_id[positions[known]].tolist()
+
+    def constraints(self, selected, year_from, year_to):
+        # OR within a facet, AND across facets
+        constraints = {}
+        for facet_type, values in selected.items():
+            bitmaps = [self.values[facet_type][value] for value in values if value in self.values[facet_type]]
+            constraints[facet_type] = BitMap.union(*bitmaps) if bitmaps else BitMap()
+        if year_from is not None or year_to is not None:
+            bitmaps = [docs for year, docs in self.years.items()
+                       if (year_from is None or year >= year_from) and (year_to is None or year <= year_to)]
+            constraints['year'] = BitMap.union(*bitmaps) if bitmaps else BitMap()
+        return constraints
+
+    def search(self, selected, year_from=None, year_to=None, with_counts=True):
+        constraints = self.constraints(selected, year_from, year_to)
+
+        def matching(skip=None):
+            bitmaps = [docs for facet_type, docs in constraints.items() if facet_type != skip]
+            if not bitmaps:
+                return self.all
+            return BitMap.intersection(*sorted(bitmaps, key=len))
+
+        matches = matching()
+        if not with_counts:
+            return matches, None
+        # Counts for one facet ignore that facet's own selection, so sibling options stay reachable
+        counts = {}
+        for facet_type in FILTERS:
+            base = matching(facet_type) if facet_type in constraints else matches
+            counts[facet_type] = [(value, base.intersection_cardinality(docs))
+                                  for value, docs in self.values[facet_type].items()]
+        base = matching('year') if 'year' in constraints else matches
+        counts['year'] = [(year, base.intersection_cardinality(docs)) for year, docs in self.years.items()]
+        return matches, counts
+
+    def page(self, matches, order_by, offset, limit):
+        if order_by not in self.ranks:
+            docs = np.array(list(matches[offset:offset + limit]), dtype=np.int64)
+        else:
+            docs = np.frombuffer(matches.to_array(), dtype=np.uint32).astype(np.int64)
+            ranks = self.ranks[order_by][docs]
+            end = min(offset + limit, len(docs))
+            if end < len(docs):
+                keep = np.argpartition(ranks, end - 1)[:end]
+                docs, ranks = docs[keep], ranks[keep]
+            docs = docs[np.argsort(ranks)][offset:end]
+        return self.game_ids[docs].tolist()
+
+
+class FacetIndexHolder:
+    def __init__(self, app):
+        self.app = app
+        self.index = None
+        self.lock = threading.Lock()
+        self.refreshing = False
+
+    def build(self):
+        # Coalesced so workers starting cold together build the index once between them
+        def compute():
+            # Exempt from the statement budget of whichever request happens to trigger the build
+            with (read_engine() or db.engines[choose_replica()]).connect() as connection:
+                start = time.perf_counter()
+                index = FacetIndex.from_connection(connection.execution_options(statement_budget=False))
+            self.app.logger.info('Built facet index over %d games in %.2fs',
+                                 len(index.game_ids), time.perf_counter() - start)
+            return index
+
+        with self.app.app_context():
+            return coalesce('facet-index', compute)
+
+    def refresh(self):
+        try:
+            self.index = self.build()
+        except Exception:
+            self.app.logger.exception('Facet index refresh failed, keeping the previous one')
+        finally:
+            self.refreshing = False
+
+    def get(self):
+        # With a catalog snapshot the index follows its version; without one, the first request builds
+        # the index from the database and later ones serve it while a thread rebuilds it
+        snapshot = catalog_snapshot()
+        if snapshot is not None:
+            if self.index is None or self.index.version != snapshot.version:
+                with self.lock:
+                    if self.index is None or self.index.version != snapshot.version:
+                        self.index = FacetIndex.from_snapshot(snapshot)
+            return self.index
+        if self.index is None:
+            with self.lock:
+                if self.index is None:
+                    self.index = self.build()
+        elif time.time() - self.index.built_at > self.app.config['FACET_INDEX_TTL']:
+            with self.lock:
+                if not self.refreshing:
+                    self.refreshing = True
+                    threading.Thread(target=self.refresh, daemon=True).start()
+        return self.index
+
+
+def facet_index():
+    return current_app.extensions['facet_index'].get()
+
+
+def page_games(game_ids):
+    if not game_ids:
+        return []
+    snapshot = catalog_snapshot()
+    if snapshot is not None:
+        return snapshot.game_rows(game_ids)
+    games = {game.ID: game for game in db.session.execute(PAGE_SQL, {'ids': game_ids})}
+    return [games[game_id] for game_id in game_ids if game_id in games]
+
+
+def init_app(app):
+    app.extensions['facet_index'] = FacetIndexHolder(app)
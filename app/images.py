@@ -0,0 +1,185 @@
+import hashlib
+import io
+import os
+import tempfile
+import threading
+from urllib.parse import urlparse
+from urllib.request import Request, urlopen
+from flask import current_app, url_for
+from PIL import Image
+from app.metrics import record_cache
+
+SOURCES = {
+    'game': "SELECT CoverPhoto FROM Game WHERE ID = :id LIMIT 1",
+    'company': "SELECT Logo FROM Company WHERE ID = :id LIMIT 1",
+    'director': "SELECT ProfilePicture FROM Director WHERE ID = :id LIMIT 1",
+}
+
+FORMATS = {
+    'webp': ('WEBP', 'image/webp'),
+    'jpeg': ('JPEG', 'image/jpeg'),
+}
+
+
+class ImageError(Exception):
+    pass
+
+
+class ImageCache:
+    def __init__(self, root, max_bytes, fetch_timeout, max_source_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.fetch_timeout = fetch_timeout
+        self.max_source_bytes = max_source_bytes
+        self.lock = threading.Lock()
+        self.size = None
+
+    def variant(self, source, width, fmt):
+        digest = self.original(source)
+        name = f'{digest}-{width}.{fmt}'
+        path = os.path.join(self.root, 'variants', name[:2], name)
+        if os.path.exists(path):
+            record_cache('image_variant', True)
+            os.utime(path)
+            return path
+
+        record_cache('image_variant', False)
+        with open(self.original_path(digest), 'rb') as f:
+            data = resize(f.read(), width, fmt)
+        self.write(path, data)
+        return path
+
+    def original(self, source):
+        index_path = os.path.join(self.root, 'urls', sha256(source.encode()))
+        if os.path.exists(index_path):
+            with open(index_path) as f:
+                digest = f.read().strip()
+            if os.path.exists(self.original_path(digest)):
+                record_cache('image_original', True)
+                os.utime(self.original_path(digest))
+                return digest
+
+        record_cache('image_original', False)
+        data = self.fetch(source)
+        digest = sha256(data)
+        self.write(self.original_path(digest), data)
+        self.write(index_path, digest.encode(), counted=False)
+        return digest
+
+    def original_path(self, digest):
+        return os.path.join(self.root, 'originals', digest[:2], digest)
+
+    def fetch(self, source):
+        if urlparse(source).scheme not in ('http', 'https'):
+            raise ImageError(f'Unsupported image source {source!r}')
+        try:
+            with urlopen(Request(source, headers={'User-Agent': 'GameArchive image proxy'}),
+                         timeout=self.fetch_timeout) as response:
+                data = response.read(self.max_source_bytes + 1)
+        except OSError as e:
+            raise ImageError(f'Could not fetch {source}: {e}') from e
+        if len(data) > self.max_source_bytes:
+            raise ImageError(f'{source} is larger than {self.max_source_bytes} bytes')
+        return data
+
+    def write(self, path, data, counted=True):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+        if counted:
+            with self.lock:
+                if self.size is None:
+                    self.size = self.disk_usage()
+                self.size += len(data)
+                if self.size > self.max_bytes:
+                    self.evict()
+
+    def cached_files(self):
+        for folder in ('variants', 'originals'):
+            for dirpath, _, filenames in os.walk(os.path.join(self.root, folder)):
+                for filename in filenames:
+                    path = os.path.join(dirpath, filename)
+                    try:
+                        yield path, os.stat(path)
+                    except FileNotFoundError:
+                        pass
+
+    def disk_usage(self):
+        return sum(stat.st_size for _, stat in self.cached_files())
+
+    def evict(self):
+        # Least recently used first; hits bump mtime. Stop at 90% so we don't evict on every write
+        files = sorted(self.cached_files(), key=lambda item: item[1].st_mtime)
+        self.size = sum(stat.st_size for _, stat in files)
+        target = self.max_bytes * 0.9
+        for path, stat in files:
+            if self.size <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.size -= stat.st_size
+
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def resize(data, width, fmt):
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.load()
+    except (OSError, Image.DecompressionBombError) as e:
+        raise ImageError(f'Could not decode image: {e}') from e
+
+    if image.width > width:
+        image = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+
+    pil_format, _ = FORMATS[fmt]
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+    if pil_format == 'JPEG' and image.mode == 'RGBA':
+        # Logos are often transparent PNGs; flatten onto white rather than black
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+
+    out = io.BytesIO()
+    if pil_format == 'JPEG':
+        image.save(out, 'JPEG', quality=82, optimize=True, progressive=True)
+    else:
+        image.save(out, 'WEBP', quality=80, method=4)
+    return out.getvalue()
+
+
+def snap_width(width):
+    widths = current_app.config['IMAGE_WIDTHS']
+    for allowed in widths:
+        if width <= allowed:
+            return allowed
+    return widths[-1]
+
+
+def image_cache():
+    return current_app.extensions['image_cache']
+
+
+def img_url(kind, entity_id, source, width):
+    if not source or not current_app.config['IMAGE_PROXY']:
+        return source
+    # The source hash changes the URL when the origin image changes, so responses can be immutable
+    return url_for('images.image', kind=kind, entity_id=entity_id, w=width,
+                   v=sha256(source.encode())[:10])
+
+
+def init_app(app):
+    if not app.config.get('IMAGE_CACHE_DIR'):
+        app.config['IMAGE_CACHE_DIR'] = os.path.join(app.instance_path, 'image-cache')
+    app.extensions['image_cache'] = ImageCache(app.config['IMAGE_CACHE_DIR'],
+                                               app.config['IMAGE_CACHE_MAX_BYTES'],
+                                               app.config['IMAGE_FETCH_TIMEOUT'],
+                                               app.config['IMAGE_MAX_SOURCE_BYTES'])
+    app.jinja_env.globals['img_url'] = img_url
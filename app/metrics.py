@@ -0,0 +1,160 @@
+import os
+import time
+from flask import g, has_request_context, request
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, multiprocess
+from sqlalchemy import event, exc, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+REQUEST_LATENCY = Histogram('gamearchive_request_seconds', 'Request latency by route',
+                            ['route', 'method', 'status'])
+REQUEST_DB_TIME = Histogram('gamearchive_request_db_seconds', 'Time spent executing SQL per request by route',
+                            ['route'])
+POOL_CHECKED_OUT = Gauge('gamearchive_pool_checked_out', 'Connections currently checked out of the pool',
+                         ['bind'], multiprocess_mode='livesum')
+POOL_OVERFLOW = Gauge('gamearchive_pool_overflow', 'Overflow connections currently open beyond pool_size',
+                      ['bind'], multiprocess_mode='livesum')
+POOL_WAIT = Histogram('gamearchive_pool_wait_seconds', 'Time spent waiting to check out a pooled connection',
+                      ['bind'], buckets=(.001, .005, .01, .05, .1, .5, 1, 5, 10, 30))
+POOL_TIMEOUTS = Counter('gamearchive_pool_timeouts_total', 'Checkouts that hit pool_timeout', ['bind'])
+# hit ratio = rate(result="hit") / rate(all results) for a given cache
+CACHE_REQUESTS = Counter('gamearchive_cache_requests_total', 'Cache lookups by cache and result',
+                         ['cache', 'result'])
+
+ADMISSION_IN_FLIGHT = Gauge('gamearchive_admission_in_flight', 'Requests admitted and running by route class',
+                            ['route_class'], multiprocess_mode='livesum')
+ADMISSION_QUEUED = Gauge('gamearchive_admission_queued', 'Requests waiting for admission by route class',
+                         ['route_class'], multiprocess_mode='livesum')
+ADMISSION_WAIT = Histogram('gamearchive_admission_wait_seconds', 'Time spent queued before admission',
+                           ['route_class'], buckets=(.001, .01, .05, .1, .5, 1, 2, 5, 10))
+ADMISSION_REJECTED = Counter('gamearchive_admission_rejected_total', 'Requests turned away with 503',
+                             ['route_class', 'reason'])
+SINGLEFLIGHT_CALLS = Counter('gamearchive_singleflight_calls_total',
+                             'Coalesced queries by role: leader ran it, follower or shared reused its result', ['role'])
+STATEMENT_TIMEOUTS = Counter('gamearchive_statement_timeouts_total',
+                             'Requests that ran past their statement budget, by route and how they were answered',
+                             ['route', 'outcome'])
+STATEMENT_SECONDS = Histogram('gamearchive_statement_seconds', 'SQL execution time by registered statement name',
+                              ['statement'], buckets=(.001, .005, .01, .05, .1, .5, 1, 5, 15))
+RATE_LIMITED = Counter('gamearchive_rate_limited_total', 'Requests turned away with 429 by bucket', ['bucket'])
+
+
+class TimedQueuePool(QueuePool):
+    bind_name = 'primary'
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            POOL_TIMEOUTS.labels(self.bind_name).inc()
+            raise
+        finally:
+            POOL_WAIT.labels(self.bind_name).observe(time.perf_counter() - start)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.bind_name = self.bind_name
+        return pool
+
+
+def record_cache(cache, hit):
+    CACHE_REQUESTS.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+def registry():
+    if 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+        return REGISTRY
+    collector_registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(collector_registry)
+    return collector_registry
+
+
+def instrument_pool(app):
+    # Has to run before db.init_app, which builds the engines
+    options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    options.setdefault('poolclass', TimedQueuePool)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+
+def track_pool(engine, bind_name):
+    engine.pool.bind_name = bind_name
+
+    def update(*args):
+        pool = engine.pool
+        if isinstance(pool, QueuePool):
+            POOL_CHECKED_OUT.labels(bind_name).set(pool.checkedout())
+            POOL_OVERFLOW.labels(bind_name).set(max(pool.overflow(), 0))
+
+    event.listen(engine, 'checkout', update)
+    event.listen(engine, 'checkin', update)
+
+
+def warm_pool(app, db):
+    with app.app_context():
+        for engine in db.engines.values():
+            size = engine.pool.size() if isinstance(engine.pool, QueuePool) else 1
+            # All held at once so the pool opens `size` distinct connections; a failed connect returns the rest
+            connections = []
+            try:
+                for _ in range(size):
+                    connections.append(engine.connect())
+                    connections[-1].execute(text('SELECT 1'))
+            finally:
+                for connection in connections:
+                    connection.close()
+    app.extensions['pool_warm'] = True
+
+
+def warm_worker(app):
+    # Called from gunicorn's post_worker_init: CLI commands, snapshot builds and prerender workers also
+    # create the app and must not each open a full pool per bind
+    if not app.config.get('POOL_WARMUP'):
+        return
+    try:
+        warm_pool(app, app.extensions['sqlalchemy'])
+    except exc.SQLAlchemyError:
+        app.logger.exception('Connection pool warm-up failed; /readyz will retry')
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_start'].pop()
+    # Statements from app.statements carry their registry name; anything else is pooled under 'other'
+    name = context.execution_options.get('statement_name', 'other') if context is not None else 'other'
+    STATEMENT_SECONDS.labels(name).observe(elapsed)
+    if has_request_context():
+        g.db_time = g.get('db_time', 0) + elapsed
+
+
+@event.listens_for(Engine, 'handle_error')
+def _drop_query_timer(context):
+    # after_cursor_execute never runs for a failed statement
+    connection = context.connection
+    if connection is not None and not connection.closed and connection.info.get('query_start'):
+        connection.info['query_start'].pop()
+
+
+def init_app(app, db):
+    with app.app_context():
+        for key, engine in db.engines.items():
+            track_pool(engine, key or 'primary')
+
+    @app.before_request
+    def start_timer():
+        g.request_start = time.perf_counter()
+        g.db_time = 0
+
+    @app.after_request
+    def observe_request(response):
+        if 'request_start' in g:
+            route = request.endpoint or 'unmatched'
+            REQUEST_LATENCY.labels(route, request.method, response.status_code).observe(
+                time.perf_counter() - g.request_start)
+            REQUEST_DB_TIME.labels(route).observe(g.db_time)
+        return response
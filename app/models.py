@@ -0,0 +1,79 @@
+from app.extensions import db
+
+# The catalog schema (Game, Company, UserRatings, ...) is managed outside the app.
+# Tables defined here are derived data owned by the app and created by db.create_all().
+
+SimilarGames = db.Table(
+    'SimilarGames',
+    db.Column('GameID', db.Integer, primary_key=True, autoincrement=False),
+    db.Column('Position', db.SmallInteger, primary_key=True, autoincrement=False),
+    db.Column('SimilarGameID', db.Integer, nullable=False),
+    db.Column('Score', db.Float, nullable=False),
+)
+
+# First release per game, so year filters seek an index instead of grouping GamesPlatform
+GameFirstRelease = db.Table(
+    'GameFirstRelease',
+    db.Column('GameID', db.Integer, primary_key=True, autoincrement=False),
+    db.Column('FirstRelease', db.Date, nullable=False),
+    db.Column('ReleaseYear', db.SmallInteger, nullable=False),
+    db.Index('ix_GameFirstRelease_ReleaseYear', 'ReleaseYear', 'GameID'),
+)
+
+# Games per director and per company, with the name copied in so listings page through one index in either
+# order. Kept current by `flask entity-counts install-triggers` (MySQL); directors without games have no row.
+DirectorCounts = db.Table(
+    'DirectorCounts',
+    db.Column('DirectorID', db.Integer, primary_key=True, autoincrement=False),
+    db.Column('Name', db.String(255), nullable=False),
+    db.Column('Games', db.Integer, nullable=False),
+    db.Index('ix_DirectorCounts_Name', 'Name', 'DirectorID'),
+    db.Index('ix_DirectorCounts_Games', 'Games', 'DirectorID'),
+)
+
+CompanyCounts = db.Table(
+    'CompanyCounts',
+    db.Column('CompanyID', db.Integer, primary_key=True, autoincrement=False),
+    db.Column('Name', db.String(255), nullable=False),
+    db.Column('Developed', db.Integer, nullable=False),
+    db.Column('Published', db.Integer, nullable=False),
+    db.Index('ix_CompanyCounts_Name', 'Name', 'CompanyID'),
+    db.Index('ix_CompanyCounts_Developed', 'Developed', 'CompanyID'),
+    db.Index('ix_CompanyCounts_Published', 'Published', 'CompanyID'),
+)
+
+# Critic and player rating sums over every release of a director's, developer's, publisher's, platform's or facet
+# value's games, so detail pages divide two numbers instead of aggregating the joins. Rating writes apply their
+# deltas in the same transaction; catalog imports need `flask rating-rollups rebuild`.
+RatingRollups = db.Table(
+    'RatingRollups',
+    db.Column('Kind', db.String(16), primary_key=True),
+    db.Column('EntityKey', db.String(255), primary_key=True),
+    db.Column('CriticSum', db.Double, nullable=False),
+    db.Column('CriticCount', db.Integer, nullable=False),
+    db.Column('PlayerTotal', db.Double, nullable=False),
+    db.Column('PlayerCount', db.Integer, nullable=False),
+)
+
+# Bumped by rating writes; cached entity documents are keyed by (Kind, EntityKey, Version)
+DocumentVersions = db.Table(
+    'DocumentVersions',
+    db.Column('Kind', db.String(16), primary_key=True),
+    db.Column('EntityKey', db.String(255), primary_key=True),
+    db.Column('Version', db.BigInteger, nullable=False),
+)
+
+# Append-only log of rating writes. On MySQL, `flask partition-rating-events` partitions it by month of CreatedAt.
+RatingEvents = db.Table(
+    'RatingEvents',
+    # SQLite only autoincrements an INTEGER primary key
+    db.Column('EventID', db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True, autoincrement=True),
+    db.Column('CreatedAt', db.DateTime, nullable=False),
+    db.Column('Username', db.String(255), nullable=False),
+    db.Column('GameID', db.Integer, nullable=False),
+    db.Column('PlatformName', db.String(255), nullable=False),
+    db.Column('Rating', db.Numeric(2, 1), nullable=False),
+    db.Column('PreviousPlatformName', db.String(255)),
+    db.Column('PreviousRating', db.Numeric(2, 1)),
+    db.Index('ix_RatingEvents_CreatedAt', 'CreatedAt'),
+)
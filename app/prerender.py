@@ -0,0 +1,164 @@
+import gzip
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import quote, unquote, urlsplit
+import click
+from flask import current_app, url_for
+from flask.cli import with_appcontext
+from sqlalchemy import text
+from app.catalog import FACET_TYPES, facet_tables
+from app.extensions import db
+from app.rendering import PRERENDER_ENVIRON
+from app.sitemaps import ENTITIES, ENTITY_SQL, PLATFORMS_SQL, write_json
+
+# Aggregate pages carry no version of their own; they follow every DocumentVersions bump
+CATALOG_VERSION_SQL = "SELECT COUNT(*) AS Entities, COALESCE(SUM(Version), 0) AS Bumps FROM DocumentVersions"
+TOP5_PAGES = ('main.top5', 'main.top5_games_by_genre', 'main.top5_games_by_setting', 'main.top5_companies_by_genre',
+              'main.top5_directors_by_volume', 'main.top5_collaborations')
+BATCH = 200
+
+worker_app = None
+
+
+def page_path(directory, url):
+    # /game/5 -> <directory>/game/5/index.html, matched by `try_files $uri/index.html` on the decoded path.
+    # Platform and facet links quote the name before url_for quotes it again, so /platform/PlayStation%25204
+    # is stored as platform/PlayStation%204
+    path = os.path.normpath(os.path.join(directory, unquote(urlsplit(url).path).lstrip('/'), 'index.html'))
+    if not path.startswith(os.path.abspath(directory) + os.sep):
+        raise ValueError(f'{url} resolves outside {directory}')
+    return path
+
+
+def write_page(path, html):
+    # Written next to a gzip copy for gzip_static, each under a temporary name and renamed
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.tmp', 'wb') as f:
+        f.write(html)
+    with gzip.open(path + '.gz.tmp', 'wb', compresslevel=9) as f:
+        f.write(html)
+    os.replace(path + '.tmp', path)
+    os.replace(path + '.gz.tmp', path + '.gz')
+
+
+def remove_page(path):
+    for name in (path, path + '.gz'):
+        try:
+            os.remove(name)
+        except FileNotFoundError:
+            pass
+
+
+def build_fingerprint(app):
+    # A deploy that changes templates or asset bundles re-renders every page
+    digest = hashlib.sha1(json.dumps(app.extensions['asset_manifest'], sort_keys=True).encode())
+    for root, dirs, files in os.walk(os.path.join(app.root_path, app.template_folder)):
+        dirs.sort()
+        for name in sorted(files):
+            with open(os.path.join(root, name), 'rb') as f:
+                digest.update(name.encode() + b'\0' + f.read())
+    return digest.hexdigest()
+
+
+def public_pages(connection, batch=10000):
+    # {url: version} for every page that looks the same to every visitor
+    pages = {}
+    for kind, table, endpoint, argument in ENTITIES:
+        after = -1
+        while True:
+            rows = connection.execute(text(ENTITY_SQL.format(table=table)),
+                                      {'kind': kind, 'after': after, 'batch': batch}).fetchall()
+            if not rows:
+                break
+            for row in rows:
+                pages[url_for(endpoint, **{argument: row.ID})] = f'{kind}:{row.Version}'
+            after = rows[-1].ID
+    for row in connection.execute(text(PLATFORMS_SQL)):
+        # Built like the templates' `name | urlencode` links and the sitemap, so the files sit where they point
+        pages[url_for('main.platform_detail', platform_name=quote(row.PlatformName))] = f'platform:{row.Version}'
+
+    catalog = connection.execute(text(CATALOG_VERSION_SQL)).first()
+    catalog_version = f'catalog:{catalog.Entities}.{catalog.Bumps}'
+    for facet_type in FACET_TYPES:
+        table_name, _ = facet_tables(facet_type)
+        for row in connection.execute(text(f"SELECT `Name` FROM {table_name}")):
+            pages[url_for('main.genre_detail', genre_type=facet_type, name=quote(row.Name))] = catalog_version
+    for endpoint in TOP5_PAGES:
+        pages[url_for(endpoint)] = catalog_version
+    return pages
+
+
+def start_worker():
+    global worker_app
+    from app import create_app
+    worker_app = create_app()
+
+
+def render_batch(directory, base_url, urls):
+    client = worker_app.test_client()
+    rendered, failed = [], []
+    for url in urls:
+        response = client.get(url, base_url=base_url, environ_base={PRERENDER_ENVIRON: True},
+                              headers={'Accept-Encoding': 'identity'})
+        # A redirect means the entity went away after the page list was read
+        if response.status_code != 200:
+            failed.append((url, response.status_code))
+            continue
+        write_page(page_path(directory, url), response.get_data())
+        rendered.append(url)
+    return rendered, failed
+
+
+@click.command('prerender-pages')
+@click.option('--full', is_flag=True, help='Re-render every page, changed or not.')
+@click.option('--jobs', default=os.cpu_count(), show_default=True, help='Rendering processes.')
+@click.option('--base-url', default=None, help='Public site URL. Defaults to SITEMAP_BASE_URL.')
+@with_appcontext
+def prerender_pages_command(full, jobs, base_url):
+    """Render entity and top 5 pages to static HTML, skipping pages whose data has not changed.
+
+    A front server serving these files answers anonymous visitors too, bypassing the login these views
+    otherwise require; only point it at PRERENDER_DIR if those pages may be public.
+    """
+    directory = os.path.abspath(current_app.config['PRERENDER_DIR'])
+    base_url = base_url or current_app.config.get('SITEMAP_BASE_URL') or 'http://localhost'
+    state_path = os.path.join(directory, 'state.json')
+    start = time.perf_counter()
+    old = {'build': None, 'pages': {}}
+    if os.path.exists(state_path):
+        with open(state_path) as f:
+            old = json.load(f)
+    fingerprint = build_fingerprint(current_app)
+    full = full or old['build'] != fingerprint
+
+    with current_app.test_request_context(base_url=base_url), db.engine.connect() as connection:
+        pages = public_pages(connection)
+    stale = [url for url, version in pages.items() if full or old['pages'].get(url) != version]
+    for url in set(old['pages']) - set(pages):
+        remove_page(page_path(directory, url))
+
+    state = {'build': fingerprint, 'pages': {url: version for url, version in old['pages'].items() if url in pages}}
+    failed = []
+    # Workers build their own app and connections rather than inherit this process's
+    db.engine.dispose()
+    with ProcessPoolExecutor(max_workers=jobs, initializer=start_worker) as pool:
+        batches = [stale[i:i + BATCH] for i in range(0, len(stale), BATCH)]
+        for rendered, batch_failed in pool.map(render_batch, [directory] * len(batches), [base_url] * len(batches),
+                                               batches):
+            state['pages'].update((url, pages[url]) for url in rendered)
+            failed.extend(batch_failed)
+    os.makedirs(directory, exist_ok=True)
+    write_json(state_path, state)
+    for url, status in failed[:20]:
+        click.echo(f'{url}: HTTP {status}', err=True)
+    click.echo(f'Rendered {len(stale) - len(failed)} of {len(pages)} pages ({len(failed)} failed) '
+               f'in {time.perf_counter() - start:.1f}s')
+
+
+def init_app(app):
+    if not app.config.get('PRERENDER_DIR'):
+        app.config['PRERENDER_DIR'] = os.path.join(app.instance_path, 'prerendered')
+    app.cli.add_command(prerender_pages_command)
@@ -0,0 +1,245 @@
+import json
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+import click
+from flask import current_app, g, request
+from flask.cli import AppGroup, with_appcontext
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+TOKEN_SALT = 'request-profile'
+MAX_DEPTH = 128
+
+
+def frame_label(code, roots):
+    filename = code.co_filename
+    for root in roots:
+        if filename.startswith(root):
+            filename = filename[len(root):]
+            break
+    return f'{code.co_name} ({filename}:{code.co_firstlineno})'
+
+
+class Profiler:
+    # A wall-clock sampler: one thread per worker reads the stack of every profiled request thread each
+    # interval, so time blocked on the database shows up under the driver frames it waits in. Requests
+    # that are not profiled cost one random() call.
+    def __init__(self, directory, interval, max_files, trace_memory):
+        self.directory = directory
+        self.interval = interval
+        self.max_files = max_files
+        self.trace_memory = trace_memory
+        self.roots = sorted({os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + os.sep}
+                            | {path + os.sep for path in sys.path if path.endswith('-packages')}
+                            | {os.path.dirname(os.__file__) + os.sep}, key=len, reverse=True)
+        self.active = {}
+        self.tracing = 0
+        self.owns_tracing = False
+        self.thread = None
+        self.written = 0
+        self.lock = threading.Lock()
+
+    def start(self):
+        ident = threading.get_ident()
+        # A request that never reached finish() left its entry behind; the thread has moved on
+        self.stop(ident)
+        profile = {'samples': Counter(), 'started': time.perf_counter(), 'at': time.time(), 'memory': None}
+        with self.lock:
+            if self.trace_memory:
+                if self.tracing == 0 and not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                    self.owns_tracing = True
+                self.tracing += 1
+                # The peak is process-wide: requests profiled concurrently share it
+                tracemalloc.reset_peak()
+                profile['memory'] = tracemalloc.get_traced_memory()[0]
+            self.active[ident] = profile
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='request-profiler', daemon=True)
+                self.thread.start()
+        return ident
+
+    def stop(self, ident):
+        with self.lock:
+            profile = self.active.pop(ident, None)
+            if profile is None:
+                return None
+            profile['seconds'] = time.perf_counter() - profile['started']
+            if profile['memory'] is not None:
+                current, peak = tracemalloc.get_traced_memory()
+                profile['memory'] = {'peak': peak - profile['memory'], 'retained': current - profile['memory']}
+                self.tracing -= 1
+                if self.tracing == 0 and self.owns_tracing:
+                    tracemalloc.stop()
+                    self.owns_tracing = False
+            return profile
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            with self.lock:
+                if not self.active:
+                    self.thread = None
+                    return
+                frames = sys._current_frames()
+                for ident, profile in self.active.items():
+                    frame = frames.get(ident)
+                    stack = []
+                    while frame is not None and len(stack) < MAX_DEPTH:
+                        stack.append(frame.f_code)
+                        frame = frame.f_back
+                    if stack:
+                        profile['samples'][tuple(reversed(stack))] += 1
+
+    def write(self, profile, details):
+        samples = Counter()
+        for stack, count in profile['samples'].items():
+            samples[';'.join(frame_label(code, self.roots) for code in stack)] += count
+        record = dict(details, at=profile['at'], seconds=profile['seconds'], interval=self.interval,
+                      memory=profile['memory'], samples=dict(samples))
+        os.makedirs(self.directory, exist_ok=True)
+        # Timestamp first, so the oldest profiles sort first when rotating
+        name = (f'{datetime.fromtimestamp(profile["at"]):%Y%m%dT%H%M%S}-{os.getpid()}-{self.written:06d}-'
+                f'{details["route"]}.json')
+        path = os.path.join(self.directory, name)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(record, f)
+        os.replace(path + '.tmp', path)
+        self.written += 1
+        profiles = sorted(name for name in os.listdir(self.directory) if name.endswith('.json'))
+        for old in profiles[:max(len(profiles) - self.max_files, 0)]:
+            try:
+                os.remove(os.path.join(self.directory, old))
+            except FileNotFoundError:
+                pass
+
+
+def token_serializer(app):
+    return URLSafeTimedSerializer(app.secret_key, salt=TOKEN_SALT)
+
+
+def wanted(app):
+    token = request.args.get('profile')
+    if token:
+        try:
+            token_serializer(app).loads(token, max_age=app.config['PROFILE_TOKEN_MAX_AGE'])
+            return True
+        except BadSignature:
+            pass
+    rate = app.config['PROFILE_SAMPLE_RATE']
+    return rate > 0 and random.random() < rate
+
+
+def load_profiles(directory, route=None, since=None):
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, name)) as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if (route is None or record['route'] == route) and (since is None or record['at'] >= since):
+            profiles.append(record)
+    return profiles
+
+
+def hot_frames(profiles):
+    # Self counts the innermost frame of each sample; total counts every frame on the stack once
+    own, total = Counter(), Counter()
+    for record in profiles:
+        for stack, count in record['samples'].items():
+            frames = stack.split(';')
+            own[frames[-1]] += count
+            for frame in set(frames):
+                total[frame] += count
+    return own, total
+
+
+profiles_cli = AppGroup('profiles', help='Sampled request profiles.')
+
+
+@profiles_cli.command('token')
+@with_appcontext
+def token_command():
+    """Print a signed value for ?profile= that profiles the request it is sent with."""
+    click.echo(token_serializer(current_app).dumps('profile'))
+    click.echo(f'Valid for {current_app.config["PROFILE_TOKEN_MAX_AGE"]}s', err=True)
+
+
+@profiles_cli.command('top')
+@click.option('--route', default=None, help='Only this endpoint, e.g. main.games.')
+@click.option('--limit', default=15, show_default=True, help='Frames to list per route.')
+@click.option('--hours', default=None, type=float, help='Only profiles from the last N hours.')
+@click.option('--sort', type=click.Choice(['self', 'total']), default='self', show_default=True)
+@with_appcontext
+def top_command(route, limit, hours, sort):
+    """Aggregate the hottest frames in the profile directory by route."""
+    since = time.time() - hours * 3600 if hours else None
+    by_route = {}
+    for record in load_profiles(current_app.config['PROFILE_DIR'], route, since):
+        by_route.setdefault(record['route'], []).append(record)
+    if not by_route:
+        click.echo('No profiles found')
+        return
+    for name, profiles in sorted(by_route.items(), key=lambda item: -sum(p['seconds'] for p in item[1])):
+        seconds = sorted(p['seconds'] for p in profiles)
+        db_time = sum(p['db_seconds'] or 0 for p in profiles) / len(profiles)
+        peaks = [p['memory']['peak'] for p in profiles if p['memory']]
+        click.echo(f'\n{name}: {len(profiles)} requests, median {seconds[len(seconds) // 2] * 1000:.0f}ms, '
+                   f'max {seconds[-1] * 1000:.0f}ms, mean SQL {db_time * 1000:.0f}ms'
+                   + (f', max peak {max(peaks) / 1024 / 1024:.1f}MB' if peaks else ''))
+        own, total = hot_frames(profiles)
+        sampled = sum(own.values())
+        if not sampled:
+            continue
+        click.echo(f'  {"self":>6} {"total":>6}  frame')
+        for frame, _ in (own if sort == 'self' else total).most_common(limit):
+            click.echo(f'  {own[frame] / sampled:6.1%} {total[frame] / sampled:6.1%}  {frame}')
+
+
+def init_app(app):
+    if not app.config.get('PROFILE_DIR'):
+        app.config['PROFILE_DIR'] = os.path.join(app.instance_path, 'profiles')
+    profiler = Profiler(app.config['PROFILE_DIR'], app.config['PROFILE_INTERVAL'],
+                        app.config['PROFILE_MAX_FILES'], app.config['PROFILE_TRACE_MEMORY'])
+    app.extensions['profiler'] = profiler
+    app.cli.add_command(profiles_cli)
+
+    @app.before_request
+    def start_profile():
+        if request.endpoint not in (None, 'static') and wanted(app):
+            g.profile_ident = profiler.start()
+
+    @app.after_request
+    def finish_profile(response):
+        if 'profile_ident' not in g:
+            return response
+        ident = g.profile_ident
+        request_g = g._get_current_object()
+        # The signed token is left out of the recorded URL
+        args = [f'{key}={value}' for key, value in request.args.items(multi=True) if key != 'profile']
+        details = {'route': request.endpoint, 'method': request.method,
+                   'path': request.path + ('?' + '&'.join(args) if args else ''), 'status': response.status_code}
+
+        # Streamed pages render while the body is sent, after this hook; the profile ends when the server
+        # closes the response
+        def finish():
+            profile = profiler.stop(ident)
+            if profile is None:
+                return
+            try:
+                profiler.write(profile, dict(details, db_seconds=request_g.get('db_time')))
+            except OSError:
+                app.logger.warning('Could not write a request profile', exc_info=True)
+
+        response.call_on_close(finish)
+        return response
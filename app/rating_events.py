@@ -0,0 +1,91 @@
+from datetime import datetime, timezone
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import text
+from app.extensions import db
+
+APPEND_SQL = """
+    INSERT INTO RatingEvents (CreatedAt, Username, GameID, PlatformName, Rating, PreviousPlatformName, PreviousRating)
+    VALUES (:created_at, :username, :game_id, :platform, :rating, :previous_platform, :previous_rating)
+"""
+PARTITIONS_SQL = """
+    SELECT PARTITION_NAME FROM information_schema.PARTITIONS
+    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'RatingEvents' AND PARTITION_NAME IS NOT NULL
+"""
+
+
+def utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def append_rating(username, game_id, platform, rating, previous=None):
+    # Runs inside the rating transaction, so an event exists exactly when the rating change committed.
+    # previous is the replaced UserRatings row, if any.
+    db.session.execute(db.text(APPEND_SQL), {
+        'created_at': utcnow(),
+        'username': username,
+        'game_id': game_id,
+        'platform': platform,
+        'rating': rating,
+        'previous_platform': previous.PlatformName if previous else None,
+        'previous_rating': previous.Rating if previous else None,
+    })
+
+
+def month_start(moment, offset=0):
+    month = moment.year * 12 + moment.month - 1 + offset
+    return datetime(month // 12, month % 12 + 1, 1)
+
+
+def months_between(start, end):
+    return (end.year - start.year) * 12 + end.month - start.month
+
+
+def partitions(start, count):
+    # One partition per calendar month; names sort in time order
+    return ', '.join(f"PARTITION p{month_start(start, i):%Y%m} VALUES LESS THAN ('{month_start(start, i + 1):%Y-%m-%d}')"
+                     for i in range(count))
+
+
+@click.command('partition-rating-events')
+@click.option('--months-ahead', default=3, show_default=True, help='Empty monthly partitions kept ahead of now.')
+@click.option('--retain-months', default=None, type=int, help='Drop partitions older than this. Keeps all by default.')
+@with_appcontext
+def partition_rating_events_command(months_ahead, retain_months):
+    """Add upcoming monthly RatingEvents partitions on MySQL and drop expired ones."""
+    if db.engine.dialect.name != 'mysql':
+        raise click.UsageError('RatingEvents is only partitioned on MySQL')
+    now = utcnow()
+    end = month_start(now, months_ahead + 1)
+    added, dropped = 0, []
+    with db.engine.begin() as connection:
+        existing = sorted(row.PARTITION_NAME for row in connection.execute(text(PARTITIONS_SQL)))
+        if not existing:
+            first = connection.execute(text("SELECT MIN(CreatedAt) FROM RatingEvents")).scalar() or now
+            added = months_between(first, end)
+            # MySQL requires the partitioning column in every unique key, the primary key included
+            connection.execute(text(f"""
+                ALTER TABLE RatingEvents DROP PRIMARY KEY, ADD PRIMARY KEY (EventID, CreatedAt)
+                PARTITION BY RANGE COLUMNS (CreatedAt) (
+                    {partitions(month_start(first), added)}, PARTITION pmax VALUES LESS THAN (MAXVALUE))
+            """))
+            existing = [f'p{month_start(first, i):%Y%m}' for i in range(added)] + ['pmax']
+        else:
+            last = max(name for name in existing if name != 'pmax')
+            start = month_start(datetime.strptime(last, 'p%Y%m'), 1)
+            added = months_between(start, end)
+            if added > 0:
+                connection.execute(text(f"""
+                    ALTER TABLE RatingEvents REORGANIZE PARTITION pmax INTO (
+                        {partitions(start, added)}, PARTITION pmax VALUES LESS THAN (MAXVALUE))
+                """))
+        if retain_months is not None:
+            cutoff = f'p{month_start(now, -retain_months):%Y%m}'
+            dropped = [name for name in existing if name != 'pmax' and name < cutoff]
+            if dropped:
+                connection.execute(text(f"ALTER TABLE RatingEvents DROP PARTITION {', '.join(dropped)}"))
+    click.echo(f'Added {max(added, 0)} partitions, dropped {len(dropped)}')
+
+
+def init_app(app):
+    app.cli.add_command(partition_rating_events_command)
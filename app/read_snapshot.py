@@ -0,0 +1,164 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import Index, MetaData, create_engine, event, insert, text
+from sqlalchemy.pool import QueuePool
+from app.extensions import db
+from app.snapshot import publish
+
+# The catalog as browse pages read it. Accounts, ratings and rating events stay on MySQL: a statement
+# touching one of LIVE_TABLES is never sent to the snapshot
+SNAPSHOT_TABLES = (
+    'Game', 'GamesPlatform', 'GamesPlatformMediaType', 'GamesPlatformInputDevice', 'GameFirstRelease',
+    'Platform', 'Company', 'CompanyWebsites', 'CompanyDevelopGame', 'CompanyPublishGame',
+    'Director', 'DirectorWebsites', 'GameDirectors', 'DirectorCounts', 'CompanyCounts', 'SimilarGames',
+    'DocumentVersions', 'RatingRollups',
+    'Genre', 'GameGenre', 'Setting', 'GameSetting', 'Gameplay', 'GameGameplay', 'Interface', 'GameInterface',
+    'Perspective', 'GamePerspective', 'Visual', 'GameVisual', 'Art', 'GameArt', 'Narrative', 'GameNarrative',
+    'Pacing', 'GamePacing',
+)
+LIVE_TABLES = re.compile(r'\b(User|UserRatings|RatingEvents)\b')
+# Besides whatever indexes the source has, every column the views join or filter on gets one
+KEY_COLUMN = re.compile(r'^(\w*ID|Name|PlatformName)$')
+FILENAME = 'catalog.sqlite3'
+BATCH = 5000
+
+
+@lru_cache(maxsize=1024)
+def mentions_live_tables(sql):
+    return bool(LIVE_TABLES.search(sql))
+
+
+def mysql_year(value):
+    return None if value is None else int(str(value)[:4])
+
+
+def snapshot_type(column_type):
+    try:
+        generic = column_type.as_generic()
+    except NotImplementedError:
+        return column_type
+    # MySQL compares and sorts text case-insensitively; SQLite only does with NOCASE (ASCII folding)
+    if isinstance(generic, db.String):
+        generic.collation = 'NOCASE'
+    # NUMERIC affinity stores 7.0 as the integer 7, and SQLite then divides it as an integer (7 / 2 = 3) where
+    # MySQL's DECIMAL gives 3.5; REAL keeps the player averages the views compute exact enough
+    if isinstance(generic, db.Numeric) and not isinstance(generic, db.Float):
+        return db.Float()
+    return generic
+
+
+def build(connection, path):
+    metadata = MetaData()
+    metadata.reflect(connection, only=SNAPSHOT_TABLES, resolve_fks=False)
+    for table in metadata.tables.values():
+        for column in table.columns:
+            column.type = snapshot_type(column.type)
+            column.server_default = None
+        for constraint in list(table.foreign_key_constraints):
+            table.constraints.discard(constraint)
+        # MySQL scopes index names to their table, SQLite to the whole database
+        for index in table.indexes:
+            if not index.name.startswith(f'ix_{table.name}_'):
+                index.name = f'ix_{table.name}_{index.name}'
+        leading = {index.columns[0].name for index in table.indexes} | set(table.primary_key.columns.keys()[:1])
+        for column in table.columns:
+            facet_column = table.name == f'Game{column.name}'
+            if (KEY_COLUMN.match(column.name) or facet_column) and column.name not in leading:
+                Index(f'ix_{table.name}_{column.name}', column)
+
+    target = create_engine(f'sqlite:///{path}')
+    rows = 0
+    with target.begin() as out:
+        out.exec_driver_sql('PRAGMA journal_mode = OFF')
+        out.exec_driver_sql('PRAGMA synchronous = OFF')
+        metadata.create_all(out)
+        for table in metadata.sorted_tables:
+            # Rows come back as the driver returns them; the SQLite column types convert them on insert
+            quoted = connection.dialect.identifier_preparer.quote(table.name)
+            result = connection.execution_options(yield_per=BATCH).execute(text(f'SELECT * FROM {quoted}'))
+            for batch in result.partitions():
+                out.execute(insert(table), [row._asdict() for row in batch])
+                rows += len(batch)
+        out.exec_driver_sql('ANALYZE')
+    target.dispose()
+    return rows
+
+
+class ReadSnapshot:
+    # One read-only engine per published file; a request keeps the engine it started with
+    def __init__(self, directory, pool_size):
+        self.directory = directory
+        self.pool_size = pool_size
+        self.version = None
+        self.engine = None
+        self.checked = 0
+        self.lock = threading.Lock()
+
+    def open(self, version):
+        path = os.path.join(self.directory, version, FILENAME)
+        engine = create_engine(f'sqlite:///file:{path}?mode=ro&immutable=1&uri=true', poolclass=QueuePool,
+                               pool_size=self.pool_size, max_overflow=-1,
+                               connect_args={'check_same_thread': False, 'detect_types': sqlite3.PARSE_DECLTYPES})
+
+        @event.listens_for(engine, 'connect')
+        def prepare(dbapi_connection, connection_record):
+            dbapi_connection.create_function('YEAR', 1, mysql_year, deterministic=True)
+            dbapi_connection.execute(f'PRAGMA mmap_size = {os.path.getsize(path)}')
+
+        return engine
+
+    def current(self):
+        if time.monotonic() - self.checked < 1:
+            return self.engine
+        self.checked = time.monotonic()
+        try:
+            with open(os.path.join(self.directory, 'CURRENT')) as f:
+                version = f.read().strip()
+        except FileNotFoundError:
+            return None
+        if version != self.version:
+            with self.lock:
+                if version != self.version:
+                    previous, self.engine = self.engine, self.open(version)
+                    self.version = version
+                    # Idle connections to the old file close now; ones still checked out are discarded when returned
+                    if previous is not None:
+                        previous.dispose()
+        return self.engine
+
+    def reads_live(self, clause):
+        text = getattr(clause, 'text', None)
+        return text is not None and mentions_live_tables(text)
+
+
+@click.command('build-read-snapshot')
+@click.option('--bind', default=None, help='Bind key to read from, e.g. replica_0. Defaults to the primary.')
+@with_appcontext
+def build_read_snapshot_command(bind):
+    """Copy the catalog tables into a new read-only SQLite file and make it the one workers serve from."""
+    directory = current_app.config['READ_SNAPSHOT_DIR']
+    version = time.strftime('%Y%m%d%H%M%S')
+    os.makedirs(os.path.join(directory, version), exist_ok=True)
+    path = os.path.join(directory, version, FILENAME)
+    start = time.perf_counter()
+    with db.engines[bind].connect() as connection:
+        rows = build(connection, path)
+    publish(directory, version)
+    click.echo(f'Built read snapshot {version}: {rows} rows, {os.path.getsize(path) / 1024 / 1024:.1f} MiB '
+               f'in {time.perf_counter() - start:.1f}s')
+
+
+def init_app(app):
+    if not app.config.get('READ_SNAPSHOT_DIR'):
+        app.config['READ_SNAPSHOT_DIR'] = os.path.join(app.instance_path, 'read-snapshot')
+    if app.config['READ_SNAPSHOT']:
+        app.extensions['read_snapshot'] = ReadSnapshot(app.config['READ_SNAPSHOT_DIR'],
+                                                       app.config['READ_SNAPSHOT_POOL_SIZE'])
+    app.cli.add_command(build_read_snapshot_command)
@@ -0,0 +1,280 @@
+import os
+import shutil
+import threading
+import time
+import click
+import numpy as np
+import scipy.sparse as sp
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import text
+from app.extensions import db
+
+RATINGS_SQL = "SELECT Username, GameID, Rating FROM UserRatings"
+USER_RATINGS_SQL = "SELECT GameID, Rating FROM UserRatings WHERE Username = :username"
+GAMES_SQL = db.text("SELECT ID, `Name`, CoverPhoto, MobyScore FROM Game WHERE ID IN :ids").bindparams(
+    db.bindparam('ids', expanding=True))
+
+ARRAYS = ('game_ids', 'indptr', 'indices', 'dots', 'norms')
+# Journal records: dot(item, other) += delta, or norm(item) += delta when other is -1
+JOURNAL = np.dtype([('item', '<i4'), ('other', '<i4'), ('delta', '<f4')])
+
+
+def item_neighbours(ratings, k, budget=20_000_000):
+    # ratings is a users x games CSR matrix. Keeps the k most cosine-similar games per game,
+    # storing raw dot products so later ratings can adjust them without a rebuild.
+    norms = np.asarray(ratings.multiply(ratings).sum(axis=0), dtype=np.float64).ravel()
+    by_game = ratings.T.tocsr()
+    scale = 1 / np.sqrt(np.maximum(norms, 1e-12))
+
+    n_games = by_game.shape[0]
+    batch = max(1, budget // max(n_games, 1))
+    counts, indices, dots = [], [], []
+    for start in range(0, n_games, batch):
+        block = (by_game[start:start + batch] @ ratings).tocsr()
+        for offset in range(block.shape[0]):
+            lo, hi = block.indptr[offset], block.indptr[offset + 1]
+            others, products = block.indices[lo:hi], block.data[lo:hi]
+            mask = (others != start + offset) & (products > 0)
+            others, products = others[mask], products[mask]
+            if len(others) > k:
+                top = np.argpartition(-products * scale[others], k)[:k]
+                others, products = others[top], products[top]
+            counts.append(len(others))
+            indices.append(others)
+            dots.append(products)
+
+    indptr = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+    indices = np.concatenate(indices).astype(np.int32) if indices else np.empty(0, dtype=np.int32)
+    dots = np.concatenate(dots).astype(np.float32) if dots else np.empty(0, dtype=np.float32)
+    return indptr, indices, dots, norms
+
+
+def rating_matrix(rows):
+    users, game_ids, ratings = {}, [], []
+    user_rows = []
+    for username, game_id, rating in rows:
+        user_rows.append(users.setdefault(username, len(users)))
+        game_ids.append(game_id)
+        ratings.append(float(rating))
+    game_ids, game_rows = np.unique(np.array(game_ids, dtype=np.int64), return_inverse=True)
+    matrix = sp.csr_matrix((np.array(ratings, dtype=np.float32), (np.array(user_rows), game_rows.ravel())),
+                           shape=(len(users), len(game_ids)))
+    return game_ids, matrix
+
+
+class ItemModel:
+    def __init__(self, path):
+        self.path = path
+        arrays = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r') for name in ARRAYS}
+        self.game_ids = arrays['game_ids']
+        self.indptr = arrays['indptr']
+        self.indices = arrays['indices']
+        self.dots = arrays['dots']
+        # Norms and the overlay are the only parts touched by incremental updates, so only they are copied
+        self.norms = np.array(arrays['norms'])
+        self.overlay = {}
+        self.journal_offset = 0
+        self.lock = threading.Lock()
+
+    def rows(self, game_ids):
+        game_ids = np.asarray(game_ids, dtype=np.int64)
+        positions = np.searchsorted(self.game_ids, game_ids)
+        known = positions < len(self.game_ids)
+        known[known] = self.game_ids[positions[known]] == game_ids[known]
+        return positions, known
+
+    def catch_up(self):
+        # Apply journal entries written since the last request, by this worker or any other
+        journal = os.path.join(self.path, 'journal.bin')
+        try:
+            size = os.path.getsize(journal)
+        except FileNotFoundError:
+            return
+        size -= size % JOURNAL.itemsize
+        if size <= self.journal_offset:
+            return
+        with self.lock:
+            if size <= self.journal_offset:
+                return
+            with open(journal, 'rb') as f:
+                f.seek(self.journal_offset)
+                records = np.frombuffer(f.read(size - self.journal_offset), dtype=JOURNAL)
+            for item, other, delta in records.tolist():
+                if other < 0:
+                    self.norms[item] += delta
+                else:
+                    for a, b in ((item, other), (other, item)):
+                        row = self.overlay.setdefault(a, {})
+                        row[b] = row.get(b, 0.0) + delta
+            self.journal_offset = size
+
+    def neighbours(self, row):
+        # Journalled deltas are exact for stored pairs; a pair outside the stored top k only
+        # carries what changed since the build, an underestimate until the next rebuild
+        lo, hi = self.indptr[row], self.indptr[row + 1]
+        others, dots = self.indices[lo:hi], self.dots[lo:hi]
+        extra = self.overlay.get(row)
+        if extra:
+            others = np.concatenate((others, np.fromiter(extra.keys(), dtype=np.int32, count=len(extra))))
+            dots = np.concatenate((dots, np.fromiter(extra.values(), dtype=np.float32, count=len(extra))))
+            others, inverse = np.unique(others, return_inverse=True)
+            dots = np.bincount(inverse.ravel(), weights=dots)
+        return others, dots
+
+    def recommend(self, ratings, n):
+        # ratings maps GameID to the user's rating; returns [(GameID, score)] for unrated games
+        rows, known = self.rows(list(ratings))
+        rows = rows[known]
+        values = np.array(list(ratings.values()), dtype=np.float64)[known]
+        if not len(rows):
+            return []
+        weights = values - values.mean()
+        if not weights.any():
+            weights = values
+
+        candidates, scores = [], []
+        for row, weight in zip(rows, weights):
+            others, dots = self.neighbours(row)
+            similarity = dots / np.sqrt(np.maximum(self.norms[row] * self.norms[others], 1e-12))
+            candidates.append(others)
+            scores.append(similarity * weight)
+
+        candidates, inverse = np.unique(np.concatenate(candidates), return_inverse=True)
+        scores = np.bincount(inverse.ravel(), weights=np.concatenate(scores))
+        keep = ~np.isin(candidates, rows) & (scores > 0)
+        candidates, scores = candidates[keep], scores[keep]
+        if len(scores) > n:
+            top = np.argpartition(-scores, n)[:n]
+            candidates, scores = candidates[top], scores[top]
+        order = np.argsort(-scores, kind='stable')
+        return [(int(self.game_ids[c]), float(s)) for c, s in zip(candidates[order], scores[order])]
+
+
+class Recommender:
+    def __init__(self, directory):
+        self.directory = directory
+        self.model = None
+        self.lock = threading.Lock()
+
+    def current(self):
+        try:
+            with open(os.path.join(self.directory, 'CURRENT')) as f:
+                version = f.read().strip()
+        except FileNotFoundError:
+            return None
+        model = self.model
+        if model is None or os.path.basename(model.path) != version:
+            with self.lock:
+                if self.model is None or os.path.basename(self.model.path) != version:
+                    self.model = ItemModel(os.path.join(self.directory, version))
+                model = self.model
+        model.catch_up()
+        return model
+
+    def record(self, ratings, game_id, old_rating, new_rating):
+        # Journal the dot-product and norm changes from one rating write
+        model = self.current()
+        if model is None:
+            return
+        old_rating = float(old_rating or 0)
+        new_rating = float(new_rating)
+        rows, known = model.rows([game_id])
+        if not known[0]:
+            return
+        item = rows[0]
+        others = {other_id: rating for other_id, rating in ratings.items() if other_id != game_id}
+        other_rows, other_known = model.rows(list(others))
+        change = new_rating - old_rating
+        records = np.zeros(1 + int(other_known.sum()), dtype=JOURNAL)
+        records[0] = (item, -1, new_rating ** 2 - old_rating ** 2)
+        records['item'][1:] = item
+        records['other'][1:] = other_rows[other_known]
+        records['delta'][1:] = change * np.array(list(others.values()), dtype=np.float64)[other_known]
+
+        fd = os.open(os.path.join(model.path, 'journal.bin'), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, records.tobytes())
+        finally:
+            os.close(fd)
+
+
+def recommender():
+    return current_app.extensions['recommender']
+
+
+def user_ratings(username):
+    result = db.session.execute(db.text(USER_RATINGS_SQL), {'username': username})
+    return {row.GameID: float(row.Rating) for row in result}
+
+
+def recommend_games(username, n):
+    model = recommender().current()
+    if model is None:
+        return None
+    ranked = model.recommend(user_ratings(username), n)
+    if not ranked:
+        return []
+    result = db.session.execute(GAMES_SQL, {'ids': [game_id for game_id, _ in ranked]})
+    games = {game.ID: game for game in result}
+    return [{'id': game_id, 'name': games[game_id].Name, 'image': games[game_id].CoverPhoto,
+             'score': games[game_id].MobyScore}
+            for game_id, _ in ranked if game_id in games]
+
+
+def record_rating(username, game_id, old_rating, new_rating):
+    try:
+        recommender().record(user_ratings(username), game_id, old_rating, new_rating)
+    except Exception:
+        # Runs after the rating committed, so a failure here must not be reported as a failed save
+        current_app.logger.warning('Could not journal rating for recommendations', exc_info=True)
+
+
+def save(directory, game_ids, indptr, indices, dots, norms):
+    version = time.strftime('%Y%m%d%H%M%S')
+    path = os.path.join(directory, version)
+    os.makedirs(path, exist_ok=True)
+    for name, array in zip(ARRAYS, (game_ids, indptr, indices, dots, norms)):
+        np.save(os.path.join(path, f'{name}.npy'), array)
+
+    pointer = os.path.join(directory, 'CURRENT')
+    previous = open(pointer).read().strip() if os.path.exists(pointer) else None
+    with open(pointer + '.tmp', 'w') as f:
+        f.write(version)
+    os.replace(pointer + '.tmp', pointer)
+
+    # Keep the previous version: workers may still be reading it until their next request
+    for name in os.listdir(directory):
+        if name not in (version, previous) and os.path.isdir(os.path.join(directory, name)):
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+    return path
+
+
+@click.command('build-recommendations')
+@click.option('--neighbours', default=50, show_default=True, help='Similar games kept per game.')
+@click.option('--bind', default=None, help='Bind key to read from, e.g. replica_0. Defaults to the primary.')
+@with_appcontext
+def build_recommendations_command(neighbours, bind):
+    """Rebuild the item-item recommendation model from UserRatings."""
+    start = time.perf_counter()
+    with db.engines[bind].connect() as connection:
+        rows = connection.execution_options(stream_results=True, yield_per=50000).execute(text(RATINGS_SQL))
+        game_ids, ratings = rating_matrix(rows)
+    loaded = time.perf_counter()
+    click.echo(f'Loaded {ratings.nnz} ratings ({ratings.shape[0]} users x {ratings.shape[1]} games) '
+               f'in {loaded - start:.1f}s')
+
+    indptr, indices, dots, norms = item_neighbours(ratings, neighbours)
+    built = time.perf_counter()
+    size = sum(array.nbytes for array in (game_ids, indptr, indices, dots, norms))
+    click.echo(f'Built {len(dots)} neighbour pairs in {built - loaded:.1f}s, {size / 1024 / 1024:.1f} MiB')
+
+    path = save(current_app.config['RECOMMENDATIONS_DIR'], game_ids, indptr, indices, dots, norms)
+    click.echo(f'Saved to {path}')
+
+
+def init_app(app):
+    if not app.config.get('RECOMMENDATIONS_DIR'):
+        app.config['RECOMMENDATIONS_DIR'] = os.path.join(app.instance_path, 'recommendations')
+    app.extensions['recommender'] = Recommender(app.config['RECOMMENDATIONS_DIR'])
+    app.cli.add_command(build_recommendations_command)
@@ -0,0 +1,99 @@
+import time
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import text
+from app.documents import invalidate_rating
+from app.extensions import db
+from app.rollups import refresh as refresh_rollups
+
+# True aggregates for one chunk of games next to the stored counters, keeping only the rows that disagree.
+# No ratings is stored as NULL by add_rating(), and a stored 0 means the same thing.
+DRIFT_SQL = """
+    SELECT gp.GameID, gp.PlatformName, gp.TotalPlayerRating, gp.NumPlayersRated,
+        r.Total, r.Num
+    FROM GamesPlatform gp
+    LEFT JOIN (
+        SELECT GameID, PlatformName, SUM(Rating) AS Total, COUNT(*) AS Num
+        FROM UserRatings
+        WHERE GameID BETWEEN :lo AND :hi
+        GROUP BY GameID, PlatformName
+    ) r ON r.GameID = gp.GameID AND r.PlatformName = gp.PlatformName
+    WHERE gp.GameID BETWEEN :lo AND :hi
+        AND (COALESCE(gp.NumPlayersRated, 0) <> COALESCE(r.Num, 0)
+            OR ABS(COALESCE(gp.TotalPlayerRating, 0) - COALESCE(r.Total, 0)) > 0.001)
+"""
+# Only repairs a row still holding the values the diff saw; one a rating changed since is left for the next run
+REPAIR_SQL = """
+    UPDATE GamesPlatform
+    SET TotalPlayerRating = :total, NumPlayersRated = :num
+    WHERE GameID = :game_id AND PlatformName = :platform
+        AND COALESCE(TotalPlayerRating, -1) = :seen_total AND COALESCE(NumPlayersRated, -1) = :seen_num
+"""
+SCANNED_SQL = "SELECT COUNT(*) FROM GamesPlatform WHERE GameID BETWEEN :lo AND :hi"
+# Ratings whose platform has no GamesPlatform row cannot be counted anywhere
+ORPHANS_SQL = """
+    SELECT COUNT(*) FROM UserRatings r
+    WHERE r.GameID BETWEEN :lo AND :hi
+        AND NOT EXISTS (SELECT 1 FROM GamesPlatform gp WHERE gp.GameID = r.GameID AND gp.PlatformName = r.PlatformName)
+"""
+
+
+@click.command('reconcile-ratings')
+@click.option('--chunk-size', default=5000, show_default=True, help='Game IDs diffed per statement.')
+@click.option('--pause', default=0.0, show_default=True, help='Seconds to sleep between chunks.')
+@click.option('--dry-run', is_flag=True, help='Report drift without repairing it.')
+@with_appcontext
+def reconcile_ratings_command(chunk_size, pause, dry_run):
+    """Recompute GamesPlatform rating counters from UserRatings and repair any drift."""
+    start = time.perf_counter()
+    with db.engine.connect() as connection:
+        lo, hi = connection.execute(text("SELECT MIN(ID), MAX(ID) FROM Game")).first()
+    if lo is None:
+        click.echo('No games')
+        return
+
+    scanned = drifted = repaired = orphans = 0
+    count_drift, total_drift = 0, 0.0
+    for chunk_lo in range(lo, hi + 1, chunk_size):
+        bounds = {'lo': chunk_lo, 'hi': chunk_lo + chunk_size - 1}
+        # One short transaction per chunk: a consistent read of both sides, then guarded row updates
+        with db.engine.begin() as connection:
+            scanned += connection.execute(text(SCANNED_SQL), bounds).scalar()
+            orphans += connection.execute(text(ORPHANS_SQL), bounds).scalar()
+            rows = connection.execute(text(DRIFT_SQL), bounds).fetchall()
+            drifted += len(rows)
+            for row in rows:
+                count_drift += abs((row.NumPlayersRated or 0) - (row.Num or 0))
+                total_drift += abs(float(row.TotalPlayerRating or 0) - float(row.Total or 0))
+            if rows and not dry_run:
+                result = connection.execute(text(REPAIR_SQL), [{
+                    'game_id': row.GameID,
+                    'platform': row.PlatformName,
+                    'total': row.Total,
+                    'num': row.Num,
+                    'seen_total': -1 if row.TotalPlayerRating is None else row.TotalPlayerRating,
+                    'seen_num': -1 if row.NumPlayersRated is None else row.NumPlayersRated,
+                } for row in rows])
+                repaired += result.rowcount
+                # Recomputed from the repaired rows, once per chunk, whichever of them the guard let through
+                refresh_rollups(connection, [row.GameID for row in rows], [row.PlatformName for row in rows])
+                platforms = {}
+                for row in rows:
+                    platforms.setdefault(row.GameID, []).append(row.PlatformName)
+                for game_id, names in platforms.items():
+                    invalidate_rating(game_id, names, connection)
+        if pause:
+            time.sleep(pause)
+
+    elapsed = time.perf_counter() - start
+    click.echo(f'Scanned {scanned} game platforms ({hi - lo + 1} game IDs) in {elapsed:.1f}s, '
+               f'{scanned / max(elapsed, 1e-9):.0f} rows/s')
+    click.echo(f'Drifted: {drifted} rows, off by {count_drift} ratings and {total_drift:.1f} rating points in total')
+    if not dry_run:
+        click.echo(f'Repaired {repaired}, left {drifted - repaired} that changed during the run')
+    if orphans:
+        click.echo(f'{orphans} ratings name a platform the game is not on and are not counted')
+
+
+def init_app(app):
+    app.cli.add_command(reconcile_ratings_command)
@@ -0,0 +1,105 @@
+import time
+import click
+from flask.cli import AppGroup
+from sqlalchemy import text
+from app.extensions import db
+
+DELETE_SQL = "DELETE FROM GameFirstRelease WHERE GameID BETWEEN :lo AND :hi"
+INSERT_SQL = """
+    INSERT INTO GameFirstRelease (GameID, FirstRelease, ReleaseYear)
+    SELECT GameID, MIN(DateOfRelease), YEAR(MIN(DateOfRelease))
+    FROM GamesPlatform
+    WHERE GameID BETWEEN :lo AND :hi AND DateOfRelease IS NOT NULL
+    GROUP BY GameID
+"""
+FIRST_RELEASE_SQL = "SELECT FirstRelease FROM GameFirstRelease WHERE GameID = :game_id"
+# Games without a row (added since the last rebuild, or no triggers installed) fall back to GamesPlatform
+LIVE_FIRST_RELEASE_SQL = db.text(
+    "SELECT MIN(DateOfRelease) AS FirstRelease FROM GamesPlatform WHERE GameID = :game_id").columns(
+    FirstRelease=db.Date)
+RELEASE_YEARS_SQL = """
+    SELECT GameID, ReleaseYear FROM GameFirstRelease
+    UNION ALL
+    SELECT GameID, YEAR(MIN(DateOfRelease))
+    FROM GamesPlatform gp
+    WHERE DateOfRelease IS NOT NULL
+        AND NOT EXISTS (SELECT 1 FROM GameFirstRelease fr WHERE fr.GameID = gp.GameID)
+    GROUP BY GameID
+"""
+
+# Recompute one game's row from inside a GamesPlatform trigger
+TRIGGER_BODY = """
+    DELETE FROM GameFirstRelease WHERE GameID = {game};
+    INSERT INTO GameFirstRelease (GameID, FirstRelease, ReleaseYear)
+    SELECT GameID, MIN(DateOfRelease), YEAR(MIN(DateOfRelease))
+    FROM GamesPlatform
+    WHERE GameID = {game} AND DateOfRelease IS NOT NULL
+    GROUP BY GameID;
+"""
+TRIGGERS = {
+    'GamesPlatform_first_release_insert': f"""
+        CREATE TRIGGER GamesPlatform_first_release_insert AFTER INSERT ON GamesPlatform
+        FOR EACH ROW BEGIN {TRIGGER_BODY.format(game='NEW.GameID')} END
+    """,
+    # Rating writes update GamesPlatform on every request, so only react when a release date moves
+    'GamesPlatform_first_release_update': f"""
+        CREATE TRIGGER GamesPlatform_first_release_update AFTER UPDATE ON GamesPlatform
+        FOR EACH ROW BEGIN
+            IF NOT (OLD.DateOfRelease <=> NEW.DateOfRelease) OR OLD.GameID <> NEW.GameID THEN
+                {TRIGGER_BODY.format(game='OLD.GameID')}
+                {TRIGGER_BODY.format(game='NEW.GameID')}
+            END IF;
+        END
+    """,
+    'GamesPlatform_first_release_delete': f"""
+        CREATE TRIGGER GamesPlatform_first_release_delete AFTER DELETE ON GamesPlatform
+        FOR EACH ROW BEGIN {TRIGGER_BODY.format(game='OLD.GameID')} END
+    """,
+}
+
+
+def first_release(game_id):
+    released = db.session.execute(db.text(FIRST_RELEASE_SQL), {'game_id': game_id}).scalar()
+    if released is None:
+        released = db.session.execute(LIVE_FIRST_RELEASE_SQL, {'game_id': game_id}).scalar()
+    return released
+
+
+def refresh(connection, lo, hi):
+    connection.execute(text(DELETE_SQL), {'lo': lo, 'hi': hi})
+    connection.execute(text(INSERT_SQL), {'lo': lo, 'hi': hi})
+
+
+first_releases_cli = AppGroup('first-releases', help='Maintain the GameFirstRelease table.')
+
+
+@first_releases_cli.command('rebuild')
+@click.option('--chunk-size', default=10000, show_default=True, help='Game IDs recomputed per transaction.')
+def rebuild_command(chunk_size):
+    """Recompute every game's first release from GamesPlatform."""
+    start = time.perf_counter()
+    with db.engine.connect() as connection:
+        lo, hi = connection.execute(text("SELECT MIN(ID), MAX(ID) FROM Game")).first()
+    if lo is None:
+        click.echo('No games')
+        return
+    for chunk_lo in range(lo, hi + 1, chunk_size):
+        with db.engine.begin() as connection:
+            refresh(connection, chunk_lo, chunk_lo + chunk_size - 1)
+    with db.engine.connect() as connection:
+        rows = connection.execute(text("SELECT COUNT(*) FROM GameFirstRelease")).scalar()
+    click.echo(f'Rebuilt {rows} first releases in {time.perf_counter() - start:.1f}s')
+
+
+@first_releases_cli.command('install-triggers')
+def install_triggers_command():
+    """Keep GameFirstRelease current from triggers on GamesPlatform (MySQL)."""
+    with db.engine.begin() as connection:
+        for name, sql in TRIGGERS.items():
+            connection.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+            connection.execute(text(sql))
+    click.echo(f'Installed {len(TRIGGERS)} triggers')
+
+
+def init_app(app):
+    app.cli.add_command(first_releases_cli)
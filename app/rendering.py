@@ -0,0 +1,62 @@
+from flask import Response, current_app, get_flashed_messages, render_template, request, stream_template, url_for
+
+# Set by `flask prerender-pages` on the requests it renders; never present on requests from outside
+PRERENDER_ENVIRON = 'gamearchive.prerender'
+
+
+def buffered(chunks, size):
+    # Jinja yields many tiny strings; regroup them so each write is worth a packet
+    buffer, length = [], 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield ''.join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def stream_page(template_name, **context):
+    # Pop flashes now: the session cookie is written before the body starts streaming
+    get_flashed_messages(with_categories=True)
+    chunks = stream_template(template_name, **context)
+    return Response(buffered(chunks, current_app.config['STREAM_CHUNK_SIZE']), mimetype='text/html')
+
+
+def page_url(page, fragment=None):
+    # The current listing URL, filters included, at another page
+    args = request.args.to_dict(flat=False)
+    args.pop('fragment', None)
+    args['page'] = page
+    if fragment:
+        args['fragment'] = fragment
+    return url_for(request.endpoint, **request.view_args, **args)
+
+
+def render_listing(template_name, fragments, **context):
+    # ?fragment=<name> renders only that region of the page, for static/js/fragments.js to swap in place
+    fragment = request.args.get('fragment')
+    if fragment not in fragments:
+        return render_template(template_name, **context)
+    response = current_app.make_response(render_template(fragments[fragment], **context))
+    # Long enough for the next-page prefetch to be reused when the pager is clicked
+    response.headers['Cache-Control'] = f"private, max-age={current_app.config['FRAGMENT_MAX_AGE']}"
+    return response
+
+
+def prerendering():
+    # The page is rendered once for every visitor: per-user regions become placeholders (static/js/includes.js)
+    return bool(request.environ.get(PRERENDER_ENVIRON))
+
+
+def render_fragment(template_name, **context):
+    # A per-user region of a pre-rendered page
+    response = current_app.make_response(render_template(template_name, **context))
+    response.headers['Cache-Control'] = 'private, no-store'
+    return response
+
+
+def init_app(app):
+    app.jinja_env.globals['page_url'] = page_url
+    app.jinja_env.globals['prerendering'] = prerendering
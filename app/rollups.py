@@ -0,0 +1,106 @@
+import time
+import click
+from flask.cli import AppGroup
+from sqlalchemy import bindparam, text
+from app.catalog import FACET_TYPES, facet_tables
+from app.extensions import db
+
+# (kind, link table, entity column) for every kind whose games come through a link table
+LINKS = [('director', 'GameDirectors', 'DirectorID'),
+         ('developer', 'CompanyDevelopGame', 'CompanyID'),
+         ('publisher', 'CompanyPublishGame', 'CompanyID')] + [
+    (facet_type, facet_tables(facet_type)[1], facet_tables(facet_type)[0]) for facet_type in FACET_TYPES]
+
+SUMS = """
+    COALESCE(SUM(gp.AvgCriticRatingPercentage), 0), COUNT(gp.AvgCriticRatingPercentage),
+    COALESCE(SUM(gp.TotalPlayerRating), 0), COALESCE(SUM(gp.NumPlayersRated), 0)
+"""
+# {where} narrows a rebuild down to the entities of some games (refresh) or is left empty (everything)
+INSERT_SQL = {kind: f"""
+    INSERT INTO RatingRollups (Kind, EntityKey, CriticSum, CriticCount, PlayerTotal, PlayerCount)
+    SELECT '{kind}', CAST(l.{column} AS CHAR), {SUMS}
+    FROM GamesPlatform gp INNER JOIN {table} l ON l.GameID = gp.GameID
+    {{where}}
+    GROUP BY l.{column}
+""" for kind, table, column in LINKS}
+INSERT_SQL['platform'] = f"""
+    INSERT INTO RatingRollups (Kind, EntityKey, CriticSum, CriticCount, PlayerTotal, PlayerCount)
+    SELECT 'platform', gp.PlatformName, {SUMS}
+    FROM GamesPlatform gp
+    {{where}}
+    GROUP BY gp.PlatformName
+"""
+REFRESH_WHERE = {kind: f"WHERE l.{column} IN (SELECT {column} FROM {table} WHERE GameID IN :game_ids)"
+                 for kind, table, column in LINKS}
+REFRESH_WHERE['platform'] = "WHERE gp.PlatformName IN :platforms"
+REFRESH_DELETE_SQL = {kind: f"""
+    DELETE FROM RatingRollups
+    WHERE Kind = '{kind}' AND EntityKey IN (SELECT CAST({column} AS CHAR) FROM {table} WHERE GameID IN :game_ids)
+""" for kind, table, column in LINKS}
+REFRESH_DELETE_SQL['platform'] = "DELETE FROM RatingRollups WHERE Kind = 'platform' AND EntityKey IN :platforms"
+
+# Every rollup row a change to one (game, platform) release counts towards
+AFFECTED_SQL = ' UNION '.join(
+    [f"SELECT '{kind}' AS Kind, CAST({column} AS CHAR) AS EntityKey FROM {table} WHERE GameID = :game_id"
+     for kind, table, column in LINKS] + ["SELECT 'platform', CAST(:platform AS CHAR)"])
+APPLY_SQL = {
+    'mysql': f"""
+        UPDATE RatingRollups r INNER JOIN ({AFFECTED_SQL}) affected
+            ON r.Kind = affected.Kind AND r.EntityKey = affected.EntityKey
+        SET r.PlayerTotal = r.PlayerTotal + :total, r.PlayerCount = r.PlayerCount + :count
+    """,
+    'sqlite': f"""
+        UPDATE RatingRollups SET PlayerTotal = PlayerTotal + :total, PlayerCount = PlayerCount + :count
+        FROM ({AFFECTED_SQL}) affected
+        WHERE RatingRollups.Kind = affected.Kind AND RatingRollups.EntityKey = affected.EntityKey
+    """,
+}
+AVERAGES_SQL = """
+    SELECT CriticSum / NULLIF(CriticCount, 0) AS AvgCritic, PlayerTotal / NULLIF(PlayerCount, 0) AS AvgUser
+    FROM RatingRollups
+    WHERE Kind = :kind AND EntityKey = :key
+"""
+
+
+def apply_rating(game_id, platform, total, count, connection=None):
+    # Runs inside the rating transaction with the same deltas applied to the GamesPlatform row
+    sql = APPLY_SQL[db.engine.dialect.name]
+    (connection or db.session).execute(text(sql), {'game_id': game_id, 'platform': platform,
+                                                   'total': total, 'count': count})
+
+
+def refresh(connection, game_ids, platforms):
+    # Recompute every rollup the given games and platforms count towards, e.g. after repairing their rows
+    params = {'game_ids': sorted(set(game_ids)), 'platforms': sorted(set(platforms))}
+    for kind, sql in INSERT_SQL.items():
+        key = 'platforms' if kind == 'platform' else 'game_ids'
+        delete = text(REFRESH_DELETE_SQL[kind]).bindparams(bindparam(key, expanding=True))
+        insert = text(sql.format(where=REFRESH_WHERE[kind])).bindparams(bindparam(key, expanding=True))
+        connection.execute(delete, {key: params[key]})
+        connection.execute(insert, {key: params[key]})
+
+
+def averages(kind, key):
+    # None for an entity added since the last rebuild; callers aggregate it live instead
+    return db.session.execute(text(AVERAGES_SQL), {'kind': kind, 'key': str(key)}).first()
+
+
+rating_rollups_cli = AppGroup('rating-rollups', help='Maintain the RatingRollups table.')
+
+
+@rating_rollups_cli.command('rebuild')
+def rebuild_command():
+    """Recompute every director, company, platform and facet value rating rollup from GamesPlatform."""
+    start = time.perf_counter()
+    for kind, sql in INSERT_SQL.items():
+        # One transaction per kind, so pages never see a kind half rebuilt
+        with db.engine.begin() as connection:
+            connection.execute(text("DELETE FROM RatingRollups WHERE Kind = :kind"), {'kind': kind})
+            connection.execute(text(sql.format(where='')))
+    with db.engine.connect() as connection:
+        rows = connection.execute(text("SELECT COUNT(*) FROM RatingRollups")).scalar()
+    click.echo(f'Rebuilt {rows} rating rollups in {time.perf_counter() - start:.1f}s')
+
+
+def init_app(app):
+    app.cli.add_command(rating_rollups_cli)
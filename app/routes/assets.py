@@ -0,0 +1,30 @@
+import mimetypes
+import os
+from flask import Blueprint, abort, current_app, request, send_from_directory
+from app.assets import dist_dir, is_bundle_file
+
+assets_blueprint = Blueprint('assets', __name__)
+
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+@assets_blueprint.route('/assets/<path:filename>')
+def asset(filename):
+    # Any build still on disk is served: pages rendered by old workers during a deploy ask new ones for it
+    if not is_bundle_file(filename):
+        abort(404)
+
+    directory = dist_dir(current_app)
+    served, encoding = filename, None
+    for name, suffix in ENCODINGS:
+        if name in request.accept_encodings and os.path.exists(os.path.join(directory, filename + suffix)):
+            served, encoding = filename + suffix, name
+            break
+
+    response = send_from_directory(directory, served, mimetype=mimetypes.guess_type(filename)[0],
+                                   max_age=31536000)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    response.vary.add('Accept-Encoding')
+    return response
@@ -0,0 +1,44 @@
+from flask import Blueprint, abort, current_app, redirect, request, send_file
+from app.extensions import db
+from app.images import FORMATS, SOURCES, ImageError, image_cache, snap_width
+from app.routing import uses_replica
+
+images_blueprint = Blueprint('images', __name__)
+
+
+@images_blueprint.route('/img/<string:kind>/<int:entity_id>')
+@uses_replica
+def image(kind, entity_id):
+    if kind not in SOURCES:
+        abort(404)
+
+    source = db.session.execute(db.text(SOURCES[kind]), {'id': entity_id}).scalar()
+    if not source:
+        abort(404)
+
+    # Nothing below needs the database; don't hold a pooled connection through a slow upstream fetch
+    db.session.close()
+
+    width = snap_width(request.args.get('w', 200, type=int))
+    fmt = 'webp' if 'image/webp' in request.headers.get('Accept', '') else 'jpeg'
+
+    try:
+        try:
+            response = send_variant(source, width, fmt)
+        except FileNotFoundError:
+            # Evicted by another request between being cached and being opened; build it again
+            response = send_variant(source, width, fmt)
+    except (ImageError, FileNotFoundError):
+        current_app.logger.warning('Serving original image for %s %s', kind, entity_id, exc_info=True)
+        response = redirect(source)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    response.vary.add('Accept')
+    return response
+
+
+def send_variant(source, width, fmt):
+    path = image_cache().variant(source, width, fmt)
+    return send_file(path, mimetype=FORMATS[fmt][1], max_age=31536000, etag=True, conditional=True)
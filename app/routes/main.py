@@ -1,11 +1,27 @@
-from flask import Blueprint, render_template, request, redirect, url_for, session, flash
+from flask import Blueprint, Response, current_app, render_template, request, redirect, url_for, session, flash, stream_with_context
+from app.admission import rate_limited, route_class
+from app.documents import cached_document, invalidate_rating
 from app.extensions import db
+from app.exports import csv_lines, json_lines, user_rating_rows
+from app.facets import FILTERS, facet_index, facet_label, page_games
+from app.recommendations import recommend_games, record_rating
+from app.rating_events import append_rating
+from app.releases import first_release
+from app.rendering import prerendering, render_fragment, render_listing, stream_page
+from app.rollups import apply_rating, averages
+from app.similarity import similar_games
+from app.snapshot import catalog_snapshot
+from app.singleflight import fetch_all, fetch_first
+from app.statements import execute
+from app.routing import uses_primary
+from app.trending import trending_games
 from datetime import datetime, timedelta
 from flask_wtf import FlaskForm
 from wtforms import StringField, SubmitField, EmailField, SelectField, DateField, DecimalField
 from wtforms.validators import DataRequired, Email, ValidationError, NumberRange
 import pycountry
-from urllib.parse import unquote
+from urllib.parse import quote, unquote
+from werkzeug.utils import secure_filename
 
 def get_country_choices():
     countries = [(country.name, country.name) for country in pycountry.countries]
@@ -25,6 +41,14 @@ class PaginationInfo:
         self.prev_num = prev_num
         self.next_num = next_num
 
+# Regions a listing page can return on its own via ?fragment=<name>
+RESULTS_FRAGMENTS = {'results': 'fragments/game_results.html'}
+GAMES_FRAGMENTS = dict(RESULTS_FRAGMENTS, listing='fragments/games_listing.html')
+
+# Listing orders backed by the DirectorCounts/CompanyCounts indexes, by ?sort= value
+DIRECTOR_SORTS = {'name': 'Name', 'games': 'Most games'}
+COMPANY_SORTS = {'name': 'Name', 'developed': 'Most developed', 'published': 'Most published'}
+
 class LoginForm(FlaskForm):
     username = StringField('Username:', validators=[DataRequired()])
     submit = SubmitField('Login')
@@ -65,11 +89,12 @@ class RateForm(FlaskForm):
 
 main_blueprint = Blueprint('main', __name__)
 @main_blueprint.route('/create_account', methods=['GET', 'POST'])
+@route_class('write')
+@uses_primary
 def create_account():
     create_form = CreateAccountForm()
     if create_form.validate_on_submit():
-        sql = "SELECT Username, Email FROM `User` WHERE Username = :username OR Email = :email LIMIT 1"
-        result = db.session.execute(db.text(sql), {'username': create_form.username.data, 'email': create_form.email.data}).first()
+        result = execute('create_account.existing_user', {'username': create_form.username.data, 'email': create_form.email.data}).first()
         if result:
             flash('Username or email already exists', 'error')
             return redirect(url_for('main.create_account'))
@@ -77,8 +102,7 @@ def create_account():
         if gender == 'O':
             gender = None
 
-        insert_sql = "INSERT INTO `User` (Username, Gender, Email, Country, DOB) VALUES (:username, :gender, :email, :country, :dob)"
-        db.session.execute(db.text(insert_sql), {
+        execute('create_account.insert_user', {
             'username': create_form.username.data,
             'gender': gender if gender else None,
             'email': create_form.email.data,
@@ -97,8 +121,7 @@ def create_account():
 def login():
     login_form = LoginForm()
     if login_form.validate_on_submit():
-        sql = "SELECT Username FROM `User` WHERE Username = :username LIMIT 1"
-        result = db.session.execute(db.text(sql), {'username': login_form.username.data}).first()
+        result = execute('login.user', {'username': login_form.username.data}).first()
         if result:
             session['username'] = login_form.username.data
             flash(f'Welcome back, {login_form.username.data}!', 'success')
@@ -130,106 +153,26 @@ def games():
     offset = (page - 1) * per_page
 
     order_by = request.args.get('order_by', 'None')
+    selected = {facet_type: [value for value in request.args.getlist(facet_type) if value != 'All']
+                for facet_type in FILTERS}
+    selected = {facet_type: values for facet_type, values in selected.items() if values}
     year = request.args.get('year', 'All')
-    genre = request.args.get('genre', 'All')
-
-    where_conditions = []
-    having_conditions = []
-    params = {}
-
-    if year != 'All':
-        having_conditions.append("YEAR(MIN(gp.DateOfRelease)) = :year")
-        params['year'] = int(year)
-
-    if genre != 'All':
-        where_conditions.append("gg.Genre = :genre")
-        params['genre'] = genre
-
-    where_clause = " AND ".join(where_conditions)
-    if where_clause:
-        where_clause = "WHERE " + where_clause
-    else:
-        where_clause = ""
-
-    having_clause = " AND ".join(having_conditions)
-    if having_clause:
-        having_clause = "HAVING " + having_clause
-    else:
-        having_clause = ""
-
-    if order_by == 'MobyScore':
-        order_clause = "ORDER BY g.MobyScore DESC, g.`Name`"
-    elif order_by == 'CriticRating':
-        order_clause = "ORDER BY avg_critic DESC, g.`Name`"
-    elif order_by == 'UserRating':
-        order_clause = "ORDER BY avg_user DESC, g.`Name`"
-    else:
-        order_clause = "ORDER BY g.`Name`"
-
-    count_sql = f"""
-        SELECT COUNT(*) AS total
-        FROM (
-            SELECT DISTINCT g.ID
-            FROM Game g
-            {('LEFT JOIN GamesPlatform gp ON g.ID = gp.GameID' if (order_by != 'MobyScore' or year != 'All') else '')}
-            {('LEFT JOIN GameGenre gg ON g.ID = gg.GameID' if genre != 'All' else '')}
-            {where_clause}
-            {('GROUP BY g.ID' if year != 'All' or genre != 'All' else '')}
-            {having_clause}
-        ) AS distinct_games
-    """
-
-    total_result = db.session.execute(db.text(count_sql), params).first()
-    total_games = total_result.total if total_result else 0
-
-    if order_by != "MobyScore":
-        sql = f"""
-            SELECT 
-                g.ID,
-                g.CoverPhoto,
-                g.`Name`,
-                g.MobyScore,
-                AVG(gp.AvgCriticRatingPercentage) as avg_critic,
-                SUM(gp.TotalPlayerRating) / NULLIF(SUM(gp.NumPlayersRated), 0) as avg_user
-            FROM Game g
-            LEFT JOIN GamesPlatform gp ON g.ID = gp.GameID
-            {('LEFT JOIN GameGenre gg ON g.ID = gg.GameID' if genre != 'All' else '')}
-            {where_clause}
-            GROUP BY g.ID, g.CoverPhoto, g.`Name`, g.MobyScore
-            {having_clause}
-            {order_clause}
-            LIMIT :limit OFFSET :offset
-        """
-    else:
-        sql = f"""
-            SELECT 
-                g.ID,
-                g.CoverPhoto,
-                g.`Name`,
-                g.MobyScore
-            FROM Game g
-            {('LEFT JOIN GamesPlatform gp ON g.ID = gp.GameID' if year != 'All' else '')}
-            {('LEFT JOIN GameGenre gg ON g.ID = gg.GameID' if genre != 'All' else '')}
-            {where_clause}
-            {('GROUP BY g.ID, g.CoverPhoto, g.`Name`, g.MobyScore' if year != 'All' or genre != 'All' else '')}
-            {having_clause}
-            {order_clause}
-            LIMIT :limit OFFSET :offset
-        """
-
-    params['limit'] = per_page
-    params['offset'] = offset
-
-    games_result = db.session.execute(db.text(sql), params).fetchall()
-
-
-    years = [2020, 2021, 2022, 2023, 2024, 2025]
-
-
-    genres_sql = "SELECT `Name` FROM Genre ORDER BY `Name`"
-    genres_result = db.session.execute(db.text(genres_sql)).fetchall()
-    genres = [g.Name for g in genres_result]
-
+    year_from = request.args.get('year_from', type=int)
+    year_to = request.args.get('year_to', type=int)
+    if year != 'All' and year.isdigit():
+        year_from = year_to = int(year)
+    decade = request.args.get('decade', type=int)
+    # A decade narrows whatever explicit range was also chosen
+    lowest = max([bound for bound in (year_from, decade) if bound is not None], default=None)
+    highest = min([bound for bound in (year_to, decade + 9 if decade is not None else None) if bound is not None],
+                  default=None)
+
+    # A pager click only swaps the results grid, which needs no facet counts
+    with_counts = request.args.get('fragment') != 'results'
+    index = facet_index()
+    matches, counts = index.search(selected, lowest, highest, with_counts=with_counts)
+    games_result = page_games(index.page(matches, order_by, offset, per_page))
+    total_games = len(matches)
 
     total_pages = (total_games + per_page - 1) // per_page
     has_prev = page > 1
@@ -239,13 +182,25 @@ def games():
 
     pagination = PaginationInfo(games_result, page, total_pages, total_games, has_prev, has_next, prev_num, next_num)
 
-    return render_template('games.html',
-                           games=pagination,
-                           years=years,
-                           genres=genres,
-                           selected_order=order_by,
-                           selected_year=year,
-                           selected_genre=genre)
+    context = {}
+    if with_counts:
+        decade_counts = {}
+        for release_year, count in counts['year']:
+            decade_counts[release_year // 10 * 10] = decade_counts.get(release_year // 10 * 10, 0) + count
+        context = {
+            'facets': [(facet_type, facet_label(facet_type), counts[facet_type]) for facet_type in FILTERS],
+            'year_counts': counts['year'],
+            'decade_counts': sorted(decade_counts.items()),
+        }
+
+    return render_listing('games.html', GAMES_FRAGMENTS,
+                          games=pagination,
+                          selected_decade=decade,
+                          selected=selected,
+                          selected_order=order_by,
+                          year_from=year_from,
+                          year_to=year_to,
+                          **context)
 
 
 @main_blueprint.route('/directors')
@@ -257,20 +212,19 @@ def directors():
     page = request.args.get('page', 1, type=int)
     per_page = 20
     offset = (page - 1) * per_page
-
-    count_sql = "SELECT COUNT(*) AS total FROM Director"
-    total_result = db.session.execute(db.text(count_sql)).first()
+    sort = request.args.get('sort')
+    if sort not in DIRECTOR_SORTS:
+        sort = 'name'
+
+    listing = 'directors'
+    total_result = execute('directors.count').first()
+    # DirectorCounts is empty until `flask entity-counts rebuild` has run; aggregate live until then
+    if not total_result.total:
+        listing = 'directors.live'
+        total_result = execute('directors.live.count').first()
     total_directors = total_result.total if total_result else 0
 
-    sql = """
-    SELECT d.ID, d.`Name`, d.ProfilePicture, COUNT(*) AS games_num
-    FROM Director d INNER JOIN GameDirectors gd
-    ON d.ID = gd.DirectorID
-    GROUP BY 1, 2, 3
-    LIMIT :limit 
-    OFFSET :offset
-    """
-    games_result = db.session.execute(db.text(sql), {
+    games_result = execute(f'{listing}.page.{sort}', {
         'limit': per_page,
         'offset': offset
     }).fetchall()
@@ -287,7 +241,7 @@ def directors():
 
     pagination = PaginationInfo(games_result, page, total_pages, total_directors, has_prev, has_next, prev_num, next_num)
 
-    return render_template('directors.html', directors=pagination)
+    return render_template('directors.html', directors=pagination, sort=sort, sorts=DIRECTOR_SORTS)
 
 @main_blueprint.route('/companies')
 def companies():
@@ -298,22 +252,19 @@ def companies():
     page = request.args.get('page', 1, type=int)
     per_page = 20
     offset = (page - 1) * per_page
-
-    count_sql = "SELECT COUNT(*) AS total FROM Company"
-    total_result = db.session.execute(db.text(count_sql)).first()
+    sort = request.args.get('sort')
+    if sort not in COMPANY_SORTS:
+        sort = 'name'
+
+    listing = 'companies'
+    total_result = execute('companies.count').first()
+    # CompanyCounts is empty until `flask entity-counts rebuild` has run; aggregate live until then
+    if not total_result.total:
+        listing = 'companies.live'
+        total_result = execute('companies.live.count').first()
     total_companies = total_result.total if total_result else 0
 
-    sql = """
-    SELECT c.ID, c.`Name`, c.Logo, COUNT(DISTINCT cdg.GameID) AS developed_games_num, COUNT(DISTINCT cpg.GameID) AS published_games_num
-    FROM Company c LEFT JOIN CompanyDevelopGame cdg
-    ON c.ID = cdg.CompanyID
-    LEFT JOIN CompanyPublishGame cpg
-    ON c.ID = cpg.CompanyID
-    GROUP BY 1, 2, 3
-    LIMIT :limit 
-    OFFSET :offset
-    """
-    companies_result = db.session.execute(db.text(sql), {
+    companies_result = execute(f'{listing}.page.{sort}', {
         'limit': per_page,
         'offset': offset
     }).fetchall()
@@ -330,7 +281,7 @@ def companies():
 
     pagination = PaginationInfo(companies_result, page, total_pages, total_companies, has_prev, has_next, prev_num, next_num)
 
-    return render_template('companies.html', companies=pagination)
+    return render_template('companies.html', companies=pagination, sort=sort, sorts=COMPANY_SORTS)
 
 @main_blueprint.route('/platform')
 def platforms():
@@ -338,8 +289,7 @@ def platforms():
         flash('Please login first', 'warning')
         return redirect(url_for('main.login'))
 
-    platforms_sql = "SELECT `Name` FROM Platform"
-    platforms_result = db.session.execute(db.text(platforms_sql)).fetchall()
+    platforms_result = execute('platforms.names').fetchall()
     platforms = [platform.Name for platform in platforms_result]
 
     return render_template('platforms.html', platforms=platforms)
@@ -351,40 +301,31 @@ def game_genres():
         flash('Please login first', 'warning')
         return redirect(url_for('main.login'))
 
-    genres_sql = "SELECT `Name` FROM Genre"
-    genres_result = db.session.execute(db.text(genres_sql)).fetchall()
+    genres_result = execute('game_genres.genres').fetchall()
     genres = [genre.Name for genre in genres_result]
 
-    settings_sql = "SELECT `Name` FROM Setting"
-    settings_result = db.session.execute(db.text(settings_sql)).fetchall()
+    settings_result = execute('game_genres.settings').fetchall()
     settings = [setting.Name for setting in settings_result]
 
-    gameplays_sql = "SELECT `Name` FROM Gameplay"
-    gameplays_result = db.session.execute(db.text(gameplays_sql)).fetchall()
+    gameplays_result = execute('game_genres.gameplays').fetchall()
     gameplays = [gameplay.Name for gameplay in gameplays_result]
 
-    interfaces_sql = "SELECT `Name` FROM Interface"
-    interfaces_result = db.session.execute(db.text(interfaces_sql)).fetchall()
+    interfaces_result = execute('game_genres.interfaces').fetchall()
     interfaces = [interface.Name for interface in interfaces_result]
 
-    perspectives_sql = "SELECT `Name` FROM Perspective"
-    perspectives_result = db.session.execute(db.text(perspectives_sql)).fetchall()
+    perspectives_result = execute('game_genres.perspectives').fetchall()
     perspectives = [perspective.Name for perspective in perspectives_result]
 
-    visuals_sql = "SELECT `Name` FROM Visual"
-    visuals_result = db.session.execute(db.text(visuals_sql)).fetchall()
+    visuals_result = execute('game_genres.visuals').fetchall()
     visuals = [visual.Name for visual in visuals_result]
 
-    arts_sql = "SELECT `Name` FROM Art"
-    arts_result = db.session.execute(db.text(arts_sql)).fetchall()
+    arts_result = execute('game_genres.arts').fetchall()
     arts = [art.Name for art in arts_result]
 
-    narratives_sql = "SELECT `Name` FROM Narrative"
-    narratives_result = db.session.execute(db.text(narratives_sql)).fetchall()
+    narratives_result = execute('game_genres.narratives').fetchall()
     narratives = [narrative.Name for narrative in narratives_result]
 
-    pacings_sql = "SELECT `Name` FROM Pacing"
-    pacings_result = db.session.execute(db.text(pacings_sql)).fetchall()
+    pacings_result = execute('game_genres.pacings').fetchall()
     pacings = [pacing.Name for pacing in pacings_result]
 
     return render_template('game_genres.html',
@@ -409,23 +350,14 @@ def platform_games(platform_name):
     per_page = 20
     offset = (page - 1) * per_page
 
-    verify_sql = "SELECT COUNT(GameID) AS count FROM GamesPlatform WHERE PlatformName = :platform_name"
-    verify = db.session.execute(db.text(verify_sql), {'platform_name': platform_name}).first()
+    verify = execute('platform_games.verify', {'platform_name': platform_name}).first()
     if not verify or verify.count == 0:
         flash('Platform not found', 'error')
         return redirect(url_for('main.platforms'))
 
     total_games = verify.count
 
-    games_sql = """
-        SELECT g.ID, g.`Name`, g.CoverPhoto, g.MobyScore
-        FROM Game g
-        INNER JOIN GamesPlatform gp ON g.ID = gp.GameID
-        WHERE gp.PlatformName = :platform_name
-        ORDER BY g.`Name`
-        LIMIT :limit OFFSET :offset
-    """
-    games = db.session.execute(db.text(games_sql), {
+    games = execute('platform_games.games', {
         'platform_name': platform_name,
         'limit': per_page,
         'offset': offset
@@ -442,7 +374,7 @@ def platform_games(platform_name):
 
     pagination = PaginationInfo(games, page, total_pages, total_games, has_prev, has_next, prev_num, next_num)
 
-    return render_template('platform_games.html',
+    return render_listing('platform_games.html', RESULTS_FRAGMENTS,
                           platform_name=platform_name,
                           games=pagination)
 
@@ -464,34 +396,16 @@ def genre_games(genre_type, name):
         flash('Invalid genre type', 'error')
         return redirect(url_for('main.game_genres'))
 
-    table_name = genre_type.title()
-
-    verify_sql = f"SELECT COUNT(*) AS count FROM {table_name} WHERE `Name` = :name"
-    verify = db.session.execute(db.text(verify_sql), {'name': name}).first()
+    verify = execute(f'genre_games.verify.{genre_type}', {'name': name}).first()
 
     if not verify or verify.count == 0:
         flash(f'{name} not found', 'error')
         return redirect(url_for('main.game_genres'))
 
-    game_table = "Game" + table_name
-
-    count_sql = f"""
-        SELECT COUNT(GameID) as total 
-        FROM {game_table}
-        WHERE {table_name} = :name
-    """
-    total_result = db.session.execute(db.text(count_sql), {'name': name}).first()
+    total_result = execute(f'genre_games.count.{genre_type}', {'name': name}).first()
     total_games = total_result.total if total_result else 0
 
-    games_sql = f"""
-        SELECT g.ID, g.`Name`, g.CoverPhoto, g.MobyScore
-        FROM Game g
-        INNER JOIN {game_table} gt ON g.ID = gt.GameID
-        WHERE gt.{table_name} = :name
-        ORDER BY g.`Name`
-        LIMIT :limit OFFSET :offset
-    """
-    games = db.session.execute(db.text(games_sql), {
+    games = execute(f'genre_games.games.{genre_type}', {
         'name': name,
         'limit': per_page,
         'offset': offset
@@ -506,155 +420,143 @@ def genre_games(genre_type, name):
 
     pagination = PaginationInfo(games, page, total_pages, total_games, has_prev, has_next, prev_num, next_num)
 
-    return render_template('genre_games.html',
-                           genre_type=genre_type,
-                           genre_name=name,
-                           games=pagination)
+    return render_listing('genre_games.html', RESULTS_FRAGMENTS,
+                          genre_type=genre_type,
+                          genre_name=name,
+                          games=pagination)
 
 # Individual Entity Pages
 
-@main_blueprint.route('/game/<int:game_id>')
-def game_detail(game_id):
-    if 'username' not in session:
-        flash('Please login first', 'warning')
-        return redirect(url_for('main.login'))
-
-    game_sql = "SELECT ID, `Name`, Site, MobyScore, CoverPhoto, `Description` FROM Game WHERE ID = :game_id LIMIT 1"
-    game = db.session.execute(db.text(game_sql), {'game_id': game_id}).first()
+def game_document(game_id):
+    game = fetch_first('game_document.game', {'game_id': game_id})
 
     if not game:
-        flash('Game not found', 'error')
-        return redirect(url_for('main.games'))
+        return None
 
-    arts_sql = "SELECT Art FROM GameArt WHERE GameID = :game_id"
-    arts = db.session.execute(db.text(arts_sql), {'game_id': game_id}).fetchall()
+    arts = fetch_all('game_document.arts', {'game_id': game_id})
     arts = [art.Art for art in arts]
 
-    gameplay_sql = "SELECT Gameplay FROM GameGameplay WHERE GameID = :game_id"
-    gameplays = db.session.execute(db.text(gameplay_sql), {'game_id': game_id}).fetchall()
+    gameplays = fetch_all('game_document.gameplay', {'game_id': game_id})
     gameplays = [g.Gameplay for g in gameplays]
 
-    narrative_sql = "SELECT Narrative FROM GameNarrative WHERE GameID = :game_id"
-    narratives = db.session.execute(db.text(narrative_sql), {'game_id': game_id}).fetchall()
+    narratives = fetch_all('game_document.narrative', {'game_id': game_id})
     narratives = [n.Narrative for n in narratives]
 
-    visual_sql = "SELECT Visual FROM GameVisual WHERE GameID = :game_id"
-    visuals = db.session.execute(db.text(visual_sql), {'game_id': game_id}).fetchall()
+    visuals = fetch_all('game_document.visual', {'game_id': game_id})
     visuals = [v.Visual for v in visuals]
 
-    perspective_sql = "SELECT Perspective FROM GamePerspective WHERE GameID = :game_id"
-    perspectives = db.session.execute(db.text(perspective_sql), {'game_id': game_id}).fetchall()
+    perspectives = fetch_all('game_document.perspective', {'game_id': game_id})
     perspectives = [p.Perspective for p in perspectives]
 
-    genre_sql = "SELECT Genre FROM GameGenre WHERE GameID = :game_id"
-    genres = db.session.execute(db.text(genre_sql), {'game_id': game_id}).fetchall()
+    genres = fetch_all('game_document.genre', {'game_id': game_id})
     genres = [g.Genre for g in genres]
 
-    interface_sql = "SELECT Interface FROM GameInterface WHERE GameID = :game_id"
-    interfaces = db.session.execute(db.text(interface_sql), {'game_id': game_id}).fetchall()
+    interfaces = fetch_all('game_document.interface', {'game_id': game_id})
     interfaces = [i.Interface for i in interfaces]
 
-    pacing_sql = "SELECT Pacing FROM GamePacing WHERE GameID = :game_id"
-    pacings = db.session.execute(db.text(pacing_sql), {'game_id': game_id}).fetchall()
+    pacings = fetch_all('game_document.pacing', {'game_id': game_id})
     pacings = [p.Pacing for p in pacings]
 
-    setting_sql = "SELECT Setting FROM GameSetting WHERE GameID = :game_id"
-    settings = db.session.execute(db.text(setting_sql), {'game_id': game_id}).fetchall()
+    settings = fetch_all('game_document.setting', {'game_id': game_id})
     settings = [s.Setting for s in settings]
 
-    release_sql = "SELECT MIN(DateOfRelease) as FirstRelease FROM GamesPlatform WHERE GameID = :game_id AND DateOfRelease IS NOT NULL"
-    first_release = db.session.execute(db.text(release_sql), {'game_id': game_id}).first()
-    first_release_date = first_release.FirstRelease if first_release and first_release.FirstRelease else None
-
-    dev_sql = """
-        SELECT c.ID, c.`Name`, c.Logo
-        FROM Company c
-        INNER JOIN CompanyDevelopGame cdg ON c.ID = cdg.CompanyID
-        WHERE cdg.GameID = :game_id
-    """
-    developers = db.session.execute(db.text(dev_sql), {'game_id': game_id}).fetchall()
+    first_release_date = first_release(game_id)
+
+    developers = fetch_all('game_document.developers', {'game_id': game_id})
     developers = [{'id': d.ID, 'name': d.Name, 'logo': d.Logo} for d in developers]
 
-    pub_sql = """
-        SELECT c.ID, c.`Name`, c.Logo
-        FROM Company c
-        INNER JOIN CompanyPublishGame cpg ON c.ID = cpg.CompanyID
-        WHERE cpg.GameID = :game_id
-    """
-    publishers = db.session.execute(db.text(pub_sql), {'game_id': game_id}).fetchall()
+    publishers = fetch_all('game_document.publishers', {'game_id': game_id})
     publishers = [{'id': p.ID, 'name': p.Name, 'logo': p.Logo} for p in publishers]
 
-    user_rating_sql = "SELECT Rating, PlatformName FROM UserRatings WHERE Username = :username AND GameID = :game_id LIMIT 1"
-    user_rating = db.session.execute(db.text(user_rating_sql), {
-        'username': session.get('username'),
-        'game_id': game_id
-    }).first()
-    platform = user_rating.PlatformName if user_rating else None
-    user_rating = user_rating.Rating if user_rating else None
-
-    avg_critic_sql = "SELECT AVG(AvgCriticRatingPercentage) as AvgCritic FROM GamesPlatform WHERE GameID = :game_id AND AvgCriticRatingPercentage IS NOT NULL"
-    avg_critic = db.session.execute(db.text(avg_critic_sql), {'game_id': game_id}).first()
+    avg_critic = fetch_first('game_document.avg_critic', {'game_id': game_id})
     avg_critic_rating = round(avg_critic.AvgCritic, 1) if avg_critic and avg_critic.AvgCritic else None
 
-    avg_user_sql = """
-        SELECT 
-            SUM(TotalPlayerRating) as TotalRating,
-            SUM(NumPlayersRated) as TotalPlayers
-        FROM GamesPlatform
-        WHERE GameID = :game_id
-    """
-    avg_user = db.session.execute(db.text(avg_user_sql), {'game_id': game_id}).first()
+    avg_user = fetch_first('game_document.avg_user', {'game_id': game_id})
     avg_user_rating = None
     if avg_user and avg_user.TotalRating and avg_user.TotalPlayers and avg_user.TotalPlayers > 0:
         avg_user_rating = round(avg_user.TotalRating / avg_user.TotalPlayers, 1)
 
-    director_sql = """
-        SELECT d.ID, d.`Name`
-        FROM Director d
-        INNER JOIN GameDirectors gd ON d.ID = gd.DirectorID
-        WHERE gd.GameID = :game_id
-    """
-    directors = db.session.execute(db.text(director_sql), {'game_id': game_id}).fetchall()
+    directors = fetch_all('game_document.director', {'game_id': game_id})
+
+    return {'game': game,
+            'arts': arts,
+            'gameplays': gameplays,
+            'narratives': narratives,
+            'visuals': visuals,
+            'perspectives': perspectives,
+            'genres': genres,
+            'interfaces': interfaces,
+            'pacings': pacings,
+            'settings': settings,
+            'first_release_date': first_release_date,
+            'developers': developers,
+            'publishers': publishers,
+            'avg_critic_rating': avg_critic_rating,
+            'avg_user_rating': avg_user_rating,
+            'directors': directors}
 
-    return render_template('game.html',
-                           game=game,
-                           arts=arts,
-                           gameplays=gameplays,
-                           narratives=narratives,
-                           visuals=visuals,
-                           perspectives=perspectives,
-                           genres=genres,
-                           interfaces=interfaces,
-                           pacings=pacings,
-                           settings=settings,
-                           first_release_date=first_release_date,
-                           developers=developers,
-                           publishers=publishers,
-                           user_rating=user_rating,
-                           platform_name=platform,
-                           avg_critic_rating=avg_critic_rating,
-                           avg_user_rating=avg_user_rating,
-                           directors=directors)
+
+@main_blueprint.route('/game/<int:game_id>')
+def game_detail(game_id):
+    if 'username' not in session and not prerendering():
+        flash('Please login first', 'warning')
+        return redirect(url_for('main.login'))
+
+    document = cached_document('game', game_id, lambda: game_document(game_id))
+    if not document:
+        flash('Game not found', 'error')
+        return redirect(url_for('main.games'))
+
+    user_rating, platform = None, None
+    if not prerendering():
+        user_rating, platform = own_rating(game_id)
+
+    return stream_page('game.html',
+                       user_rating=user_rating,
+                       platform_name=platform,
+                       similar_games=similar_games(game_id),
+                       **document)
+
+
+def own_rating(game_id):
+    user_rating = execute('game_detail.user_rating', {
+        'username': session.get('username'),
+        'game_id': game_id
+    }).first()
+    if not user_rating:
+        return None, None
+    return user_rating.Rating, user_rating.PlatformName
+
+
+# Per-user regions of pre-rendered pages, loaded by static/js/includes.js
+
+@main_blueprint.route('/game/<int:game_id>/my-rating')
+def game_rating_fragment(game_id):
+    user_rating, platform = own_rating(game_id) if 'username' in session else (None, None)
+    return render_fragment('fragments/game_rating.html', game_id=game_id, user_rating=user_rating,
+                           platform_name=platform)
+
+
+@main_blueprint.route('/fragments/session')
+def session_fragment():
+    return render_fragment('fragments/session.html')
 
 
 @main_blueprint.route('/game/<int:game_id>/add-rating', methods=['GET', 'POST'])
+@route_class('write')
+@rate_limited('rating', methods=('POST',))
+@uses_primary
 def add_rating(game_id):
     if 'username' not in session:
         flash('Please login first', 'warning')
         return redirect(url_for('main.login'))
 
-    game_sql = "SELECT ID, `Name` FROM Game WHERE ID = :game_id LIMIT 1"
-    game = db.session.execute(db.text(game_sql), {'game_id': game_id}).first()
+    game = execute('add_rating.game', {'game_id': game_id}).first()
     if not game:
         flash('Game not found', 'error')
         return redirect(url_for('main.games'))
 
-    platforms_sql = """
-        SELECT PlatformName FROM GamesPlatform
-        WHERE GameID = :game_id
-        ORDER BY PlatformName
-    """
-    platforms_result = db.session.execute(db.text(platforms_sql), {'game_id': game_id}).fetchall()
+    platforms_result = execute('add_rating.platforms', {'game_id': game_id}).fetchall()
     platforms = [(p.PlatformName, p.PlatformName) for p in platforms_result]
 
     rate_form = RateForm()
@@ -664,12 +566,7 @@ def add_rating(game_id):
         rating = rate_form.rating.data
         platform = rate_form.platform.data
 
-        check_sql = """
-            SELECT Rating, PlatformName FROM UserRatings
-            WHERE Username = :username AND GameID = :game_id
-            LIMIT 1
-        """
-        existing = db.session.execute(db.text(check_sql), {
+        existing = execute('add_rating.check', {
             'username': session.get('username'),
             'game_id': game_id
         }).first()
@@ -679,46 +576,27 @@ def add_rating(game_id):
                 old_rating = float(existing.Rating)
                 old_platform = existing.PlatformName
 
-                remove_old_sql = """
-                    UPDATE GamesPlatform
-                    SET TotalPlayerRating = TotalPlayerRating - :old_rating,
-                        NumPlayersRated = NumPlayersRated - 1
-                    WHERE GameID = :game_id AND PlatformName = :platform
-                """
-                db.session.execute(db.text(remove_old_sql), {
+                execute('add_rating.remove_old', {
                     'old_rating': old_rating,
                     'game_id': game_id,
                     'platform': old_platform
                 })
 
-                set_null_sql = """
-                    UPDATE GamesPlatform
-                    SET TotalPlayerRating = NULL, NumPlayersRated = NULL
-                    WHERE GameID = :game_id AND PlatformName = :platform AND NumPlayersRated <= 0
-                """
-                db.session.execute(db.text(set_null_sql), {
+                execute('add_rating.set_null', {
                     'game_id': game_id,
                     'platform': old_platform
                 })
 
-                add_sql = """
-                    UPDATE GamesPlatform
-                    SET TotalPlayerRating = COALESCE(TotalPlayerRating, 0) + :new_rating,
-                        NumPlayersRated = COALESCE(NumPlayersRated, 0) + 1
-                    WHERE GameID = :game_id AND PlatformName = :platform
-                """
-                db.session.execute(db.text(add_sql), {
+                execute('add_rating.add', {
                     'new_rating': float(rating),
                     'game_id': game_id,
                     'platform': platform
                 })
 
-                update_sql = """
-                    UPDATE UserRatings
-                    SET Rating = :new_rating, PlatformName = :new_platform
-                    WHERE Username = :username AND GameID = :game_id
-                """
-                db.session.execute(db.text(update_sql), {
+                apply_rating(game_id, old_platform, -old_rating, -1)
+                apply_rating(game_id, platform, float(rating), 1)
+
+                execute('add_rating.update', {
                     'new_rating': rating,
                     'new_platform': platform,
                     'username': session.get('username'),
@@ -727,23 +605,14 @@ def add_rating(game_id):
                 flash('Rating and platform updated successfully!', 'success')
 
             else:
-                add_sql = """
-                    UPDATE GamesPlatform
-                    SET TotalPlayerRating = COALESCE(TotalPlayerRating, 0) + :new_rating,
-                        NumPlayersRated = COALESCE(NumPlayersRated, 0) + 1
-                    WHERE GameID = :game_id AND PlatformName = :platform
-                """
-                db.session.execute(db.text(add_sql), {
+                execute('add_rating.add', {
                     'new_rating': float(rating),
                     'game_id': game_id,
                     'platform': platform
                 })
+                apply_rating(game_id, platform, float(rating), 1)
 
-                insert_sql = """
-                    INSERT INTO UserRatings (Username, PlatformName, GameID, Rating)
-                    VALUES (:username, :platform, :game_id, :rating)
-                """
-                db.session.execute(db.text(insert_sql), {
+                execute('add_rating.insert', {
                     'username': session.get('username'),
                     'platform': platform,
                     'game_id': game_id,
@@ -751,16 +620,30 @@ def add_rating(game_id):
                 })
                 flash('Rating added successfully!', 'success')
 
+            invalidate_rating(game_id, [platform, existing.PlatformName] if existing else [platform])
+            append_rating(session.get('username'), game_id, platform, rating, existing)
             db.session.commit()
-            return redirect(url_for('main.game_detail', game_id=game_id))
 
         except Exception as e:
             db.session.rollback()
             flash(f'Error saving rating: {str(e)}', 'error')
             return redirect(url_for('main.add_rating', game_id=game_id))
 
+        # The rating is saved; if journalling it fails, recommendations pick it up at the next build
+        record_rating(session.get('username'), game_id, existing.Rating if existing else None, rating)
+        return redirect(url_for('main.game_detail', game_id=game_id))
+
     return render_template('rate.html', form=rate_form, game=game)
 
+@main_blueprint.route('/recommendations')
+def recommendations():
+    if 'username' not in session:
+        flash('Please login first', 'warning')
+        return redirect(url_for('main.login'))
+
+    games = recommend_games(session.get('username'), current_app.config['RECOMMENDATIONS_COUNT'])
+    return render_template('recommendations.html', games=games)
+
 @main_blueprint.route('/ratings/<string:username>')
 def ratings(username):
     if 'username' not in session:
@@ -775,19 +658,10 @@ def ratings(username):
     per_page = 20
     offset = (page - 1) * per_page
 
-    count_sql = "SELECT COUNT(*) AS total FROM UserRatings INNER JOIN Game ON GameID = ID WHERE Username = :username"
-    total_result = db.session.execute(db.text(count_sql), {'username': username}).first()
+    total_result = execute('ratings.count', {'username': username}).first()
     total_games = total_result.total if total_result else 0
 
-    games_sql = """
-    SELECT ur.Rating, g.ID, g.`Name`, g.CoverPhoto
-    FROM UserRatings ur INNER JOIN Game g
-    ON ur.GameID = g.ID
-    WHERE ur.Username = :username
-    LIMIT :limit
-    OFFSET :offset
-    """
-    games_result = db.session.execute(db.text(games_sql), {'username': username, 'limit':per_page, 'offset':offset}).fetchall()
+    games_result = execute('ratings.games', {'username': username, 'limit':per_page, 'offset':offset}).fetchall()
 
     total_pages = (total_games + per_page - 1) // per_page
     has_prev = page > 1
@@ -801,7 +675,37 @@ def ratings(username):
 
     pagination = PaginationInfo(games_result, page, total_pages, total_games, has_prev, has_next, prev_num, next_num)
 
-    return render_template('ratings.html', games=pagination, username=username)
+    return render_listing('ratings.html', RESULTS_FRAGMENTS, games=pagination, username=username,
+                          score_field='Rating', score_scale=5)
+
+@main_blueprint.route('/ratings/<string:username>/export.<string:fmt>')
+@route_class('heavy')
+def export_ratings(username, fmt):
+    if 'username' not in session:
+        flash('Please login first', 'warning')
+        return redirect(url_for('main.login'))
+
+    if session.get('username') != username:
+        flash('Unauthorized access', 'warning')
+        return redirect(url_for('main.games'))
+
+    formats = {
+        'csv': (csv_lines, 'text/csv'),
+        'json': (json_lines, 'application/json'),
+    }
+    if fmt not in formats:
+        flash('Unsupported export format', 'error')
+        return redirect(url_for('main.ratings', username=username))
+
+    lines, mimetype = formats[fmt]
+    rows = user_rating_rows(username, batch_size=500)
+    response = Response(stream_with_context(lines(rows)), mimetype=mimetype)
+    # Usernames may hold quotes or non-Latin-1 characters: an ASCII fallback plus the RFC 5987 form
+    ascii_name = secure_filename(username)
+    fallback = f'{ascii_name}-ratings.{fmt}' if ascii_name else f'ratings.{fmt}'
+    response.headers['Content-Disposition'] = (
+        f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(username, safe='')}-ratings.{fmt}")
+    return response
 
 @main_blueprint.route('/game/<int:game_id>/releases')
 def game_releases(game_id):
@@ -809,42 +713,25 @@ def game_releases(game_id):
         flash('Please login first', 'warning')
         return redirect(url_for('main.login'))
 
-    game_sql = "SELECT ID, `Name` FROM Game WHERE ID = :game_id LIMIT 1"
-    game = db.session.execute(db.text(game_sql), {'game_id': game_id}).first()
+    game = execute('game_releases.game', {'game_id': game_id}).first()
 
     if not game:
         flash('Game not found', 'error')
         return redirect(url_for('main.games'))
 
-    releases_sql = """
-        SELECT gp.GameID, gp.PlatformName, gp.DateOfRelease, gp.BusinessModel, gp.MaturityRating, gp.TotalPlayerRating,
-            gp.NumPlayersRated, gp.AvgCriticRatingPercentage, gp.Price
-        FROM GamesPlatform gp
-        WHERE gp.GameID = :game_id
-        ORDER BY gp.DateOfRelease , gp.PlatformName
-    """
-
-    releases_result = db.session.execute(db.text(releases_sql), {
+    releases_result = execute('game_releases.releases', {
         'game_id': game_id
     }).fetchall()
 
     releases = []
     for release in releases_result:
-        media_types_sql = """
-            SELECT MediaType FROM GamesPlatformMediaType
-            WHERE GameID = :game_id AND PlatformName = :platform_name
-        """
-        media_types_result = db.session.execute(db.text(media_types_sql), {
+        media_types_result = execute('game_releases.media_types', {
             'game_id': game_id,
             'platform_name': release.PlatformName
         }).fetchall()
         media_types = [mt.MediaType for mt in media_types_result]
 
-        input_devices_sql = """
-            SELECT InputDevice FROM GamesPlatformInputDevice
-            WHERE GameID = :game_id AND PlatformName = :platform_name
-        """
-        input_devices_result = db.session.execute(db.text(input_devices_sql), {
+        input_devices_result = execute('game_releases.input_devices', {
             'game_id': game_id,
             'platform_name': release.PlatformName
         }).fetchall()
@@ -871,32 +758,21 @@ def game_releases(game_id):
                            releases=releases)
 
 
-@main_blueprint.route('/director/<int:director_id>')
-def director_detail(director_id):
-    if 'username' not in session:
-        flash('Please login first', 'warning')
-        return redirect(url_for('main.login'))
+def rolled_up_averages(kind, key, statement, params):
+    # Entities without a rollup row yet are aggregated live
+    return averages(kind, key) or execute(statement, params).first()
 
-    director_sql = "SELECT ID, `Name`, ProfilePicture, Biography FROM Director WHERE ID = :director_id LIMIT 1"
-    director = db.session.execute(db.text(director_sql), {'director_id': director_id}).first()
+
+def director_document(director_id):
+    director = execute('director_document.director', {'director_id': director_id}).first()
 
     if not director:
-        flash('Director not found', 'error')
-        return redirect(url_for('main.directors'))
+        return None
 
-    dir_count_sql = "SELECT COUNT(*) as count FROM GameDirectors WHERE DirectorID = :director_id"
-    dir_count = db.session.execute(db.text(dir_count_sql), {"director_id": director_id}).first()
+    dir_count = execute('director_document.game_count', {"director_id": director_id}).first()
     num_games_directed = dir_count.count if dir_count else 0
 
-    dir_sql = """
-        SELECT AVG(gp.AvgCriticRatingPercentage) as AvgCritic,
-        SUM(gp.TotalPlayerRating) / NULLIF(SUM(gp.NumPlayersRated), 0) as AvgUser
-        FROM GamesPlatform gp
-        INNER JOIN GameDirectors gd ON gd.GameID = gp.GameID
-        WHERE gd.DirectorID = :director_id
-        """
-
-    dir = db.session.execute(db.text(dir_sql), {'director_id': director_id}).first()
+    dir = rolled_up_averages('director', director_id, 'director_document.averages', {'director_id': director_id})
 
     dir_avg_critic = dir.AvgCritic if dir and dir.AvgCritic else None
     dir_avg_critic = round(dir_avg_critic, 1) if dir_avg_critic else None
@@ -905,18 +781,7 @@ def director_detail(director_id):
     if dir and dir.AvgUser and dir.AvgUser > 0:
         dir_avg_user = round(dir.AvgUser, 1)
 
-    directed_games_sql = """
-        SELECT 
-            g.ID,
-            g.Name,
-            g.CoverPhoto,
-            g.MobyScore
-        FROM Game g
-        INNER JOIN GameDirectors gd ON g.ID = gd.GameID
-        WHERE gd.DirectorID = :director_id
-        """
-
-    directed_games_result = db.session.execute(db.text(directed_games_sql), {'director_id': director_id})
+    directed_games_result = execute('director_document.directed_games', {'director_id': director_id})
     directed_games = []
     for game in directed_games_result:
         directed_games.append({
@@ -926,47 +791,44 @@ def director_detail(director_id):
             'score': game.MobyScore
         })
 
-    websites_sql = "SELECT URL FROM DirectorWebsites WHERE DirectorID = :director_id"
-    websites_result = db.session.execute(db.text(websites_sql), {'director_id': director_id})
+    websites_result = execute('director_document.websites', {'director_id': director_id})
     websites = [w.URL for w in websites_result]
 
-    return render_template("director.html",
-                           director=director,
-                           num_games_directed=num_games_directed,
-                           dir_avg_critic_rating=dir_avg_critic,
-                           dir_avg_user_rating=dir_avg_user,
-                           directed_games=directed_games,
-                           websites=websites)
+    return {'director': director,
+            'num_games_directed': num_games_directed,
+            'dir_avg_critic_rating': dir_avg_critic,
+            'dir_avg_user_rating': dir_avg_user,
+            'directed_games': directed_games,
+            'websites': websites}
 
-@main_blueprint.route('/company/<int:company_id>')
-def company_detail(company_id):
-    if 'username' not in session:
+
+@main_blueprint.route('/director/<int:director_id>')
+def director_detail(director_id):
+    if 'username' not in session and not prerendering():
         flash('Please login first', 'warning')
         return redirect(url_for('main.login'))
 
-    company_sql = "SELECT ID, `Name`, Logo, Overview, Country FROM Company WHERE ID = :company_id LIMIT 1"
-    company = db.session.execute(db.text(company_sql), {'company_id': company_id}).first()
+    document = cached_document('director', director_id, lambda: director_document(director_id))
+    if not document:
+        flash('Director not found', 'error')
+        return redirect(url_for('main.directors'))
+
+    return render_template("director.html", **document)
+
+
+def company_document(company_id):
+    company = execute('company_document.company', {'company_id': company_id}).first()
 
     if not company:
-        flash('Company not found', 'error')
-        return redirect(url_for('main.companies'))
+        return None
 
-    dev_count_sql = "SELECT COUNT(*) as count FROM CompanyDevelopGame WHERE CompanyID = :company_id"
-    dev_count = db.session.execute(db.text(dev_count_sql), {'company_id': company_id}).first()
+    dev_count = execute('company_document.developed_count', {'company_id': company_id}).first()
     num_games_developed = dev_count.count if dev_count else 0
 
-    pub_count_sql = "SELECT COUNT(*) as count FROM CompanyPublishGame WHERE CompanyID = :company_id"
-    pub_count = db.session.execute(db.text(pub_count_sql), {'company_id': company_id}).first()
+    pub_count = execute('company_document.published_count', {'company_id': company_id}).first()
     num_games_published = pub_count.count if pub_count else 0
 
-    dev_sql = """
-        SELECT AVG(gp.AvgCriticRatingPercentage) as AvgCritic,
-        SUM(gp.TotalPlayerRating) / NULLIF(SUM(gp.NumPlayersRated), 0) as AvgUser
-        FROM GamesPlatform gp
-        INNER JOIN CompanyDevelopGame cdg ON gp.GameID = cdg.GameID
-        WHERE cdg.CompanyID = :company_id
-    """
-    dev = db.session.execute(db.text(dev_sql), {'company_id': company_id}).first()
+    dev = rolled_up_averages('developer', company_id, 'company_document.developer_averages', {'company_id': company_id})
     dev_avg_critic = dev.AvgCritic if dev and dev.AvgCritic else None
     dev_avg_critic = round(dev_avg_critic, 1) if dev_avg_critic else None
 
@@ -974,14 +836,7 @@ def company_detail(company_id):
     if dev and dev.AvgUser and dev.AvgUser > 0:
         dev_avg_user = round(dev.AvgUser, 1)
 
-    pub_sql = """
-        SELECT AVG(gp.AvgCriticRatingPercentage) as AvgCritic, 
-        SUM(gp.TotalPlayerRating) / NULLIF(SUM(gp.NumPlayersRated), 0) as AvgUser
-        FROM GamesPlatform gp
-        INNER JOIN CompanyPublishGame cpg ON gp.GameID = cpg.GameID
-        WHERE cpg.CompanyID = :company_id
-    """
-    pub = db.session.execute(db.text(pub_sql), {'company_id': company_id}).first()
+    pub = rolled_up_averages('publisher', company_id, 'company_document.publisher_averages', {'company_id': company_id})
     pub_avg_critic = pub.AvgCritic if pub and pub.AvgCritic else None
     pub_avg_critic = round(pub_avg_critic, 1) if pub_avg_critic else None
 
@@ -989,17 +844,7 @@ def company_detail(company_id):
     if pub and pub.AvgUser and pub.AvgUser > 0:
         pub_avg_user = round(pub.AvgUser, 1)
 
-    developed_games_sql = """
-        SELECT 
-            g.ID,
-            g.Name,
-            g.CoverPhoto,
-            g.MobyScore
-        FROM Game g
-        INNER JOIN CompanyDevelopGame cdg ON g.ID = cdg.GameID
-        WHERE cdg.CompanyID = :company_id
-    """
-    developed_games_result = db.session.execute(db.text(developed_games_sql), {'company_id': company_id}).fetchall()
+    developed_games_result = execute('company_document.developed_games', {'company_id': company_id}).fetchall()
     developed_games = []
     for game in developed_games_result:
         developed_games.append({
@@ -1010,17 +855,7 @@ def company_detail(company_id):
         })
 
 
-    published_games_sql = """
-        SELECT 
-            g.ID,
-            g.Name,
-            g.CoverPhoto,
-            g.MobyScore
-        FROM Game g
-        INNER JOIN CompanyPublishGame cpg ON g.ID = cpg.GameID
-        WHERE cpg.CompanyID = :company_id
-    """
-    published_games_result = db.session.execute(db.text(published_games_sql), {'company_id': company_id}).fetchall()
+    published_games_result = execute('company_document.published_games', {'company_id': company_id}).fetchall()
     published_games = []
     for game in published_games_result:
         published_games.append({
@@ -1030,45 +865,44 @@ def company_detail(company_id):
             'score': game.MobyScore
         })
 
-    websites_sql = "SELECT URL FROM CompanyWebsites WHERE CompanyID = :company_id"
-    websites_result = db.session.execute(db.text(websites_sql), {'company_id': company_id}).fetchall()
+    websites_result = execute('company_document.websites', {'company_id': company_id}).fetchall()
     websites = [w.URL for w in websites_result]
 
-    return render_template('company.html',
-                           company=company,
-                           num_games_developed=num_games_developed,
-                           num_games_published=num_games_published,
-                           dev_avg_critic_rating=dev_avg_critic,
-                           pub_avg_critic_rating=pub_avg_critic,
-                           dev_avg_user_rating=dev_avg_user,
-                           pub_avg_user_rating=pub_avg_user,
-                           developed_games=developed_games,
-                           published_games=published_games,
-                           websites=websites)
+    return {'company': company,
+            'num_games_developed': num_games_developed,
+            'num_games_published': num_games_published,
+            'dev_avg_critic_rating': dev_avg_critic,
+            'pub_avg_critic_rating': pub_avg_critic,
+            'dev_avg_user_rating': dev_avg_user,
+            'pub_avg_user_rating': pub_avg_user,
+            'developed_games': developed_games,
+            'published_games': published_games,
+            'websites': websites}
 
 
-@main_blueprint.route('/platform/<path:platform_name>')
-def platform_detail(platform_name):
-    if 'username' not in session:
+@main_blueprint.route('/company/<int:company_id>')
+def company_detail(company_id):
+    if 'username' not in session and not prerendering():
         flash('Please login first', 'warning')
         return redirect(url_for('main.login'))
-    platform_name = unquote(platform_name)
 
-    available_count_sql = "SELECT COUNT(GameID) AS count FROM GamesPlatform WHERE PlatformName = :platform_name"
-    available_count = db.session.execute(db.text(available_count_sql), {'platform_name': platform_name}).first()
+    document = cached_document('company', company_id, lambda: company_document(company_id))
+    if not document:
+        flash('Company not found', 'error')
+        return redirect(url_for('main.companies'))
+
+    return render_template('company.html', **document)
+
+
+def platform_document(platform_name):
+    available_count = execute('platform_document.game_count', {'platform_name': platform_name}).first()
     if not available_count:
-        flash('Platform not found', 'error')
-        return redirect(url_for('main.platforms'))
+        return None
 
     num_games_available = available_count.count if available_count else 0
 
-    platform_sql = """
-            SELECT AVG(AvgCriticRatingPercentage) as AvgCritic, 
-            SUM(TotalPlayerRating) / NULLIF(SUM(NumPlayersRated), 0) as AvgUser
-            FROM GamesPlatform
-            WHERE PlatformName = :platform_name
-        """
-    platform_result = db.session.execute(db.text(platform_sql), {'platform_name': platform_name}).first()
+    platform_result = rolled_up_averages('platform', platform_name, 'platform_document.averages',
+                                         {'platform_name': platform_name})
     avg_critic_rating = round(platform_result.AvgCritic,
                               1) if platform_result and platform_result.AvgCritic else None
 
@@ -1084,13 +918,27 @@ def platform_detail(platform_name):
         'avg_user': avg_user_rating
     }
 
+    return {'platform': platform}
+
+
+@main_blueprint.route('/platform/<path:platform_name>')
+def platform_detail(platform_name):
+    if 'username' not in session and not prerendering():
+        flash('Please login first', 'warning')
+        return redirect(url_for('main.login'))
+    platform_name = unquote(platform_name)
+
+    document = cached_document('platform', platform_name, lambda: platform_document(platform_name))
+    if not document:
+        flash('Platform not found', 'error')
+        return redirect(url_for('main.platforms'))
 
-    return render_template('platform.html', platform=platform)
+    return render_template('platform.html', **document)
 
 
 @main_blueprint.route('/game_genres/<string:genre_type>/<path:name>')
 def genre_detail(genre_type, name):
-    if 'username' not in session:
+    if 'username' not in session and not prerendering():
         flash('Please login first', 'warning')
         return redirect(url_for('main.login'))
 
@@ -1101,35 +949,16 @@ def genre_detail(genre_type, name):
         flash('Invalid genre type', 'error')
         return redirect(url_for('main.game_genres'))
 
-    table_name = genre_type.title()
-
-
-    verify_sql = f"SELECT COUNT(*) AS count FROM {table_name} WHERE `Name` = :name"
-    verify = db.session.execute(db.text(verify_sql), {'name': name}).first()
+    verify = execute(f'genre_detail.verify.{genre_type}', {'name': name}).first()
 
     if not verify or verify.count == 0:
         flash(f'{name} not found', 'error')
         return redirect(url_for('main.game_genres'))
 
-    game_table = "Game" + table_name
-
-    count_sql = f"""
-        SELECT COUNT(DISTINCT GameID) AS count 
-        FROM {game_table} 
-        WHERE {table_name} = :name
-    """
-    count_result = db.session.execute(db.text(count_sql), {'name': name}).first()
+    count_result = execute(f'genre_detail.count.{genre_type}', {'name': name}).first()
     num_games = count_result.count if count_result else 0
 
-
-    genres_sql = f"""
-        SELECT AVG(gp.AvgCriticRatingPercentage) as AvgCritic, 
-        SUM(gp.TotalPlayerRating) / SUM(gp.NumPlayersRated) as AvgUser
-        FROM GamesPlatform gp
-        INNER JOIN {game_table} gt ON gp.GameID = gt.GameID
-        WHERE gt.{table_name} = :name
-    """
-    genres_result = db.session.execute(db.text(genres_sql), {'name': name}).first()
+    genres_result = rolled_up_averages(genre_type, name, f'genre_detail.averages.{genre_type}', {'name': name})
     avg_critic_rating = round(genres_result.AvgCritic,
                               1) if genres_result and genres_result.AvgCritic else None
 
@@ -1151,34 +980,31 @@ def genre_detail(genre_type, name):
 # Top 5 Pages
 @main_blueprint.route('/top5')
 def top5():
-    if 'username' not in session:
+    if 'username' not in session and not prerendering():
         flash('Please login first', 'warning')
         return redirect(url_for('main.login'))
     return render_template('top5.html')
 
 
 @main_blueprint.route('/top5/games-by-genre')
+@route_class('heavy')
+@rate_limited('aggregate')
 def top5_games_by_genre():
-    if 'username' not in session:
+    if 'username' not in session and not prerendering():
         flash('Please login first', 'warning')
         return redirect(url_for('main.login'))
 
-    genres_sql = "SELECT `Name` FROM Genre ORDER BY `Name`"
-    genres_result = db.session.execute(db.text(genres_sql)).fetchall()
+    snapshot = catalog_snapshot()
+    if snapshot is not None:
+        return render_template('top5_games_by_genre.html', genres_data=snapshot.top_games('genre'))
+
+    genres_result = fetch_all('top5_games_by_genre.genres')
     genres = [g.Name for g in genres_result]
 
     genres_data = {}
 
     for genre in genres:
-        top_games_sql = """
-            SELECT g.ID, g.`Name`, g.CoverPhoto, g.MobyScore FROM Game g
-            INNER JOIN GameGenre gg ON g.ID = gg.GameID
-            WHERE gg.Genre = :genre
-            AND g.MobyScore IS NOT NULL
-            ORDER BY g.MobyScore DESC
-            LIMIT 5
-        """
-        games_result = db.session.execute(db.text(top_games_sql), {'genre': genre}).fetchall()
+        games_result = fetch_all('top5_games_by_genre.top_games', {'genre': genre})
 
         games_list = []
         for game in games_result:
@@ -1196,27 +1022,24 @@ def top5_games_by_genre():
 
 
 @main_blueprint.route('/top5/games-by-setting')
+@route_class('heavy')
+@rate_limited('aggregate')
 def top5_games_by_setting():
-    if 'username' not in session:
+    if 'username' not in session and not prerendering():
         flash('Please login first', 'warning')
         return redirect(url_for('main.login'))
 
-    settings_sql = "SELECT `Name` FROM Setting ORDER BY `Name`"
-    settings_result = db.session.execute(db.text(settings_sql)).fetchall()
+    snapshot = catalog_snapshot()
+    if snapshot is not None:
+        return render_template('top5_games_by_setting.html', settings_data=snapshot.top_games('setting'))
+
+    settings_result = fetch_all('top5_games_by_setting.settings')
     settings = [s.Name for s in settings_result]
 
     settings_data = {}
 
     for setting in settings:
-        top_games_sql = """
-            SELECT g.ID, g.`Name`, g.CoverPhoto, g.MobyScore FROM Game g
-            INNER JOIN GameSetting gs ON g.ID = gs.GameID
-            WHERE gs.Setting = :setting
-            AND g.MobyScore IS NOT NULL
-            ORDER BY g.MobyScore DESC
-            LIMIT 5
-            """
-        games_result = db.session.execute(db.text(top_games_sql), {"setting": setting}).fetchall()
+        games_result = fetch_all('top5_games_by_setting.top_games', {"setting": setting})
 
         games_list = []
         for game in games_result:
@@ -1234,29 +1057,26 @@ def top5_games_by_setting():
 
 
 @main_blueprint.route('/top5/companies-by-genre')
+@route_class('heavy')
+@rate_limited('aggregate')
 def top5_companies_by_genre():
-    if 'username' not in session:
+    if 'username' not in session and not prerendering():
         flash('Please login first', 'warning')
         return redirect(url_for('main.login'))
 
-    genres_sql = "SELECT `Name` FROM Genre ORDER BY `Name`"
-    genres_result = db.session.execute(db.text(genres_sql)).fetchall()
+    snapshot = catalog_snapshot()
+    if snapshot is not None:
+        return render_template('top5_companies_by_genre.html',
+                               company_genres_data=snapshot.top_companies_by_genre())
+
+    genres_result = fetch_all('top5_companies_by_genre.genres')
     genres = [g.Name for g in genres_result]
 
     company_genres_data = {}
 
     for genre in genres:
-        top_companies_sql = """
-            SELECT c.ID, c.`Name`, c.Country, c.Logo, AVG(gp.AvgCriticRatingPercentage) AS AvgCritic
-            FROM Company c INNER JOIN CompanyDevelopGame cg ON c.ID = cg.CompanyID
-            INNER JOIN GameGenre gg ON cg.GameID = gg.GameID AND gg.Genre = :genre
-            INNER JOIN GamesPlatform gp ON cg.GameID = gp.GameID
-            GROUP BY 1, 2, 3, 4
-            ORDER BY 5 DESC
-            LIMIT 5
-            """
-
-        companies_result = db.session.execute(db.text(top_companies_sql), {"genre": genre}).fetchall()
+
+        companies_result = fetch_all('top5_companies_by_genre.top_companies', {"genre": genre})
 
         companies_list = []
         for company in companies_result:
@@ -1274,218 +1094,80 @@ def top5_companies_by_genre():
 
 
 @main_blueprint.route('/top5/directors-by-volume')
+@route_class('heavy')
+@rate_limited('aggregate')
 def top5_directors_by_volume():
-    if 'username' not in session:
+    if 'username' not in session and not prerendering():
         flash('Please login first', 'warning')
         return redirect(url_for('main.login'))
 
-    directors_sql = """
-        SELECT d.ID, d.`Name`, d.ProfilePicture, d.Biography, COUNT(gd.GameID) AS games_directed
-        FROM Director d INNER JOIN GameDirectors gd ON d.ID = gd.DirectorID
-        GROUP BY 1, 2, 3
-        ORDER BY games_directed DESC
-        LIMIT 5
-        """
-
-    directors_result = db.session.execute(db.text(directors_sql)).fetchall()
+    directors_result = fetch_all('top5_directors_by_volume.directors')
+    if not directors_result:
+        # Nothing counted yet (before `flask entity-counts rebuild`)
+        directors_result = fetch_all('top5_directors_by_volume.live_directors')
 
     return render_template('top5_directors_by_volume.html', directors_data=directors_result)
 
 
 
+@main_blueprint.route('/top5/trending')
+def top5_trending():
+    if 'username' not in session:
+        flash('Please login first', 'warning')
+        return redirect(url_for('main.login'))
+
+    return render_template('top5_trending.html', games=trending_games(),
+                           half_life=current_app.config['TRENDING_HALF_LIFE_HOURS'])
+
+
 @main_blueprint.route('/top5/collaborations')
+@route_class('heavy')
+@rate_limited('aggregate')
 def top5_collaborations():
-    if 'username' not in session:
+    if 'username' not in session and not prerendering():
         flash('Please login first', 'warning')
         return redirect(url_for('main.login'))
 
-    collaborations_sql = """
-        SELECT d.ID AS DirectorID, d.`Name` AS DirectorName, d.ProfilePicture,
-        c.ID AS DeveloperID, c.`Name` AS DeveloperName, c.Country, c.Logo, COUNT(DISTINCT gd.GameID) AS games_collaborated
-        FROM Director d INNER JOIN GameDirectors gd ON d.ID = gd.DirectorID
-        INNER JOIN CompanyDevelopGame cpg ON gd.GameID = cpg.GameID
-        INNER JOIN Company c ON cpg.CompanyID = c.ID
-        GROUP BY 1, 2, 3, 4, 5, 6, 7
-        ORDER BY 8 DESC
-        LIMIT 5
-        """
+    snapshot = catalog_snapshot()
+    if snapshot is not None:
+        return stream_page('top5_collaborations.html', collaborations_data=snapshot.top_collaborations())
 
-    collaborations_result = db.session.execute(db.text(collaborations_sql)).fetchall()
-    return render_template('top5_collaborations.html', collaborations_data=collaborations_result)
+    collaborations_result = fetch_all('top5_collaborations.collaborations')
+    return stream_page('top5_collaborations.html', collaborations_data=collaborations_result)
 
 # Dream Game
 
 @main_blueprint.route('/dream-game')
+@route_class('heavy')
+@rate_limited('aggregate')
 def dream_game():
     if 'username' not in session:
         flash('Please login first', 'warning')
         return redirect(url_for('main.login'))
 
-    best_dev_sql = """
-        SELECT 
-            c.ID,
-            c.`Name`,
-            c.Logo,
-            SUM(gp.TotalPlayerRating) / SUM(gp.NumPlayersRated) as AvgRating
-        FROM Company c
-        INNER JOIN CompanyDevelopGame cdg ON c.ID = cdg.CompanyID
-        INNER JOIN GamesPlatform gp ON cdg.GameID = gp.GameID
-        WHERE gp.NumPlayersRated > 0
-        GROUP BY c.ID, c.`Name`, c.Logo
-        ORDER BY AvgRating DESC
-        LIMIT 1
-    """
-    best_dev = db.session.execute(db.text(best_dev_sql)).first()
-
-    best_pub_sql = """
-        SELECT 
-            c.ID,
-            c.`Name`,
-            c.Logo,
-            SUM(gp.TotalPlayerRating) / SUM(gp.NumPlayersRated) as AvgRating
-        FROM Company c
-        INNER JOIN CompanyPublishGame cpg ON c.ID = cpg.CompanyID
-        INNER JOIN GamesPlatform gp ON cpg.GameID = gp.GameID
-        WHERE gp.NumPlayersRated > 0
-        GROUP BY c.ID, c.`Name`, c.Logo
-        ORDER BY AvgRating DESC
-        LIMIT 1
-    """
-    best_pub = db.session.execute(db.text(best_pub_sql)).first()
-
-    best_director_sql = """
-        SELECT 
-            d.ID,
-            d.`Name`,
-            d.ProfilePicture,
-            d.Biography,
-            SUM(gp.TotalPlayerRating) / SUM(gp.NumPlayersRated) as AvgRating
-        FROM Director d
-        INNER JOIN GameDirectors gd ON d.ID = gd.DirectorID
-        INNER JOIN GamesPlatform gp ON gd.GameID = gp.GameID
-        WHERE gp.NumPlayersRated > 0
-        GROUP BY d.ID, d.`Name`, d.ProfilePicture, d.Biography
-        ORDER BY AvgRating DESC
-        LIMIT 1
-    """
-    best_director = db.session.execute(db.text(best_director_sql)).first()
-
-    best_setting_sql = """
-        SELECT 
-            gs.Setting,
-            SUM(gp.TotalPlayerRating) / SUM(gp.NumPlayersRated) as AvgRating
-        FROM GameSetting gs
-        INNER JOIN GamesPlatform gp ON gs.GameID = gp.GameID
-        WHERE gp.NumPlayersRated > 0
-        GROUP BY gs.Setting
-        ORDER BY AvgRating DESC
-        LIMIT 1
-    """
-    best_setting = db.session.execute(db.text(best_setting_sql)).first()
-
-    best_genre_sql = """
-        SELECT 
-            gg.Genre,
-            SUM(gp.TotalPlayerRating) / SUM(gp.NumPlayersRated) as AvgRating
-        FROM GameGenre gg
-        INNER JOIN GamesPlatform gp ON gg.GameID = gp.GameID
-        WHERE gp.NumPlayersRated > 0
-        GROUP BY gg.Genre
-        ORDER BY AvgRating DESC
-        LIMIT 1
-    """
-    best_genre = db.session.execute(db.text(best_genre_sql)).first()
-
-    best_gameplay_sql = """
-        SELECT 
-            ggp.Gameplay,
-            SUM(gp.TotalPlayerRating) / SUM(gp.NumPlayersRated) as AvgRating
-        FROM GameGameplay ggp
-        INNER JOIN GamesPlatform gp ON ggp.GameID = gp.GameID
-        WHERE gp.NumPlayersRated > 0
-        GROUP BY ggp.Gameplay
-        ORDER BY AvgRating DESC
-        LIMIT 1
-    """
-    best_gameplay = db.session.execute(db.text(best_gameplay_sql)).first()
-
-    best_interface_sql = """
-        SELECT 
-            gi.Interface,
-            SUM(gp.TotalPlayerRating) / SUM(gp.NumPlayersRated) as AvgRating
-        FROM GameInterface gi
-        INNER JOIN GamesPlatform gp ON gi.GameID = gp.GameID
-        WHERE gp.NumPlayersRated > 0
-        GROUP BY gi.Interface
-        ORDER BY AvgRating DESC
-        LIMIT 1
-    """
-    best_interface = db.session.execute(db.text(best_interface_sql)).first()
-
-    best_perspective_sql = """
-        SELECT 
-            gp_attr.Perspective,
-            SUM(gp.TotalPlayerRating) / SUM(gp.NumPlayersRated) as AvgRating
-        FROM GamePerspective gp_attr
-        INNER JOIN GamesPlatform gp ON gp_attr.GameID = gp.GameID
-        WHERE gp.NumPlayersRated > 0
-        GROUP BY gp_attr.Perspective
-        ORDER BY AvgRating DESC
-        LIMIT 1
-    """
-    best_perspective = db.session.execute(db.text(best_perspective_sql)).first()
-
-    best_visual_sql = """
-        SELECT 
-            gv.Visual,
-            SUM(gp.TotalPlayerRating) / SUM(gp.NumPlayersRated) as AvgRating
-        FROM GameVisual gv
-        INNER JOIN GamesPlatform gp ON gv.GameID = gp.GameID
-        WHERE gp.NumPlayersRated > 0
-        GROUP BY gv.Visual
-        ORDER BY AvgRating DESC
-        LIMIT 1
-    """
-    best_visual = db.session.execute(db.text(best_visual_sql)).first()
-
-    best_narrative_sql = """
-        SELECT 
-            gn.Narrative,
-            SUM(gp.TotalPlayerRating) / SUM(gp.NumPlayersRated) as AvgRating
-        FROM GameNarrative gn
-        INNER JOIN GamesPlatform gp ON gn.GameID = gp.GameID
-        WHERE gp.NumPlayersRated > 0
-        GROUP BY gn.Narrative
-        ORDER BY AvgRating DESC
-        LIMIT 1
-    """
-    best_narrative = db.session.execute(db.text(best_narrative_sql)).first()
-
-    best_pacing_sql = """
-        SELECT 
-            gpc.Pacing,
-            SUM(gp.TotalPlayerRating) / SUM(gp.NumPlayersRated) as AvgRating
-        FROM GamePacing gpc
-        INNER JOIN GamesPlatform gp ON gpc.GameID = gp.GameID
-        WHERE gp.NumPlayersRated > 0
-        GROUP BY gpc.Pacing
-        ORDER BY AvgRating DESC
-        LIMIT 1
-    """
-    best_pacing = db.session.execute(db.text(best_pacing_sql)).first()
-
-    best_art_sql = """
-        SELECT 
-            ga.Art,
-            SUM(gp.TotalPlayerRating) / SUM(gp.NumPlayersRated) as AvgRating
-        FROM GameArt ga
-        INNER JOIN GamesPlatform gp ON ga.GameID = gp.GameID
-        WHERE gp.NumPlayersRated > 0
-        GROUP BY ga.Art
-        ORDER BY AvgRating DESC
-        LIMIT 1
-    """
-    best_art = db.session.execute(db.text(best_art_sql)).first()
+    best_dev = fetch_first('dream_game.best_dev')
+
+    best_pub = fetch_first('dream_game.best_pub')
+
+    best_director = fetch_first('dream_game.best_director')
+
+    best_setting = fetch_first('dream_game.best_setting')
+
+    best_genre = fetch_first('dream_game.best_genre')
+
+    best_gameplay = fetch_first('dream_game.best_gameplay')
+
+    best_interface = fetch_first('dream_game.best_interface')
+
+    best_perspective = fetch_first('dream_game.best_perspective')
+
+    best_visual = fetch_first('dream_game.best_visual')
+
+    best_narrative = fetch_first('dream_game.best_narrative')
+
+    best_pacing = fetch_first('dream_game.best_pacing')
+
+    best_art = fetch_first('dream_game.best_art')
 
     dream_game_data = {
         'developer': {
@@ -1545,7 +1227,7 @@ def dream_game():
         }
     }
 
-    return render_template('dream_game.html', dream_game=dream_game_data)
+    return stream_page('dream_game.html', dream_game=dream_game_data)
 
 #Logout
 @main_blueprint.route('/logout')
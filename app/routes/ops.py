@@ -0,0 +1,26 @@
+from flask import Blueprint, Response, abort, current_app, request
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from sqlalchemy import exc
+from app.extensions import db
+from app.metrics import registry, warm_pool
+
+ops_blueprint = Blueprint('ops', __name__)
+
+
+@ops_blueprint.route('/metrics')
+def metrics():
+    token = current_app.config.get('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        abort(403)
+    return Response(generate_latest(registry()), mimetype=CONTENT_TYPE_LATEST)
+
+
+@ops_blueprint.route('/readyz')
+def readyz():
+    try:
+        if not current_app.extensions.get('pool_warm'):
+            warm_pool(current_app, db)
+        db.session.execute(db.text('SELECT 1'))
+    except exc.SQLAlchemyError:
+        return Response('not ready\n', status=503, mimetype='text/plain')
+    return Response('ready\n', mimetype='text/plain')
@@ -0,0 +1,26 @@
+import os
+from flask import Blueprint, Response, abort, current_app, send_from_directory, url_for
+
+sitemaps_blueprint = Blueprint('sitemaps', __name__)
+
+
+@sitemaps_blueprint.route('/robots.txt')
+def robots():
+    # Point crawlers at the sitemap and keep them off OFFSET-paginated listings
+    lines = ['User-agent: *', 'Disallow: /*?page=', 'Disallow: /*&page=',
+             f"Sitemap: {url_for('sitemaps.index', _external=True)}"]
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain')
+
+
+@sitemaps_blueprint.route('/sitemap.xml')
+def index():
+    return send_from_directory(current_app.config['SITEMAP_DIR'], 'sitemap.xml', mimetype='application/xml',
+                               max_age=3600)
+
+
+@sitemaps_blueprint.route('/sitemaps/<filename>')
+def shard(filename):
+    if not filename.endswith('.xml.gz'):
+        abort(404)
+    return send_from_directory(os.path.join(current_app.config['SITEMAP_DIR'], 'shards'), filename,
+                               mimetype='application/gzip', max_age=3600)
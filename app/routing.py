@@ -0,0 +1,96 @@
+import random
+import re
+import time
+from functools import wraps
+from flask import current_app, g, has_request_context, session
+from flask_sqlalchemy.session import Session
+
+WRITE_STATEMENT = re.compile(r'^\s*(INSERT|UPDATE|DELETE|REPLACE)\b', re.IGNORECASE)
+
+
+def is_write(clause):
+    if clause is None:
+        return False
+    if getattr(clause, 'is_dml', False):
+        return True
+    text = getattr(clause, 'text', None)
+    return bool(text and WRITE_STATEMENT.match(text))
+
+
+def primary_pinned():
+    if not has_request_context():
+        return True
+    if 'use_primary' in g:
+        return g.use_primary
+    return session.get('primary_pin_until', 0) > time.time()
+
+
+def uses_primary(view):
+    # Reads inside write routes must see the primary too (e.g. the username check in create_account)
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.use_primary = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def uses_replica(view):
+    # For public, cacheable endpoints: skip the session pin so responses don't Vary on Cookie
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.use_primary = False
+        return view(*args, **kwargs)
+    return wrapper
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is not None:
+            return bind
+
+        if self._flushing or is_write(clause):
+            if has_request_context():
+                g.db_wrote = True
+            return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+        if primary_pinned():
+            return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+        engine = read_engine(clause)
+        if engine is not None:
+            return engine
+
+        replica = choose_replica()
+        if replica is None:
+            return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        return self._db.engines[replica]
+
+
+def choose_replica():
+    replicas = current_app.config.get('SQLALCHEMY_REPLICA_BINDS') or []
+    if not replicas:
+        return None
+    # Stick to one replica for the whole request so reads see a single consistent snapshot
+    if 'db_replica' not in g:
+        g.db_replica = random.choice(replicas)
+    return g.db_replica
+
+
+def read_engine(clause=None):
+    # The embedded read snapshot, if the app serves from one and the statement reads no live tables
+    read_snapshot = current_app.extensions.get('read_snapshot')
+    if read_snapshot is None:
+        return None
+    if 'read_snapshot_engine' not in g:
+        g.read_snapshot_engine = read_snapshot.current()
+    if g.read_snapshot_engine is None or read_snapshot.reads_live(clause):
+        return None
+    return g.read_snapshot_engine
+
+
+def init_app(app):
+    @app.after_request
+    def pin_after_write(response):
+        if g.get('db_wrote'):
+            session['primary_pin_until'] = time.time() + app.config['PRIMARY_PIN_SECONDS']
+        return response
@@ -0,0 +1,172 @@
+import time
+import click
+import numpy as np
+import scipy.sparse as sp
+from flask.cli import with_appcontext
+from sqlalchemy import text
+from app.catalog import FACET_TYPES, facet_tables
+from app.extensions import db
+from app.models import SimilarGames
+
+SIMILAR_GAMES_SQL = """
+    SELECT g.ID, g.`Name`, g.CoverPhoto, g.MobyScore
+    FROM SimilarGames sg
+    INNER JOIN Game g ON g.ID = sg.SimilarGameID
+    WHERE sg.GameID = :game_id
+    ORDER BY sg.Position
+"""
+
+
+def similar_games(game_id):
+    result = db.session.execute(db.text(SIMILAR_GAMES_SQL), {'game_id': game_id}).fetchall()
+    return [{'id': game.ID, 'name': game.Name, 'image': game.CoverPhoto, 'score': game.MobyScore}
+            for game in result]
+
+
+def load_facet_matrix(connection, chunk_size=100000):
+    games = connection.execute(text("SELECT ID, MobyScore FROM Game ORDER BY ID")).fetchall()
+    game_ids = np.array([game.ID for game in games], dtype=np.int64)
+    moby_scores = np.array([float(game.MobyScore) if game.MobyScore is not None else -1.0 for game in games],
+                           dtype=np.float32)
+
+    columns = {}
+    rows, cols = [], []
+    for facet_type in FACET_TYPES:
+        table_name, game_table = facet_tables(facet_type)
+        result = connection.execution_options(stream_results=True, yield_per=chunk_size).execute(
+            text(f"SELECT GameID, `{table_name}` AS Value FROM {game_table}"))
+        for chunk in result.partitions(chunk_size):
+            ids = np.array([row.GameID for row in chunk], dtype=np.int64)
+            positions = np.searchsorted(game_ids, ids)
+            known = (positions < len(game_ids)) & (game_ids[np.minimum(positions, len(game_ids) - 1)] == ids)
+            values = [columns.setdefault((facet_type, row.Value), len(columns)) for row in chunk]
+            rows.append(positions[known])
+            cols.append(np.array(values, dtype=np.int64)[known])
+
+    rows = np.concatenate(rows) if rows else np.empty(0, dtype=np.int64)
+    cols = np.concatenate(cols) if cols else np.empty(0, dtype=np.int64)
+    matrix = sp.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, cols)),
+                           shape=(len(game_ids), len(columns)))
+    matrix.data[:] = 1
+    return game_ids, moby_scores, matrix
+
+
+def signatures(matrix):
+    # Games with identical facet sets share one row; hashing each row keeps this vectorized
+    keys = np.random.default_rng(0).integers(1, 2 ** 63, size=(matrix.shape[1], 2), dtype=np.uint64)
+    non_empty = np.flatnonzero(np.diff(matrix.indptr))
+    hashes = np.add.reduceat(keys[matrix.indices], matrix.indptr[non_empty], axis=0)
+    _, first, inverse = np.unique(hashes, axis=0, return_index=True, return_inverse=True)
+    return non_empty, non_empty[first], inverse.ravel()
+
+
+def capped_postings(weighted, best_moby, max_postings):
+    # Keep, for every facet value, only its best-rated `max_postings` signatures as candidates.
+    # Without the cap, values like 'Action' or 'Windows' make the product dense and the
+    # rebuild quadratic in the catalog size; with it the work is bounded by nnz * max_postings.
+    transposed = weighted.T.tocsr()
+    rows = np.repeat(np.arange(transposed.shape[0]), np.diff(transposed.indptr))
+    order = np.lexsort((-best_moby[transposed.indices], rows))
+    rank = np.arange(len(order)) - transposed.indptr[rows]
+    keep = order[rank < max_postings]
+    return sp.csr_matrix((transposed.data[keep], (rows[keep], transposed.indices[keep])), shape=transposed.shape)
+
+
+def top_similar(matrix, moby_scores, k, budget=20_000_000, max_postings=100):
+    # Cosine over IDF-weighted binary facet vectors, computed between distinct facet signatures
+    # in row batches of roughly `budget` candidate scores; ties between games are broken by MobyScore.
+    # Returns (game_rows, similar_rows, scores) with up to k neighbours per game that has facets.
+    n_games = matrix.shape[0]
+    df = np.bincount(matrix.indices, minlength=matrix.shape[1])
+    idf = (np.log((1 + n_games) / (1 + df)) + 1).astype(np.float32)
+
+    game_rows, representatives, inverse = signatures(matrix)
+    weighted = matrix[representatives].astype(np.float32)
+    weighted.data *= idf[weighted.indices]
+    norms = np.sqrt(np.asarray(weighted.multiply(weighted).sum(axis=1)).ravel())
+    weighted = (sp.diags(1 / norms) @ weighted).tocsr()
+
+    # Members of each signature, best MobyScore first
+    order = np.lexsort((-moby_scores[game_rows], inverse))
+    members = game_rows[order]
+    starts = np.concatenate(([0], np.cumsum(np.bincount(inverse, minlength=len(representatives)))))
+    transposed = capped_postings(weighted, moby_scores[members[starts[:-1]]], max_postings)
+
+    n_signatures = len(representatives)
+    batch = max(1, budget * n_signatures // max(weighted.nnz * max_postings, 1))
+    out_games, out_similar, out_scores = [], [], []
+    for start in range(0, n_signatures, batch):
+        block = (weighted[start:start + batch] @ transposed).tocsr()
+        for offset in range(block.shape[0]):
+            signature = start + offset
+            lo, hi = block.indptr[offset], block.indptr[offset + 1]
+            scores, candidates = block.data[lo:hi], block.indices[lo:hi]
+            if len(scores) > k + 1:
+                top = np.argpartition(-scores, k)[:k + 1]
+                scores, candidates = scores[top], candidates[top]
+            ranked = np.argsort(-scores, kind='stable')
+
+            neighbours, neighbour_scores = [], []
+            for index in ranked:
+                group = members[starts[candidates[index]]:starts[candidates[index] + 1]][:k + 1]
+                neighbours.extend(group)
+                neighbour_scores.extend([scores[index]] * len(group))
+                if len(neighbours) > k:
+                    break
+
+            for game in members[starts[signature]:starts[signature + 1]]:
+                picked = [(other, score) for other, score in zip(neighbours, neighbour_scores) if other != game][:k]
+                out_games.extend([game] * len(picked))
+                out_similar.extend(other for other, _ in picked)
+                out_scores.extend(score for _, score in picked)
+
+    return (np.array(out_games, dtype=np.int64), np.array(out_similar, dtype=np.int64),
+            np.array(out_scores, dtype=np.float32))
+
+
+def store(engine, game_ids, game_rows, similar_rows, scores, chunk_size):
+    # Replace one ID range per transaction so readers never see a half-written game
+    order = np.argsort(game_rows, kind='stable')
+    game_rows, similar_rows, scores = game_rows[order], similar_rows[order], scores[order]
+    bounds = np.searchsorted(game_rows, np.arange(0, len(game_ids) + chunk_size, chunk_size))
+
+    for chunk, start in enumerate(range(0, len(game_ids), chunk_size)):
+        stop = min(start + chunk_size, len(game_ids))
+        lo = game_ids[start] if start else np.iinfo(np.int32).min
+        hi = game_ids[stop - 1] if stop < len(game_ids) else np.iinfo(np.int32).max
+        rows, position, previous = [], 0, None
+        for i in range(bounds[chunk], bounds[chunk + 1]):
+            position = position + 1 if game_rows[i] == previous else 0
+            previous = game_rows[i]
+            rows.append({'GameID': int(game_ids[game_rows[i]]), 'Position': position,
+                         'SimilarGameID': int(game_ids[similar_rows[i]]), 'Score': float(scores[i])})
+        with engine.begin() as connection:
+            connection.execute(SimilarGames.delete().where(SimilarGames.c.GameID.between(int(lo), int(hi))))
+            if rows:
+                connection.execute(SimilarGames.insert(), rows)
+
+
+@click.command('build-similar-games')
+@click.option('--top-k', default=10, show_default=True)
+@click.option('--max-postings', default=100, show_default=True, help='Candidate games offered per facet value.')
+@click.option('--chunk-size', default=5000, show_default=True, help='Games written per transaction.')
+@with_appcontext
+def build_similar_games_command(top_k, max_postings, chunk_size):
+    """Rebuild the SimilarGames index from facet memberships."""
+    with db.engine.connect() as connection:
+        start = time.perf_counter()
+        game_ids, moby_scores, matrix = load_facet_matrix(connection)
+        loaded = time.perf_counter()
+        click.echo(f'Loaded {matrix.shape[0]} games x {matrix.shape[1]} facet values '
+                   f'({matrix.nnz} memberships) in {loaded - start:.1f}s')
+
+        game_rows, similar_rows, scores = top_similar(matrix, moby_scores, top_k, max_postings=max_postings)
+        computed = time.perf_counter()
+        click.echo(f'Computed {len(scores)} neighbours in {computed - loaded:.1f}s')
+
+        store(db.engine, game_ids, game_rows, similar_rows, scores, chunk_size)
+        click.echo(f'Stored in {time.perf_counter() - computed:.1f}s')
+
+
+def init_app(app):
+    app.cli.add_command(build_similar_games_command)
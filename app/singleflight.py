@@ -0,0 +1,167 @@
+import fcntl
+import hashlib
+import os
+import pickle
+import threading
+import time
+from flask import current_app
+from app.budgets import remaining, with_stale_fallback
+from app.metrics import SINGLEFLIGHT_CALLS
+from app.routing import primary_pinned
+from app.statements import execute
+
+class Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    # Concurrent callers with the same key share one computation: the first runs it, the rest wait.
+    # With a directory, workers also coordinate through one lock file per key, and a worker that
+    # waited on another reuses the result it left behind instead of running the query again.
+    def __init__(self, directory=None, wait_seconds=30):
+        self.directory = directory
+        self.wait_seconds = wait_seconds
+        self.calls = {}
+        self.lock = threading.Lock()
+        self.runs = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def do(self, key, compute):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = Call()
+
+        if not leader:
+            SINGLEFLIGHT_CALLS.labels('follower').inc()
+            # Never wait past this request's statement budget
+            left = remaining()
+            wait = self.wait_seconds if left is None else max(0, min(self.wait_seconds, left))
+            if not call.done.wait(wait):
+                return compute()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self.run(key, compute) if self.directory else compute()
+            return call.result
+        except Exception as error:
+            call.error = error
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+
+    def run(self, key, compute):
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        result_path = os.path.join(self.directory, f'{digest}.result')
+        lock_path = os.path.join(self.directory, f'{digest}.lock')
+        started = time.time()
+
+        with open(lock_path, 'a') as lock_file:
+            state = self.acquire(lock_file)
+            try:
+                if state == 'waited':
+                    shared = self.load(result_path, started)
+                    if shared is not None:
+                        SINGLEFLIGHT_CALLS.labels('shared').inc()
+                        return shared[0]
+                SINGLEFLIGHT_CALLS.labels('leader').inc()
+                result = compute()
+                self.store(result_path, result)
+                return result
+            finally:
+                if state != 'timeout':
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def acquire(self, lock_file):
+        # 'free' if the lock was free, 'waited' if another worker held it and released it, 'timeout' if it
+        # was still held when this request's wait (capped by its statement budget) ran out
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return 'free'
+        except BlockingIOError:
+            pass
+        left = remaining()
+        wait = self.wait_seconds if left is None else max(0, min(self.wait_seconds, left))
+        deadline = time.monotonic() + wait
+        while time.monotonic() < deadline:
+            time.sleep(0.01)
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return 'waited'
+            except BlockingIOError:
+                continue
+        # The holder is slow or stuck; compute without the lock rather than fail the request
+        return 'timeout'
+
+    def load(self, path, not_before):
+        # Only a result finished after we started waiting counts: anything older is a stale cache
+        try:
+            if os.path.getmtime(path) < not_before:
+                return None
+            with open(path, 'rb') as f:
+                return (pickle.load(f),)
+        except (OSError, pickle.PickleError, EOFError):
+            return None
+
+    def store(self, path, result):
+        try:
+            with open(path + '.tmp', 'wb') as f:
+                pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(path + '.tmp', path)
+        except (OSError, pickle.PickleError):
+            current_app.logger.warning('Could not share single-flight result', exc_info=True)
+        self.runs += 1
+        if self.runs % 100 == 0:
+            self.prune()
+
+    def prune(self, max_age=60):
+        cutoff = time.time() - max_age
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.stat().st_mtime >= cutoff:
+                    continue
+                if entry.name.endswith('.result'):
+                    os.remove(entry.path)
+                elif entry.name.endswith('.lock'):
+                    # Only while nobody holds it; at worst a worker still opening it runs its query twice
+                    with open(entry.path, 'a') as lock_file:
+                        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        os.remove(entry.path)
+            except OSError:
+                pass
+
+
+def statement_key(name, params):
+    # Same registered statement and parameters, and the same side of the primary/replica split
+    side = 'primary' if primary_pinned() else 'replica'
+    return f'{side}|{name}|{sorted((params or {}).items())!r}'
+
+
+def coalesce(key, compute):
+    return current_app.extensions['singleflight'].do(key, compute)
+
+
+def fetch_all(name, params=None):
+    key = statement_key(name, params)
+    return with_stale_fallback(key, lambda: coalesce(key, lambda: execute(name, params).fetchall()))
+
+
+def fetch_first(name, params=None):
+    rows = fetch_all(name, params)
+    return rows[0] if rows else None
+
+
+def init_app(app):
+    directory = None
+    if app.config['SINGLEFLIGHT_SHARED']:
+        directory = app.config.get('SINGLEFLIGHT_DIR') or os.path.join(app.instance_path, 'singleflight')
+    app.extensions['singleflight'] = SingleFlight(directory, app.config['SINGLEFLIGHT_WAIT'])
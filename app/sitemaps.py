@@ -0,0 +1,225 @@
+import gzip
+import json
+import os
+import time
+from datetime import datetime, timezone
+from urllib.parse import quote
+from xml.sax.saxutils import escape
+import click
+import numpy as np
+from flask import current_app, url_for
+from flask.cli import with_appcontext
+from sqlalchemy import text
+from app.catalog import FACET_TYPES, facet_tables
+from app.extensions import db
+
+# (kind, table, endpoint, URL argument): one shard per SHARD_SIZE-wide ID range, so a new or changed
+# entity only rewrites the shard its ID falls in
+ENTITIES = (
+    ('game', 'Game', 'main.game_detail', 'game_id'),
+    ('director', 'Director', 'main.director_detail', 'director_id'),
+    ('company', 'Company', 'main.company_detail', 'company_id'),
+)
+ENTITY_SQL = """
+    SELECT e.ID, COALESCE(v.Version, 0) AS Version
+    FROM {table} e
+    LEFT JOIN DocumentVersions v ON v.Kind = :kind AND v.EntityKey = CAST(e.ID AS CHAR)
+    WHERE e.ID > :after
+    ORDER BY e.ID
+    LIMIT :batch
+"""
+PLATFORMS_SQL = """
+    SELECT p.PlatformName, COALESCE(MAX(v.Version), 0) AS Version
+    FROM (SELECT DISTINCT PlatformName FROM GamesPlatform) p
+    LEFT JOIN DocumentVersions v ON v.Kind = 'platform' AND v.EntityKey = p.PlatformName
+    GROUP BY p.PlatformName
+"""
+LIST_PAGES = ('main.home', 'main.games', 'main.directors', 'main.companies', 'main.platforms',
+              'main.game_genres', 'main.top5')
+SHARD_SIZE = 50000
+XMLNS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+
+
+def w3c_date(timestamp):
+    return datetime.fromtimestamp(int(timestamp), timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def write_gzip(path, lines):
+    # Written under a temporary name and renamed, so crawlers never fetch a half-written shard
+    with gzip.open(path + '.tmp', 'wt', encoding='utf-8', compresslevel=9) as f:
+        for line in lines:
+            f.write(line)
+    os.replace(path + '.tmp', path)
+
+
+def write_json(path, data):
+    with open(path + '.tmp', 'w') as f:
+        json.dump(data, f)
+    os.replace(path + '.tmp', path)
+
+
+def urlset(entries):
+    yield f'<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="{XMLNS}">\n'
+    for loc, lastmod in entries:
+        yield f'<url><loc>{escape(loc)}</loc><lastmod>{w3c_date(lastmod)}</lastmod></url>\n'
+    yield '</urlset>\n'
+
+
+class SitemapBuilder:
+    def __init__(self, directory, connection, full=False, batch=10000):
+        self.directory = directory
+        self.connection = connection
+        self.batch = batch
+        self.now = int(time.time())
+        self.full = full
+        self.shards = {}
+        self.written = 0
+        os.makedirs(os.path.join(directory, 'shards'), exist_ok=True)
+        os.makedirs(os.path.join(directory, 'state'), exist_ok=True)
+        # Shard lastmod dates from the previous run, kept for shards that did not change
+        self.previous = {}
+        if not full and os.path.exists(self.state_path('shards', '.json')):
+            with open(self.state_path('shards', '.json')) as f:
+                self.previous = json.load(f)
+
+    def state_path(self, kind, suffix='.npz'):
+        return os.path.join(self.directory, 'state', kind + suffix)
+
+    def load_state(self, kind):
+        if self.full or not os.path.exists(self.state_path(kind)):
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, empty
+        state = np.load(self.state_path(kind))
+        return state['ids'], state['versions'], state['lastmod']
+
+    def scan(self, kind, table):
+        # Keyset scan: each batch seeks past the last ID instead of re-reading skipped rows
+        after = -1
+        while True:
+            rows = self.connection.execute(text(ENTITY_SQL.format(table=table)),
+                                           {'kind': kind, 'after': after, 'batch': self.batch}).fetchall()
+            if not rows:
+                return
+            yield np.array([row.ID for row in rows], dtype=np.int64), np.array([row.Version for row in rows],
+                                                                                dtype=np.int64)
+            after = rows[-1].ID
+
+    def entity_shards(self, kind, table, endpoint, argument):
+        old_ids, old_versions, old_lastmod = self.load_state(kind)
+        new_ids, new_versions, new_lastmod = [], [], []
+        seen = set()
+
+        def flush(shard, ids, versions):
+            lo, hi = np.searchsorted(old_ids, [shard * SHARD_SIZE, (shard + 1) * SHARD_SIZE])
+            positions = np.searchsorted(old_ids[lo:hi], ids)
+            known = positions < hi - lo
+            known[known] = old_ids[lo:hi][positions[known]] == ids[known]
+            unchanged = known.copy()
+            unchanged[known] = old_versions[lo:hi][positions[known]] == versions[known]
+            lastmod = np.where(unchanged, 0, self.now)
+            lastmod[unchanged] = old_lastmod[lo:hi][positions[unchanged]]
+            new_ids.append(ids)
+            new_versions.append(versions)
+            new_lastmod.append(lastmod)
+
+            name = f'{kind}-{shard:05d}.xml.gz'
+            path = os.path.join(self.directory, 'shards', name)
+            seen.add(name)
+            if unchanged.all() and hi - lo == len(ids) and os.path.exists(path):
+                self.shards[name] = self.previous.get(name, int(lastmod.max()))
+                return
+            write_gzip(path, urlset((url_for(endpoint, _external=True, **{argument: int(entity_id)}), modified)
+                                    for entity_id, modified in zip(ids.tolist(), lastmod.tolist())))
+            # Removing an entity changes the shard even if nothing left in it did
+            self.shards[name] = self.now if hi - lo > int(known.sum()) else int(lastmod.max())
+            self.written += 1
+
+        shard, ids, versions = None, [], []
+        for batch_ids, batch_versions in self.scan(kind, table):
+            for batch_shard in np.unique(batch_ids // SHARD_SIZE):
+                mask = batch_ids // SHARD_SIZE == batch_shard
+                if shard is not None and batch_shard != shard:
+                    flush(shard, np.concatenate(ids), np.concatenate(versions))
+                    ids, versions = [], []
+                shard = batch_shard
+                ids.append(batch_ids[mask])
+                versions.append(batch_versions[mask])
+        if shard is not None:
+            flush(shard, np.concatenate(ids), np.concatenate(versions))
+
+        for name in os.listdir(os.path.join(self.directory, 'shards')):
+            if name.startswith(f'{kind}-') and name not in seen:
+                os.remove(os.path.join(self.directory, 'shards', name))
+        empty = np.empty(0, dtype=np.int64)
+        np.savez(self.state_path(kind) + '.tmp.npz',
+                 ids=np.concatenate(new_ids) if new_ids else empty,
+                 versions=np.concatenate(new_versions) if new_versions else empty,
+                 lastmod=np.concatenate(new_lastmod) if new_lastmod else empty)
+        os.replace(self.state_path(kind) + '.tmp.npz', self.state_path(kind))
+
+    def pages(self):
+        # List pages, platforms and facet values: a few thousand URLs at most, tracked by URL
+        pages = {url_for(endpoint, _external=True): 0 for endpoint in LIST_PAGES}
+        for row in self.connection.execute(text(PLATFORMS_SQL)):
+            pages[url_for('main.platform_detail', platform_name=quote(row.PlatformName), _external=True)] = row.Version
+        for facet_type in FACET_TYPES:
+            table_name, _ = facet_tables(facet_type)
+            for row in self.connection.execute(text(f"SELECT `Name` FROM {table_name}")):
+                pages[url_for('main.genre_detail', genre_type=facet_type, name=quote(row.Name), _external=True)] = 0
+
+        state_path = self.state_path('pages', '.json')
+        old = {}
+        if not self.full and os.path.exists(state_path):
+            with open(state_path) as f:
+                old = json.load(f)
+        state = {url: old[url] if url in old and old[url][0] == version else [version, self.now]
+                 for url, version in pages.items()}
+
+        path = os.path.join(self.directory, 'shards', 'pages.xml.gz')
+        if state == old and os.path.exists(path):
+            self.shards['pages.xml.gz'] = self.previous.get('pages.xml.gz', self.now)
+            return
+        write_gzip(path, urlset((url, lastmod) for url, (_, lastmod) in state.items()))
+        self.written += 1
+        self.shards['pages.xml.gz'] = self.now
+        write_json(state_path, state)
+
+    def index(self):
+        lines = [f'<?xml version="1.0" encoding="UTF-8"?>\n<sitemapindex xmlns="{XMLNS}">\n']
+        for name, lastmod in sorted(self.shards.items()):
+            loc = url_for('sitemaps.shard', filename=name, _external=True)
+            lines.append(f'<sitemap><loc>{escape(loc)}</loc><lastmod>{w3c_date(lastmod)}</lastmod></sitemap>\n')
+        lines.append('</sitemapindex>\n')
+        path = os.path.join(self.directory, 'sitemap.xml')
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            f.writelines(lines)
+        os.replace(path + '.tmp', path)
+        write_json(self.state_path('shards', '.json'), self.shards)
+
+    def build(self):
+        for kind, table, endpoint, argument in ENTITIES:
+            self.entity_shards(kind, table, endpoint, argument)
+        self.pages()
+        self.index()
+
+
+@click.command('build-sitemaps')
+@click.option('--full', is_flag=True, help='Rewrite every shard and reset lastmod dates.')
+@click.option('--base-url', default=None, help='Public site URL. Defaults to SITEMAP_BASE_URL.')
+@with_appcontext
+def build_sitemaps_command(full, base_url):
+    """Regenerate the sitemap index and every shard whose entries changed."""
+    base_url = base_url or current_app.config.get('SITEMAP_BASE_URL')
+    if not base_url:
+        raise click.UsageError('Set SITEMAP_BASE_URL or pass --base-url')
+    start = time.perf_counter()
+    with current_app.test_request_context(base_url=base_url), db.engine.connect() as connection:
+        builder = SitemapBuilder(current_app.config['SITEMAP_DIR'], connection, full=full)
+        builder.build()
+    click.echo(f'Wrote {builder.written} of {len(builder.shards)} shards in {time.perf_counter() - start:.1f}s')
+
+
+def init_app(app):
+    if not app.config.get('SITEMAP_DIR'):
+        app.config['SITEMAP_DIR'] = os.path.join(app.instance_path, 'sitemaps')
+    app.cli.add_command(build_sitemaps_command)
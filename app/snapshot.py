@@ -0,0 +1,376 @@
+import json
+import os
+import shutil
+import threading
+import time
+from collections import namedtuple
+import click
+import numpy as np
+import scipy.sparse as sp
+from flask import current_app
+from flask.cli import with_appcontext
+from pyroaring import FrozenBitMap
+from sqlalchemy import text
+from app.catalog import FACET_TYPES, descending_rank, facet_tables
+from app.extensions import db
+from app.releases import RELEASE_YEARS_SQL
+
+GAMES_SQL = "SELECT ID, `Name`, CoverPhoto, MobyScore FROM Game"
+GAME_STATS_SQL = """
+    SELECT GameID,
+        SUM(AvgCriticRatingPercentage) AS CriticSum,
+        COUNT(AvgCriticRatingPercentage) AS CriticCount,
+        SUM(TotalPlayerRating) AS RatingTotal,
+        SUM(NumPlayersRated) AS RatingCount
+    FROM GamesPlatform
+    GROUP BY GameID
+"""
+COMPANIES_SQL = "SELECT ID, `Name`, Country, Logo FROM Company ORDER BY ID"
+DIRECTORS_SQL = "SELECT ID, `Name`, ProfilePicture, Biography FROM Director ORDER BY ID"
+POSTINGS_SQL = {
+    'year': RELEASE_YEARS_SQL,
+    'platform': "SELECT DISTINCT GameID, PlatformName FROM GamesPlatform",
+    'developer': "SELECT GameID, CompanyID FROM CompanyDevelopGame",
+    'director': "SELECT GameID, DirectorID FROM GameDirectors",
+}
+POSTINGS = FACET_TYPES + list(POSTINGS_SQL)
+# Postings keyed by integers rather than strings
+INTEGER_KEYS = ('year', 'developer', 'director')
+ORDERS = ('MobyScore', 'CriticRating', 'UserRating')
+
+GameRow = namedtuple('GameRow', 'ID CoverPhoto Name MobyScore')
+DirectorRow = namedtuple('DirectorRow', 'ID Name ProfilePicture Biography')
+Collaboration = namedtuple('Collaboration', 'DirectorID DirectorName ProfilePicture DeveloperID DeveloperName '
+                                            'Country Logo games_collaborated')
+
+
+class Strings:
+    # A string column as one UTF-8 blob plus offsets; NULLs are stored as empty strings
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return bytes(self.data[self.offsets[i]:self.offsets[i + 1]]).decode('utf-8')
+
+    def raw(self, i):
+        return self.data[self.offsets[i]:self.offsets[i + 1]]
+
+    @staticmethod
+    def encode(values):
+        encoded = [(value or '').encode('utf-8') if not isinstance(value, bytes) else value for value in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+class Postings:
+    # Docs (row numbers in the games columns) carrying each key, as CSR plus a serialized bitmap per key
+    def __init__(self, keys, indptr, docs, bitmaps):
+        self.keys = keys
+        self.indptr = indptr
+        self.docs = docs
+        self.bitmaps = bitmaps
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    def key(self, i):
+        return int(self.keys[i]) if isinstance(self.keys, np.ndarray) else self.keys[i]
+
+    def docs_of(self, i):
+        return self.docs[self.indptr[i]:self.indptr[i + 1]]
+
+    def bitmap(self, i):
+        return FrozenBitMap.deserialize(bytes(self.bitmaps.raw(i)))
+
+    def matrix(self, n_docs):
+        # keys x docs membership matrix
+        return sp.csr_matrix((np.ones(len(self.docs), dtype=np.float32), self.docs, self.indptr),
+                             shape=(len(self), n_docs))
+
+
+class Snapshot:
+    # One immutable version of the catalog, memory-mapped so every worker shares the same pages
+    def __init__(self, path):
+        self.path = path
+        self.version = os.path.basename(path)
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.arrays = {}
+        self.lock = threading.Lock()
+
+    def array(self, name):
+        array = self.arrays.get(name)
+        if array is None:
+            with self.lock:
+                array = self.arrays.get(name)
+                if array is None:
+                    array = self.arrays[name] = np.load(os.path.join(self.path, f'{name}.npy'), mmap_mode='r')
+        return array
+
+    def strings(self, name):
+        return Strings(self.array(f'{name}.data'), self.array(f'{name}.offsets'))
+
+    def postings(self, name):
+        keys = self.array(f'{name}.keys') if name in INTEGER_KEYS else self.strings(f'{name}.keys')
+        return Postings(keys, self.array(f'{name}.indptr'), self.array(f'{name}.docs'),
+                        self.strings(f'{name}.bitmaps'))
+
+    def docs(self, game_ids):
+        game_ids = np.asarray(game_ids, dtype=np.int64)
+        by_id = self.array('games.by_id')
+        sorted_ids = self.array('games.ID')[by_id]
+        positions = np.searchsorted(sorted_ids, game_ids)
+        known = positions < len(sorted_ids)
+        known[known] = sorted_ids[positions[known]] == game_ids[known]
+        return by_id[positions[known]]
+
+    def score(self, doc):
+        score = self.array('games.MobyScore')[doc]
+        return None if np.isnan(score) else float(score)
+
+    def game_rows(self, game_ids):
+        ids, names, covers = self.array('games.ID'), self.strings('games.Name'), self.strings('games.CoverPhoto')
+        return [GameRow(int(ids[doc]), covers[doc], names[doc], self.score(doc)) for doc in self.docs(game_ids)]
+
+    def game_cards(self, docs):
+        game_ids, names, covers = self.array('games.ID'), self.strings('games.Name'), self.strings('games.CoverPhoto')
+        return [{'id': int(game_ids[doc]), 'name': names[doc], 'image': covers[doc], 'score': self.score(doc)}
+                for doc in docs]
+
+    def top_games(self, facet_type, n=5):
+        # {value: top n games by MobyScore}, skipping values whose games are all unscored
+        postings = self.postings(facet_type)
+        rank = self.array('games.rank.MobyScore')
+        scored = ~np.isnan(self.array('games.MobyScore'))
+        result = {}
+        for i in sorted(range(len(postings)), key=lambda i: postings.key(i).casefold()):
+            docs = postings.docs_of(i)
+            docs = docs[scored[docs]]
+            if len(docs):
+                result[postings.key(i)] = self.game_cards(docs[np.argsort(rank[docs])[:n]])
+        return result
+
+    def top_companies_by_genre(self, n=5):
+        # Average critic rating over every platform release a company developed in the genre
+        genres, developers = self.postings('genre'), self.postings('developer')
+        critic_sum = self.array('games.CriticSum')
+        critic_count = self.array('games.CriticCount')
+        company_of = np.repeat(np.arange(len(developers)), np.diff(developers.indptr))
+        in_genre = np.zeros(len(critic_sum), dtype=bool)
+        result = {}
+        for i in sorted(range(len(genres)), key=lambda i: genres.key(i).casefold()):
+            in_genre[:] = False
+            in_genre[genres.docs_of(i)] = True
+            pairs = in_genre[developers.docs]
+            totals = np.bincount(company_of[pairs], weights=critic_sum[developers.docs[pairs]],
+                                 minlength=len(developers))
+            counts = np.bincount(company_of[pairs], weights=critic_count[developers.docs[pairs]],
+                                 minlength=len(developers))
+            rated = np.flatnonzero(counts)
+            averages = totals[rated] / counts[rated]
+            companies = []
+            for company, average in zip(rated[np.argsort(-averages, kind='stable')], np.sort(averages)[::-1]):
+                row = self.company(developers.key(company))
+                if row is not None:
+                    companies.append(dict(row, score_percentage=round(float(average), 1)))
+                if len(companies) == n:
+                    break
+            if companies:
+                result[genres.key(i)] = companies
+        return result
+
+    def top_collaborations(self, n=5):
+        # Games each (director, developer) pair made together: directors x docs times docs x developers
+        n_docs = len(self.array('games.ID'))
+        directors, developers = self.postings('director'), self.postings('developer')
+        together = (directors.matrix(n_docs) @ developers.matrix(n_docs).T).tocoo()
+        result = []
+        for i in np.argsort(-together.data, kind='stable'):
+            director = self.director(directors.key(together.row[i]))
+            company = self.company(developers.key(together.col[i]))
+            if director is None or company is None:
+                continue
+            result.append(Collaboration(director.ID, director.Name, director.ProfilePicture, company['id'],
+                                        company['name'], company['country'], company['logo'],
+                                        int(together.data[i])))
+            if len(result) == n:
+                break
+        return result
+
+    def row(self, table, entity_id):
+        ids = self.array(f'{table}.ID')
+        i = np.searchsorted(ids, entity_id)
+        return i if i < len(ids) and ids[i] == entity_id else None
+
+    def company(self, company_id):
+        i = self.row('companies', company_id)
+        if i is None:
+            return None
+        return {'id': int(company_id), 'name': self.strings('companies.Name')[i],
+                'logo': self.strings('companies.Logo')[i], 'country': self.strings('companies.Country')[i]}
+
+    def director(self, director_id):
+        i = self.row('directors', director_id)
+        if i is None:
+            return None
+        return DirectorRow(int(director_id), self.strings('directors.Name')[i],
+                           self.strings('directors.ProfilePicture')[i], self.strings('directors.Biography')[i])
+
+
+class SnapshotHolder:
+    def __init__(self, directory):
+        self.directory = directory
+        self.snapshot = None
+        self.checked = 0
+        self.lock = threading.Lock()
+
+    def current(self):
+        # Re-read the CURRENT pointer at most once a second; swapping it is how a new version goes live
+        if time.monotonic() - self.checked < 1:
+            return self.snapshot
+        self.checked = time.monotonic()
+        try:
+            with open(os.path.join(self.directory, 'CURRENT')) as f:
+                version = f.read().strip()
+        except FileNotFoundError:
+            return None
+        if self.snapshot is None or self.snapshot.version != version:
+            with self.lock:
+                if self.snapshot is None or self.snapshot.version != version:
+                    self.snapshot = Snapshot(os.path.join(self.directory, version))
+        return self.snapshot
+
+
+def catalog_snapshot():
+    return current_app.extensions['catalog_snapshot'].current()
+
+
+def postings_sql(name):
+    if name in POSTINGS_SQL:
+        return POSTINGS_SQL[name]
+    table_name, game_table = facet_tables(name)
+    return f"SELECT GameID, `{table_name}` FROM {game_table}"
+
+
+def write_array(path, name, array):
+    np.save(os.path.join(path, f'{name}.npy'), array)
+
+
+def write_strings(path, name, values):
+    data, offsets = Strings.encode(values)
+    write_array(path, f'{name}.data', data)
+    write_array(path, f'{name}.offsets', offsets)
+
+
+def write_postings(path, name, pairs, docs_of):
+    postings = {}
+    for game_id, key in pairs:
+        postings.setdefault(key, []).append(game_id)
+    keys = sorted(postings, key=str)
+    docs = [np.sort(docs_of(postings[key])).astype(np.int32) for key in keys]
+    indptr = np.zeros(len(keys) + 1, dtype=np.int64)
+    np.cumsum([len(d) for d in docs], out=indptr[1:])
+    if name in INTEGER_KEYS:
+        write_array(path, f'{name}.keys', np.array(keys, dtype=np.int64))
+    else:
+        write_strings(path, f'{name}.keys', keys)
+    write_array(path, f'{name}.indptr', indptr)
+    write_array(path, f'{name}.docs', np.concatenate(docs) if docs else np.empty(0, dtype=np.int32))
+    write_strings(path, f'{name}.bitmaps', [FrozenBitMap(d.tolist()).serialize() for d in docs])
+
+
+def build(connection, path):
+    games = sorted(connection.execute(text(GAMES_SQL)).fetchall(),
+                   key=lambda game: ((game.Name or '').casefold(), game.ID))
+    game_ids = np.array([game.ID for game in games], dtype=np.int64)
+    by_id = np.argsort(game_ids)
+    moby = np.array([np.nan if game.MobyScore is None else float(game.MobyScore) for game in games])
+
+    stats = {row.GameID: row for row in connection.execute(text(GAME_STATS_SQL))}
+    game_stats = [stats.get(game.ID) for game in games]
+    critic_sum = np.array([float(row.CriticSum or 0) if row else 0.0 for row in game_stats])
+    critic_count = np.array([int(row.CriticCount or 0) if row else 0 for row in game_stats], dtype=np.int64)
+    rating_total = np.array([float(row.RatingTotal or 0) if row else 0.0 for row in game_stats])
+    rating_count = np.array([int(row.RatingCount or 0) if row else 0 for row in game_stats], dtype=np.int64)
+
+    write_array(path, 'games.ID', game_ids)
+    write_array(path, 'games.by_id', by_id)
+    write_strings(path, 'games.Name', [game.Name for game in games])
+    write_strings(path, 'games.CoverPhoto', [game.CoverPhoto for game in games])
+    write_array(path, 'games.MobyScore', moby)
+    write_array(path, 'games.CriticSum', critic_sum)
+    write_array(path, 'games.CriticCount', critic_count)
+    write_array(path, 'games.RatingTotal', rating_total)
+    write_array(path, 'games.RatingCount', rating_count)
+    # Same order as the live FacetIndex: value DESC, NULLs last, then name
+    critic = [row.CriticSum / row.CriticCount if row and row.CriticCount else None for row in game_stats]
+    user = [row.RatingTotal / row.RatingCount if row and row.RatingCount else None for row in game_stats]
+    for order, values in zip(ORDERS, ([game.MobyScore for game in games], critic, user)):
+        write_array(path, f'games.rank.{order}', descending_rank(values))
+
+    sorted_ids = game_ids[by_id]
+
+    def docs_of(ids):
+        ids = np.asarray(ids, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(sorted_ids, ids), max(len(sorted_ids) - 1, 0))
+        known = sorted_ids[positions] == ids if len(sorted_ids) else np.zeros(len(ids), dtype=bool)
+        return by_id[positions[known]]
+
+    for name in POSTINGS:
+        write_postings(path, name, connection.execute(text(postings_sql(name))), docs_of)
+
+    companies = connection.execute(text(COMPANIES_SQL)).fetchall()
+    write_array(path, 'companies.ID', np.array([c.ID for c in companies], dtype=np.int64))
+    for column in ('Name', 'Country', 'Logo'):
+        write_strings(path, f'companies.{column}', [getattr(c, column) for c in companies])
+    directors = connection.execute(text(DIRECTORS_SQL)).fetchall()
+    write_array(path, 'directors.ID', np.array([d.ID for d in directors], dtype=np.int64))
+    for column in ('Name', 'ProfilePicture', 'Biography'):
+        write_strings(path, f'directors.{column}', [getattr(d, column) for d in directors])
+
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump({'built_at': time.time(), 'games': len(games)}, f)
+    return len(games)
+
+
+def publish(directory, version):
+    pointer = os.path.join(directory, 'CURRENT')
+    previous = open(pointer).read().strip() if os.path.exists(pointer) else None
+    with open(pointer + '.tmp', 'w') as f:
+        f.write(version)
+    os.replace(pointer + '.tmp', pointer)
+
+    # Keep the previous version: workers attached to it switch over on their next check
+    for name in os.listdir(directory):
+        if name not in (version, previous) and os.path.isdir(os.path.join(directory, name)):
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+
+@click.command('build-catalog-snapshot')
+@click.option('--bind', default=None, help='Bind key to read from, e.g. replica_0. Defaults to the primary.')
+@with_appcontext
+def build_catalog_snapshot_command(bind):
+    """Build a new catalog snapshot and make it the one workers read."""
+    directory = current_app.config['CATALOG_SNAPSHOT_DIR']
+    version = time.strftime('%Y%m%d%H%M%S')
+    path = os.path.join(directory, version)
+    os.makedirs(path, exist_ok=True)
+    start = time.perf_counter()
+    with db.engines[bind].connect() as connection:
+        games = build(connection, path)
+    publish(directory, version)
+    size = sum(entry.stat().st_size for entry in os.scandir(path))
+    click.echo(f'Built snapshot {version}: {games} games, {size / 1024 / 1024:.1f} MiB '
+               f'in {time.perf_counter() - start:.1f}s')
+
+
+def init_app(app):
+    if not app.config.get('CATALOG_SNAPSHOT_DIR'):
+        app.config['CATALOG_SNAPSHOT_DIR'] = os.path.join(app.instance_path, 'catalog')
+    app.extensions['catalog_snapshot'] = SnapshotHolder(app.config['CATALOG_SNAPSHOT_DIR'])
+    app.cli.add_command(build_catalog_snapshot_command)
@@ -0,0 +1,527 @@
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app.budgets import check_budget
+from app.catalog import FACET_TYPES, facet_tables
+from app.extensions import db
+
+# Every statement the views run, by a stable name that also labels its metrics
+SQL = {
+    'create_account.existing_user': "SELECT Username, Email FROM `User` WHERE Username = :username OR Email = :email LIMIT 1",
+    'create_account.insert_user': "INSERT INTO `User` (Username, Gender, Email, Country, DOB) VALUES (:username, :gender, :email, :country, :dob)",
+    'login.user': "SELECT Username FROM `User` WHERE Username = :username LIMIT 1",
+    'directors.count': "SELECT COUNT(*) AS total FROM DirectorCounts",
+    # Each page is picked from the counter index alone; only its rows are joined to Director
+    'directors.page.name': """
+        SELECT d.ID, d.`Name`, d.ProfilePicture, dc.Games AS games_num
+        FROM (SELECT DirectorID FROM DirectorCounts ORDER BY `Name`, DirectorID LIMIT :limit OFFSET :offset) page
+        INNER JOIN DirectorCounts dc ON dc.DirectorID = page.DirectorID
+        INNER JOIN Director d ON d.ID = dc.DirectorID
+        ORDER BY dc.`Name`, dc.DirectorID
+    """,
+    'directors.page.games': """
+        SELECT d.ID, d.`Name`, d.ProfilePicture, dc.Games AS games_num
+        FROM (SELECT DirectorID FROM DirectorCounts ORDER BY Games DESC, DirectorID DESC LIMIT :limit OFFSET :offset) page
+        INNER JOIN DirectorCounts dc ON dc.DirectorID = page.DirectorID
+        INNER JOIN Director d ON d.ID = dc.DirectorID
+        ORDER BY dc.Games DESC, dc.DirectorID DESC
+    """,
+    # Aggregated from the link tables while DirectorCounts is still empty (before `flask entity-counts rebuild`)
+    'directors.live.count': "SELECT COUNT(DISTINCT d.ID) AS total FROM Director d INNER JOIN GameDirectors gd ON d.ID = gd.DirectorID",
+    'directors.live.page.name': """
+        SELECT d.ID, d.`Name`, d.ProfilePicture, COUNT(*) AS games_num
+        FROM Director d INNER JOIN GameDirectors gd ON d.ID = gd.DirectorID
+        GROUP BY d.ID, d.`Name`, d.ProfilePicture
+        ORDER BY d.`Name`, d.ID
+        LIMIT :limit
+        OFFSET :offset
+    """,
+    'directors.live.page.games': """
+        SELECT d.ID, d.`Name`, d.ProfilePicture, COUNT(*) AS games_num
+        FROM Director d INNER JOIN GameDirectors gd ON d.ID = gd.DirectorID
+        GROUP BY d.ID, d.`Name`, d.ProfilePicture
+        ORDER BY games_num DESC, d.ID DESC
+        LIMIT :limit
+        OFFSET :offset
+    """,
+    'companies.count': "SELECT COUNT(*) AS total FROM CompanyCounts",
+    'companies.page.name': """
+        SELECT c.ID, c.`Name`, c.Logo, cc.Developed AS developed_games_num, cc.Published AS published_games_num
+        FROM (SELECT CompanyID FROM CompanyCounts ORDER BY `Name`, CompanyID LIMIT :limit OFFSET :offset) page
+        INNER JOIN CompanyCounts cc ON cc.CompanyID = page.CompanyID
+        INNER JOIN Company c ON c.ID = cc.CompanyID
+        ORDER BY cc.`Name`, cc.CompanyID
+    """,
+    'companies.page.developed': """
+        SELECT c.ID, c.`Name`, c.Logo, cc.Developed AS developed_games_num, cc.Published AS published_games_num
+        FROM (SELECT CompanyID FROM CompanyCounts ORDER BY Developed DESC, CompanyID DESC LIMIT :limit OFFSET :offset) page
+        INNER JOIN CompanyCounts cc ON cc.CompanyID = page.CompanyID
+        INNER JOIN Company c ON c.ID = cc.CompanyID
+        ORDER BY cc.Developed DESC, cc.CompanyID DESC
+    """,
+    'companies.page.published': """
+        SELECT c.ID, c.`Name`, c.Logo, cc.Developed AS developed_games_num, cc.Published AS published_games_num
+        FROM (SELECT CompanyID FROM CompanyCounts ORDER BY Published DESC, CompanyID DESC LIMIT :limit OFFSET :offset) page
+        INNER JOIN CompanyCounts cc ON cc.CompanyID = page.CompanyID
+        INNER JOIN Company c ON c.ID = cc.CompanyID
+        ORDER BY cc.Published DESC, cc.CompanyID DESC
+    """,
+    'companies.live.count': "SELECT COUNT(*) AS total FROM Company",
+    'companies.live.page.name': """
+        SELECT c.ID, c.`Name`, c.Logo,
+            (SELECT COUNT(DISTINCT GameID) FROM CompanyDevelopGame WHERE CompanyID = c.ID) AS developed_games_num,
+            (SELECT COUNT(DISTINCT GameID) FROM CompanyPublishGame WHERE CompanyID = c.ID) AS published_games_num
+        FROM Company c
+        ORDER BY c.`Name`, c.ID
+        LIMIT :limit
+        OFFSET :offset
+    """,
+    'companies.live.page.developed': """
+        SELECT c.ID, c.`Name`, c.Logo,
+            (SELECT COUNT(DISTINCT GameID) FROM CompanyDevelopGame WHERE CompanyID = c.ID) AS developed_games_num,
+            (SELECT COUNT(DISTINCT GameID) FROM CompanyPublishGame WHERE CompanyID = c.ID) AS published_games_num
+        FROM Company c
+        ORDER BY developed_games_num DESC, c.ID DESC
+        LIMIT :limit
+        OFFSET :offset
+    """,
+    'companies.live.page.published': """
+        SELECT c.ID, c.`Name`, c.Logo,
+            (SELECT COUNT(DISTINCT GameID) FROM CompanyDevelopGame WHERE CompanyID = c.ID) AS developed_games_num,
+            (SELECT COUNT(DISTINCT GameID) FROM CompanyPublishGame WHERE CompanyID = c.ID) AS published_games_num
+        FROM Company c
+        ORDER BY published_games_num DESC, c.ID DESC
+        LIMIT :limit
+        OFFSET :offset
+    """,
+    'platforms.names': "SELECT `Name` FROM Platform",
+    'game_genres.genres': "SELECT `Name` FROM Genre",
+    'game_genres.settings': "SELECT `Name` FROM Setting",
+    'game_genres.gameplays': "SELECT `Name` FROM Gameplay",
+    'game_genres.interfaces': "SELECT `Name` FROM Interface",
+    'game_genres.perspectives': "SELECT `Name` FROM Perspective",
+    'game_genres.visuals': "SELECT `Name` FROM Visual",
+    'game_genres.arts': "SELECT `Name` FROM Art",
+    'game_genres.narratives': "SELECT `Name` FROM Narrative",
+    'game_genres.pacings': "SELECT `Name` FROM Pacing",
+    'platform_games.verify': "SELECT COUNT(GameID) AS count FROM GamesPlatform WHERE PlatformName = :platform_name",
+    'platform_games.games': """
+        SELECT g.ID, g.`Name`, g.CoverPhoto, g.MobyScore
+        FROM Game g
+        INNER JOIN GamesPlatform gp ON g.ID = gp.GameID
+        WHERE gp.PlatformName = :platform_name
+        ORDER BY g.`Name`
+        LIMIT :limit OFFSET :offset
+    """,
+    'game_document.game': "SELECT ID, `Name`, Site, MobyScore, CoverPhoto, `Description` FROM Game WHERE ID = :game_id LIMIT 1",
+    'game_document.arts': "SELECT Art FROM GameArt WHERE GameID = :game_id",
+    'game_document.gameplay': "SELECT Gameplay FROM GameGameplay WHERE GameID = :game_id",
+    'game_document.narrative': "SELECT Narrative FROM GameNarrative WHERE GameID = :game_id",
+    'game_document.visual': "SELECT Visual FROM GameVisual WHERE GameID = :game_id",
+    'game_document.perspective': "SELECT Perspective FROM GamePerspective WHERE GameID = :game_id",
+    'game_document.genre': "SELECT Genre FROM GameGenre WHERE GameID = :game_id",
+    'game_document.interface': "SELECT Interface FROM GameInterface WHERE GameID = :game_id",
+    'game_document.pacing': "SELECT Pacing FROM GamePacing WHERE GameID = :game_id",
+    'game_document.setting': "SELECT Setting FROM GameSetting WHERE GameID = :game_id",
+    'game_document.developers': """
+        SELECT c.ID, c.`Name`, c.Logo
+        FROM Company c
+        INNER JOIN CompanyDevelopGame cdg ON c.ID = cdg.CompanyID
+        WHERE cdg.GameID = :game_id
+    """,
+    'game_document.publishers': """
+        SELECT c.ID, c.`Name`, c.Logo
+        FROM Company c
+        INNER JOIN CompanyPublishGame cpg ON c.ID = cpg.CompanyID
+        WHERE cpg.GameID = :game_id
+    """,
+    'game_document.avg_critic': "SELECT AVG(AvgCriticRatingPercentage) as AvgCritic FROM GamesPlatform WHERE GameID = :game_id AND AvgCriticRatingPercentage IS NOT NULL",
+    'game_document.avg_user': """
+        SELECT
+            SUM(TotalPlayerRating) as TotalRating,
+            SUM(NumPlayersRated) as TotalPlayers
+        FROM GamesPlatform
+        WHERE GameID = :game_id
+    """,
+    'game_document.director': """
+        SELECT d.ID, d.`Name`
+        FROM Director d
+        INNER JOIN GameDirectors gd ON d.ID = gd.DirectorID
+        WHERE gd.GameID = :game_id
+    """,
+    'game_detail.user_rating': "SELECT Rating, PlatformName FROM UserRatings WHERE Username = :username AND GameID = :game_id LIMIT 1",
+    'add_rating.game': "SELECT ID, `Name` FROM Game WHERE ID = :game_id LIMIT 1",
+    'add_rating.platforms': """
+        SELECT PlatformName FROM GamesPlatform
+        WHERE GameID = :game_id
+        ORDER BY PlatformName
+    """,
+    'add_rating.check': """
+        SELECT Rating, PlatformName FROM UserRatings
+        WHERE Username = :username AND GameID = :game_id
+        LIMIT 1
+    """,
+    'add_rating.remove_old': """
+        UPDATE GamesPlatform
+        SET TotalPlayerRating = TotalPlayerRating - :old_rating,
+            NumPlayersRated = NumPlayersRated - 1
+        WHERE GameID = :game_id AND PlatformName = :platform
+    """,
+    'add_rating.set_null': """
+        UPDATE GamesPlatform
+        SET TotalPlayerRating = NULL, NumPlayersRated = NULL
+        WHERE GameID = :game_id AND PlatformName = :platform AND NumPlayersRated <= 0
+    """,
+    'add_rating.add': """
+        UPDATE GamesPlatform
+        SET TotalPlayerRating = COALESCE(TotalPlayerRating, 0) + :new_rating,
+            NumPlayersRated = COALESCE(NumPlayersRated, 0) + 1
+        WHERE GameID = :game_id AND PlatformName = :platform
+    """,
+    'add_rating.update': """
+        UPDATE UserRatings
+        SET Rating = :new_rating, PlatformName = :new_platform
+        WHERE Username = :username AND GameID = :game_id
+    """,
+    'add_rating.insert': """
+        INSERT INTO UserRatings (Username, PlatformName, GameID, Rating)
+        VALUES (:username, :platform, :game_id, :rating)
+    """,
+    'ratings.count': "SELECT COUNT(*) AS total FROM UserRatings INNER JOIN Game ON GameID = ID WHERE Username = :username",
+    'ratings.games': """
+        SELECT ur.Rating, g.ID, g.`Name`, g.CoverPhoto
+        FROM UserRatings ur INNER JOIN Game g
+        ON ur.GameID = g.ID
+        WHERE ur.Username = :username
+        LIMIT :limit
+        OFFSET :offset
+    """,
+    'game_releases.game': "SELECT ID, `Name` FROM Game WHERE ID = :game_id LIMIT 1",
+    'game_releases.releases': """
+        SELECT gp.GameID, gp.PlatformName, gp.DateOfRelease, gp.BusinessModel, gp.MaturityRating, gp.TotalPlayerRating,
+            gp.NumPlayersRated, gp.AvgCriticRatingPercentage, gp.Price
+        FROM GamesPlatform gp
+        WHERE gp.GameID = :game_id
+        ORDER BY gp.DateOfRelease , gp.PlatformName
+    """,
+    'game_releases.media_types': """
+        SELECT MediaType FROM GamesPlatformMediaType
+        WHERE GameID = :game_id AND PlatformName = :platform_name
+    """,
+    'game_releases.input_devices': """
+        SELECT InputDevice FROM GamesPlatformInputDevice
+        WHERE GameID = :game_id AND PlatformName = :platform_name
+    """,
+    'director_document.director': "SELECT ID, `Name`, ProfilePicture, Biography FROM Director WHERE ID = :director_id LIMIT 1",
+    'director_document.game_count': "SELECT COUNT(*) as count FROM GameDirectors WHERE DirectorID = :director_id",
+    'director_document.averages': """
+        SELECT AVG(gp.AvgCriticRatingPercentage) as AvgCritic,
+        SUM(gp.TotalPlayerRating) / NULLIF(SUM(gp.NumPlayersRated), 0) as AvgUser
+        FROM GamesPlatform gp
+        INNER JOIN GameDirectors gd ON gd.GameID = gp.GameID
+        WHERE gd.DirectorID = :director_id
+    """,
+    'director_document.directed_games': """
+        SELECT
+            g.ID,
+            g.Name,
+            g.CoverPhoto,
+            g.MobyScore
+        FROM Game g
+        INNER JOIN GameDirectors gd ON g.ID = gd.GameID
+        WHERE gd.DirectorID = :director_id
+    """,
+    'director_document.websites': "SELECT URL FROM DirectorWebsites WHERE DirectorID = :director_id",
+    'company_document.company': "SELECT ID, `Name`, Logo, Overview, Country FROM Company WHERE ID = :company_id LIMIT 1",
+    'company_document.developed_count': "SELECT COUNT(*) as count FROM CompanyDevelopGame WHERE CompanyID = :company_id",
+    'company_document.published_count': "SELECT COUNT(*) as count FROM CompanyPublishGame WHERE CompanyID = :company_id",
+    'company_document.developer_averages': """
+        SELECT AVG(gp.AvgCriticRatingPercentage) as AvgCritic,
+        SUM(gp.TotalPlayerRating) / NULLIF(SUM(gp.NumPlayersRated), 0) as AvgUser
+        FROM GamesPlatform gp
+        INNER JOIN CompanyDevelopGame cdg ON gp.GameID = cdg.GameID
+        WHERE cdg.CompanyID = :company_id
+    """,
+    'company_document.publisher_averages': """
+        SELECT AVG(gp.AvgCriticRatingPercentage) as AvgCritic,
+        SUM(gp.TotalPlayerRating) / NULLIF(SUM(gp.NumPlayersRated), 0) as AvgUser
+        FROM GamesPlatform gp
+        INNER JOIN CompanyPublishGame cpg ON gp.GameID = cpg.GameID
+        WHERE cpg.CompanyID = :company_id
+    """,
+    'company_document.developed_games': """
+        SELECT
+            g.ID,
+            g.Name,
+            g.CoverPhoto,
+            g.MobyScore
+        FROM Game g
+        INNER JOIN CompanyDevelopGame cdg ON g.ID = cdg.GameID
+        WHERE cdg.CompanyID = :company_id
+    """,
+    'company_document.published_games': """
+        SELECT
+            g.ID,
+            g.Name,
+            g.CoverPhoto,
+            g.MobyScore
+        FROM Game g
+        INNER JOIN CompanyPublishGame cpg ON g.ID = cpg.GameID
+        WHERE cpg.CompanyID = :company_id
+    """,
+    'company_document.websites': "SELECT URL FROM CompanyWebsites WHERE CompanyID = :company_id",
+    'platform_document.game_count': "SELECT COUNT(GameID) AS count FROM GamesPlatform WHERE PlatformName = :platform_name",
+    'platform_document.averages': """
+        SELECT AVG(AvgCriticRatingPercentage) as AvgCritic,
+        SUM(TotalPlayerRating) / NULLIF(SUM(NumPlayersRated), 0) as AvgUser
+        FROM GamesPlatform
+        WHERE PlatformName = :platform_name
+    """,
+    'top5_games_by_genre.genres': "SELECT `Name` FROM Genre ORDER BY `Name`",
+    'top5_games_by_genre.top_games': """
+        SELECT g.ID, g.`Name`, g.CoverPhoto, g.MobyScore FROM Game g
+        INNER JOIN GameGenre gg ON g.ID = gg.GameID
+        WHERE gg.Genre = :genre
+        AND g.MobyScore IS NOT NULL
+        ORDER BY g.MobyScore DESC
+        LIMIT 5
+    """,
+    'top5_games_by_setting.settings': "SELECT `Name` FROM Setting ORDER BY `Name`",
+    'top5_games_by_setting.top_games': """
+        SELECT g.ID, g.`Name`, g.CoverPhoto, g.MobyScore FROM Game g
+        INNER JOIN GameSetting gs ON g.ID = gs.GameID
+        WHERE gs.Setting = :setting
+        AND g.MobyScore IS NOT NULL
+        ORDER BY g.MobyScore DESC
+        LIMIT 5
+    """,
+    'top5_companies_by_genre.genres': "SELECT `Name` FROM Genre ORDER BY `Name`",
+    'top5_companies_by_genre.top_companies': """
+        SELECT c.ID, c.`Name`, c.Country, c.Logo, AVG(gp.AvgCriticRatingPercentage) AS AvgCritic
+        FROM Company c INNER JOIN CompanyDevelopGame cg ON c.ID = cg.CompanyID
+        INNER JOIN GameGenre gg ON cg.GameID = gg.GameID AND gg.Genre = :genre
+        INNER JOIN GamesPlatform gp ON cg.GameID = gp.GameID
+        GROUP BY 1, 2, 3, 4
+        ORDER BY 5 DESC
+        LIMIT 5
+    """,
+    'top5_directors_by_volume.directors': """
+        SELECT d.ID, d.`Name`, d.ProfilePicture, d.Biography, dc.Games AS games_directed
+        FROM (SELECT DirectorID, Games FROM DirectorCounts ORDER BY Games DESC, DirectorID DESC LIMIT 5) dc
+        INNER JOIN Director d ON d.ID = dc.DirectorID
+        ORDER BY dc.Games DESC, dc.DirectorID DESC
+    """,
+    'top5_directors_by_volume.live_directors': """
+        SELECT d.ID, d.`Name`, d.ProfilePicture, d.Biography, COUNT(gd.GameID) AS games_directed
+        FROM Director d INNER JOIN GameDirectors gd ON d.ID = gd.DirectorID
+        GROUP BY d.ID, d.`Name`, d.ProfilePicture, d.Biography
+        ORDER BY games_directed DESC, d.ID DESC
+        LIMIT 5
+    """,
+    'top5_collaborations.collaborations': """
+        SELECT d.ID AS DirectorID, d.`Name` AS DirectorName, d.ProfilePicture,
+        c.ID AS DeveloperID, c.`Name` AS DeveloperName, c.Country, c.Logo, COUNT(DISTINCT gd.GameID) AS games_collaborated
+        FROM Director d INNER JOIN GameDirectors gd ON d.ID = gd.DirectorID
+        INNER JOIN CompanyDevelopGame cpg ON gd.GameID = cpg.GameID
+        INNER JOIN Company c ON cpg.CompanyID = c.ID
+        GROUP BY 1, 2, 3, 4, 5, 6, 7
+        ORDER BY 8 DESC
+        LIMIT 5
+    """,
+    'dream_game.best_dev': """
+        SELECT
+            c.ID,
+            c.`Name`,
+            c.Logo,
+            SUM(gp.TotalPlayerRating) / SUM(gp.NumPlayersRated) as AvgRating
+        FROM Company c
+        INNER JOIN CompanyDevelopGame cdg ON c.ID = cdg.CompanyID
+        INNER JOIN GamesPlatform gp ON cdg.GameID = gp.GameID
+        WHERE gp.NumPlayersRated > 0
+        GROUP BY c.ID, c.`Name`, c.Logo
+        ORDER BY AvgRating DESC
+        LIMIT 1
+    """,
+    'dream_game.best_pub': """
+        SELECT
+            c.ID,
+            c.`Name`,
+            c.Logo,
+            SUM(gp.TotalPlayerRating) / SUM(gp.NumPlayersRated) as AvgRating
+        FROM Company c
+        INNER JOIN CompanyPublishGame cpg ON c.ID = cpg.CompanyID
+        INNER JOIN GamesPlatform gp ON cpg.GameID = gp.GameID
+        WHERE gp.NumPlayersRated > 0
+        GROUP BY c.ID, c.`Name`, c.Logo
+        ORDER BY AvgRating DESC
+        LIMIT 1
+    """,
+    'dream_game.best_director': """
+        SELECT
+            d.ID,
+            d.`Name`,
+            d.ProfilePicture,
+            d.Biography,
+            SUM(gp.TotalPlayerRating) / SUM(gp.NumPlayersRated) as AvgRating
+        FROM Director d
+        INNER JOIN GameDirectors gd ON d.ID = gd.DirectorID
+        INNER JOIN GamesPlatform gp ON gd.GameID = gp.GameID
+        WHERE gp.NumPlayersRated > 0
+        GROUP BY d.ID, d.`Name`, d.ProfilePicture, d.Biography
+        ORDER BY AvgRating DESC
+        LIMIT 1
+    """,
+    'dream_game.best_setting': """
+        SELECT
+            gs.Setting,
+            SUM(gp.TotalPlayerRating) / SUM(gp.NumPlayersRated) as AvgRating
+        FROM GameSetting gs
+        INNER JOIN GamesPlatform gp ON gs.GameID = gp.GameID
+        WHERE gp.NumPlayersRated > 0
+        GROUP BY gs.Setting
+        ORDER BY AvgRating DESC
+        LIMIT 1
+    """,
+    'dream_game.best_genre': """
+        SELECT
+            gg.Genre,
+            SUM(gp.TotalPlayerRating) / SUM(gp.NumPlayersRated) as AvgRating
+        FROM GameGenre gg
+        INNER JOIN GamesPlatform gp ON gg.GameID = gp.GameID
+        WHERE gp.NumPlayersRated > 0
+        GROUP BY gg.Genre
+        ORDER BY AvgRating DESC
+        LIMIT 1
+    """,
+    'dream_game.best_gameplay': """
+        SELECT
+            ggp.Gameplay,
+            SUM(gp.TotalPlayerRating) / SUM(gp.NumPlayersRated) as AvgRating
+        FROM GameGameplay ggp
+        INNER JOIN GamesPlatform gp ON ggp.GameID = gp.GameID
+        WHERE gp.NumPlayersRated > 0
+        GROUP BY ggp.Gameplay
+        ORDER BY AvgRating DESC
+        LIMIT 1
+    """,
+    'dream_game.best_interface': """
+        SELECT
+            gi.Interface,
+            SUM(gp.TotalPlayerRating) / SUM(gp.NumPlayersRated) as AvgRating
+        FROM GameInterface gi
+        INNER JOIN GamesPlatform gp ON gi.GameID = gp.GameID
+        WHERE gp.NumPlayersRated > 0
+        GROUP BY gi.Interface
+        ORDER BY AvgRating DESC
+        LIMIT 1
+    """,
+    'dream_game.best_perspective': """
+        SELECT
+            gp_attr.Perspective,
+            SUM(gp.TotalPlayerRating) / SUM(gp.NumPlayersRated) as AvgRating
+        FROM GamePerspective gp_attr
+        INNER JOIN GamesPlatform gp ON gp_attr.GameID = gp.GameID
+        WHERE gp.NumPlayersRated > 0
+        GROUP BY gp_attr.Perspective
+        ORDER BY AvgRating DESC
+        LIMIT 1
+    """,
+    'dream_game.best_visual': """
+        SELECT
+            gv.Visual,
+            SUM(gp.TotalPlayerRating) / SUM(gp.NumPlayersRated) as AvgRating
+        FROM GameVisual gv
+        INNER JOIN GamesPlatform gp ON gv.GameID = gp.GameID
+        WHERE gp.NumPlayersRated > 0
+        GROUP BY gv.Visual
+        ORDER BY AvgRating DESC
+        LIMIT 1
+    """,
+    'dream_game.best_narrative': """
+        SELECT
+            gn.Narrative,
+            SUM(gp.TotalPlayerRating) / SUM(gp.NumPlayersRated) as AvgRating
+        FROM GameNarrative gn
+        INNER JOIN GamesPlatform gp ON gn.GameID = gp.GameID
+        WHERE gp.NumPlayersRated > 0
+        GROUP BY gn.Narrative
+        ORDER BY AvgRating DESC
+        LIMIT 1
+    """,
+    'dream_game.best_pacing': """
+        SELECT
+            gpc.Pacing,
+            SUM(gp.TotalPlayerRating) / SUM(gp.NumPlayersRated) as AvgRating
+        FROM GamePacing gpc
+        INNER JOIN GamesPlatform gp ON gpc.GameID = gp.GameID
+        WHERE gp.NumPlayersRated > 0
+        GROUP BY gpc.Pacing
+        ORDER BY AvgRating DESC
+        LIMIT 1
+    """,
+    'dream_game.best_art': """
+        SELECT
+            ga.Art,
+            SUM(gp.TotalPlayerRating) / SUM(gp.NumPlayersRated) as AvgRating
+        FROM GameArt ga
+        INNER JOIN GamesPlatform gp ON ga.GameID = gp.GameID
+        WHERE gp.NumPlayersRated > 0
+        GROUP BY ga.Art
+        ORDER BY AvgRating DESC
+        LIMIT 1
+    """,
+}
+
+# The genre pages read per facet-type tables; every variant is enumerated here instead of formatted per request
+FACET_SQL = {
+    'genre_games.verify': "SELECT COUNT(*) AS count FROM {table_name} WHERE `Name` = :name",
+    'genre_games.count': """
+        SELECT COUNT(GameID) as total
+        FROM {game_table}
+        WHERE {table_name} = :name
+    """,
+    'genre_games.games': """
+        SELECT g.ID, g.`Name`, g.CoverPhoto, g.MobyScore
+        FROM Game g
+        INNER JOIN {game_table} gt ON g.ID = gt.GameID
+        WHERE gt.{table_name} = :name
+        ORDER BY g.`Name`
+        LIMIT :limit OFFSET :offset
+    """,
+    'genre_detail.verify': "SELECT COUNT(*) AS count FROM {table_name} WHERE `Name` = :name",
+    'genre_detail.count': """
+        SELECT COUNT(DISTINCT GameID) AS count
+        FROM {game_table}
+        WHERE {table_name} = :name
+    """,
+    'genre_detail.averages': """
+        SELECT AVG(gp.AvgCriticRatingPercentage) as AvgCritic,
+        SUM(gp.TotalPlayerRating) / SUM(gp.NumPlayersRated) as AvgUser
+        FROM GamesPlatform gp
+        INNER JOIN {game_table} gt ON gp.GameID = gt.GameID
+        WHERE gt.{table_name} = :name
+    """,
+}
+SQL.update({f'{name}.{facet_type}': sql.format(table_name=facet_tables(facet_type)[0],
+                                                game_table=facet_tables(facet_type)[1])
+            for facet_type in FACET_TYPES for name, sql in FACET_SQL.items()})
+
+# Built once at import: SQLAlchemy's compiled cache and the driver's statement cache see the same object
+STATEMENTS = {name: db.text(sql).execution_options(statement_name=name) for name, sql in SQL.items()}
+
+
+def statement(name):
+    return STATEMENTS[name]
+
+
+def execute(name, params=None):
+    check_budget(SQL[name])
+    return db.session.execute(STATEMENTS[name], params or {})
+
+
+@event.listens_for(Engine, 'do_connect')
+def size_statement_cache(dialect, conn_rec, cargs, cparams):
+    # sqlite3 prepares each statement once per connection and keeps an LRU of them (128 by default);
+    # make it large enough that the whole registry stays prepared. The MySQL drivers in use
+    # (mysqlclient, PyMySQL) interpolate client-side and have no server-side prepare to enable.
+    if dialect.name == 'sqlite':
+        cparams.setdefault('cached_statements', len(STATEMENTS) + 128)
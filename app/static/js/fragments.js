@@ -0,0 +1,63 @@
+// Progressive enhancement for listing pages: pager links and GET forms inside a [data-fragment] region
+// fetch just that region (?fragment=<name>) and swap it in place. Without JS they are plain links and forms.
+(function () {
+    function load(region, url, push) {
+        const name = region.dataset.fragment;
+        const target = new URL(url, window.location.href);
+        target.searchParams.set('fragment', name);
+        region.setAttribute('aria-busy', 'true');
+        fetch(target, {credentials: 'same-origin'})
+            .then(response => {
+                // A redirect means the session expired or the page moved: let the browser follow it
+                if (!response.ok || response.redirected) {
+                    throw new Error(response.status);
+                }
+                return response.text();
+            })
+            .then(html => {
+                region.outerHTML = html;
+                if (push) {
+                    history.pushState(null, '', url);
+                    const replaced = document.querySelector(`[data-fragment="${name}"]`);
+                    if (replaced && replaced.getBoundingClientRect().top < 0) {
+                        replaced.scrollIntoView();
+                    }
+                }
+            })
+            .catch(() => {
+                window.location.href = url;
+            });
+    }
+
+    document.addEventListener('click', event => {
+        const link = event.target.closest('a[data-fragment-link]');
+        if (!link || event.button !== 0 || event.metaKey || event.ctrlKey || event.shiftKey || event.altKey) {
+            return;
+        }
+        const region = link.closest('[data-fragment]');
+        if (region) {
+            event.preventDefault();
+            load(region, link.href, true);
+        }
+    });
+
+    document.addEventListener('submit', event => {
+        const form = event.target;
+        const region = form.closest('[data-fragment]');
+        if (!region || form.method.toLowerCase() !== 'get') {
+            return;
+        }
+        event.preventDefault();
+        const url = new URL(form.action, window.location.href);
+        url.search = new URLSearchParams(new FormData(form)).toString();
+        load(region, url.href, true);
+    });
+
+    // Back/forward: reload the outermost region for the restored URL
+    window.addEventListener('popstate', () => {
+        const region = document.querySelector('[data-fragment]');
+        if (region) {
+            load(region, window.location.href, false);
+        }
+    });
+})();
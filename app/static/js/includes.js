@@ -0,0 +1,29 @@
+// Pre-rendered pages (flask prerender-pages) are the same for every visitor; their per-user regions are
+// placeholders carrying data-include="<url>" and data-part="<name>". Each URL is fetched once and every
+// placeholder is replaced by the element with the same data-part in the response.
+(function () {
+    const placeholders = Array.from(document.querySelectorAll('[data-include]'));
+    const urls = new Set(placeholders.map(placeholder => placeholder.dataset.include));
+    urls.forEach(url => {
+        fetch(url, {credentials: 'same-origin'})
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error(response.status);
+                }
+                return response.text();
+            })
+            .then(html => {
+                const template = document.createElement('template');
+                template.innerHTML = html;
+                placeholders.filter(placeholder => placeholder.dataset.include === url).forEach(placeholder => {
+                    const part = template.content.querySelector(`[data-part="${placeholder.dataset.part}"]`);
+                    if (part) {
+                        placeholder.replaceWith(part);
+                    }
+                });
+                document.dispatchEvent(new Event('fragments:included'));
+            })
+            // Placeholders keep their fallback content
+            .catch(() => {});
+    });
+})();
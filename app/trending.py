@@ -0,0 +1,151 @@
+import heapq
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+import numpy as np
+from flask import current_app
+from app.extensions import db
+from app.facets import page_games
+from app.rating_events import utcnow
+
+EVENTS_SQL = db.text("""
+    SELECT EventID, CreatedAt, GameID, Rating FROM RatingEvents
+    WHERE EventID > :after AND CreatedAt >= :since
+    ORDER BY EventID
+""").columns(EventID=db.BigInteger, CreatedAt=db.DateTime, GameID=db.Integer, Rating=db.Float)
+
+EPOCH = datetime(1970, 1, 1)
+# EventIDs are taken at insert but become visible at commit, so a lower ID can appear after a higher one.
+# An event older than SETTLE is taken as final: its transaction committed or rolled back by then.
+SETTLE = timedelta(seconds=30)
+# Without a checkpoint, replay starts this many half-lives back; anything older weighs under 2^-16
+REPLAY_HALF_LIVES = 16
+# Stored scores grow with time; they are rescaled to a new epoch once they have grown by 2^RESCALE
+RESCALE = 32
+# Scores that have decayed below this are dropped on rescale
+PRUNE = 1e-3
+
+
+def seconds(moment):
+    return (moment - EPOCH).total_seconds()
+
+
+class TrendingBoard:
+    # A rating r at time t adds r * 2^((t - epoch) / half_life) to its game. All scores decay by the same
+    # factor, so the order never changes between events and updates are O(1); reading the current value
+    # multiplies by 2^((epoch - now) / half_life).
+    def __init__(self, directory, half_life, size, poll_interval, checkpoint_interval):
+        self.directory = directory
+        self.half_life = half_life
+        self.size = size
+        self.poll_interval = poll_interval
+        self.checkpoint_interval = checkpoint_interval
+        self.scores = None
+        self.epoch = 0.0
+        # Every event up to horizon is applied; pending holds the applied ones above it, by EventID
+        self.horizon = 0
+        self.horizon_at = None
+        self.pending = {}
+        self.leaders = []
+        self.polled_at = 0.0
+        self.checkpointed_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def checkpoint_path(self):
+        return os.path.join(self.directory, 'checkpoint.npz')
+
+    def load(self, connection, now):
+        self.scores, self.pending = {}, {}
+        try:
+            with np.load(self.checkpoint_path()) as state:
+                self.epoch = float(state['epoch'])
+                self.horizon = int(state['horizon'])
+                self.horizon_at = EPOCH + timedelta(seconds=float(state['horizon_at']))
+                self.scores = dict(zip(state['game_ids'].tolist(), state['scores'].tolist()))
+                self.pending = {event_id: EPOCH + timedelta(seconds=at)
+                                for event_id, at in zip(state['pending_ids'].tolist(), state['pending_at'].tolist())}
+        except FileNotFoundError:
+            self.epoch = seconds(now)
+            self.horizon = 0
+            self.horizon_at = now - timedelta(seconds=REPLAY_HALF_LIVES * self.half_life)
+        self.poll(connection, now)
+
+    def poll(self, connection, now):
+        # Only events past the horizon are read; the CreatedAt bound lets MySQL prune old partitions
+        rows = connection.execute(EVENTS_SQL, {'after': self.horizon, 'since': self.horizon_at - SETTLE})
+        for event_id, created_at, game_id, rating in rows:
+            if event_id in self.pending:
+                continue
+            self.pending[event_id] = created_at
+            weight = rating * 2 ** ((seconds(created_at) - self.epoch) / self.half_life)
+            self.scores[game_id] = self.scores.get(game_id, 0.0) + weight
+
+        settled = [event_id for event_id, created_at in self.pending.items() if created_at < now - SETTLE]
+        if settled:
+            self.horizon = max(settled)
+            self.horizon_at = self.pending[self.horizon]
+            self.pending = {event_id: at for event_id, at in self.pending.items() if event_id > self.horizon}
+        if seconds(now) - self.epoch > RESCALE * self.half_life:
+            self.rescale(seconds(now))
+        self.leaders = heapq.nlargest(self.size, self.scores.items(), key=lambda item: item[1])
+        self.polled_at = time.monotonic()
+
+    def rescale(self, epoch):
+        factor = 2 ** ((self.epoch - epoch) / self.half_life)
+        self.scores = {game_id: score * factor for game_id, score in self.scores.items() if score * factor > PRUNE}
+        self.leaders = [(game_id, score * factor) for game_id, score in self.leaders]
+        self.epoch = epoch
+
+    def checkpoint(self, now):
+        self.rescale(seconds(now))
+        os.makedirs(self.directory, exist_ok=True)
+        # Workers checkpoint independently; each writes a complete state under its own name, then renames it
+        tmp = os.path.join(self.directory, f'checkpoint.{os.getpid()}.tmp.npz')
+        np.savez(tmp,
+                 epoch=self.epoch,
+                 horizon=self.horizon,
+                 horizon_at=seconds(self.horizon_at),
+                 game_ids=np.fromiter(self.scores.keys(), dtype=np.int64, count=len(self.scores)),
+                 scores=np.fromiter(self.scores.values(), dtype=np.float64, count=len(self.scores)),
+                 pending_ids=np.fromiter(self.pending.keys(), dtype=np.int64, count=len(self.pending)),
+                 pending_at=np.array([seconds(at) for at in self.pending.values()], dtype=np.float64))
+        os.replace(tmp, self.checkpoint_path())
+        self.checkpointed_at = time.monotonic()
+
+    def top(self):
+        # Reads only the events written since the last poll, at most once per poll_interval
+        now = utcnow()
+        with self.lock:
+            if self.scores is None or time.monotonic() - self.polled_at >= self.poll_interval:
+                with db.engine.connect() as connection:
+                    connection = connection.execution_options(statement_budget=False)
+                    if self.scores is None:
+                        self.load(connection, now)
+                    else:
+                        self.poll(connection, now)
+                if time.monotonic() - self.checkpointed_at >= self.checkpoint_interval:
+                    try:
+                        self.checkpoint(now)
+                    except OSError:
+                        current_app.logger.warning('Could not checkpoint the trending board', exc_info=True)
+            decay = 2 ** ((self.epoch - seconds(now)) / self.half_life)
+            return [(game_id, score * decay) for game_id, score in self.leaders]
+
+
+def trending_games():
+    leaders = current_app.extensions['trending'].top()
+    games = {game.ID: game for game in page_games([game_id for game_id, _ in leaders])}
+    return [{'id': game_id, 'name': games[game_id].Name, 'image': games[game_id].CoverPhoto,
+             'score': games[game_id].MobyScore, 'heat': heat}
+            for game_id, heat in leaders if game_id in games]
+
+
+def init_app(app):
+    if not app.config.get('TRENDING_DIR'):
+        app.config['TRENDING_DIR'] = os.path.join(app.instance_path, 'trending')
+    app.extensions['trending'] = TrendingBoard(app.config['TRENDING_DIR'],
+                                               app.config['TRENDING_HALF_LIFE_HOURS'] * 3600,
+                                               app.config['TRENDING_COUNT'],
+                                               app.config['TRENDING_POLL_INTERVAL'],
+                                               app.config['TRENDING_CHECKPOINT_INTERVAL'])
@@ -0,0 +1,84 @@
+"""Measure time-to-first-byte and bytes on the wire for heavy pages.
+
+Runs each page with no compression, gzip and brotli against a running server:
+
+    python benchmarks/page_weight.py http://localhost:5000 --username alice
+"""
+import argparse
+import http.client
+import re
+import statistics
+import time
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+DEFAULT_PATHS = ['/game/1', '/dream-game', '/top5/collaborations', '/games']
+ENCODINGS = ['identity', 'gzip', 'br']
+
+
+class Client:
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        self.host = parts.netloc
+        self.https = parts.scheme == 'https'
+        self.cookies = SimpleCookie()
+
+    def request(self, method, path, body=None, headers=None):
+        connection_class = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+        connection = connection_class(self.host, timeout=60)
+        headers = dict(headers or {})
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{k}={v.value}' for k, v in self.cookies.items())
+
+        start = time.perf_counter()
+        connection.request(method, path, body=body, headers=headers)
+        response = connection.getresponse()
+        first = response.read(1)
+        ttfb = time.perf_counter() - start
+        body = first + response.read()
+        total = time.perf_counter() - start
+
+        for header in response.headers.get_all('Set-Cookie') or []:
+            self.cookies.load(header)
+        connection.close()
+        return response, body, ttfb, total
+
+    def login(self, username):
+        _, page, _, _ = self.request('GET', '/login', headers={'Accept-Encoding': 'identity'})
+        token = re.search(rb'name="csrf_token" type="hidden" value="([^"]+)"', page)
+        form = {'username': username, 'submit': 'Login'}
+        if token:
+            form['csrf_token'] = token.group(1).decode()
+        self.request('POST', '/login', body=urlencode(form),
+                     headers={'Content-Type': 'application/x-www-form-urlencoded'})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('base_url')
+    parser.add_argument('--username', required=True)
+    parser.add_argument('--path', action='append', dest='paths')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    client = Client(args.base_url)
+    client.login(args.username)
+
+    print(f'{"path":<28}{"encoding":<10}{"status":>7}{"ttfb ms":>10}{"total ms":>10}{"bytes":>10}{"saved":>8}')
+    for path in args.paths or DEFAULT_PATHS:
+        baseline = None
+        for encoding in ENCODINGS:
+            ttfbs, totals, size, status = [], [], 0, None
+            for _ in range(args.runs):
+                response, body, ttfb, total = client.request('GET', path, headers={'Accept-Encoding': encoding})
+                ttfbs.append(ttfb * 1000)
+                totals.append(total * 1000)
+                size, status = len(body), response.status
+            baseline = baseline or size
+            saved = f'{100 * (1 - size / baseline):.0f}%' if baseline else '-'
+            print(f'{path:<28}{encoding:<10}{status:>7}{statistics.median(ttfbs):>10.1f}'
+                  f'{statistics.median(totals):>10.1f}{size:>10}{saved:>8}')
+
+
+if __name__ == '__main__':
+    main()
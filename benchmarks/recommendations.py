@@ -0,0 +1,73 @@
+"""Time the item-item recommendation model build and per-user serving latency on synthetic ratings.
+
+    python benchmarks/recommendations.py --users 200000 --games 50000 --ratings-per-user 40
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import scipy.sparse as sp
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.recommendations import ItemModel, item_neighbours, save  # noqa: E402
+
+
+def synthetic_ratings(n_users, n_games, per_user, seed=0):
+    rng = np.random.default_rng(seed)
+    # A few popular games collect most ratings, as in the real catalog
+    popularity = 1 / np.arange(1, n_games + 1) ** 0.8
+    popularity /= popularity.sum()
+    counts = np.minimum(rng.geometric(1 / per_user, n_users), n_games // 2)
+    users = np.repeat(np.arange(n_users), counts)
+    games = rng.choice(n_games, size=len(users), p=popularity)
+    ratings = np.round(rng.uniform(0.5, 5, len(users)) * 2) / 2
+    matrix = sp.csr_matrix((ratings.astype(np.float32), (users, games)), shape=(n_users, n_games))
+    matrix.sum_duplicates()
+    matrix.data = np.minimum(matrix.data, 5)
+    return matrix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=50000)
+    parser.add_argument('--games', type=int, default=20000)
+    parser.add_argument('--ratings-per-user', type=int, default=30)
+    parser.add_argument('--neighbours', type=int, default=50)
+    parser.add_argument('--queries', type=int, default=1000)
+    args = parser.parse_args()
+
+    ratings = synthetic_ratings(args.users, args.games, args.ratings_per_user)
+    print(f'{ratings.nnz} ratings, {args.users} users x {args.games} games')
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    indptr, indices, dots, norms = item_neighbours(ratings, args.neighbours)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    game_ids = np.arange(args.games, dtype=np.int64)
+    size = sum(array.nbytes for array in (game_ids, indptr, indices, dots, norms))
+    print(f'build: {elapsed:.1f}s, peak {peak / 1024 / 1024:.0f} MiB, model {size / 1024 / 1024:.1f} MiB')
+
+    with tempfile.TemporaryDirectory() as directory:
+        model = ItemModel(save(directory, game_ids, indptr, indices, dots, norms))
+        rng = np.random.default_rng(1)
+        timings = []
+        for user in rng.integers(0, args.users, args.queries):
+            lo, hi = ratings.indptr[user], ratings.indptr[user + 1]
+            user_ratings = dict(zip(ratings.indices[lo:hi].tolist(), ratings.data[lo:hi].tolist()))
+            start = time.perf_counter()
+            model.recommend(user_ratings, 20)
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        print(f'recommend top 20: p50 {statistics.median(timings):.2f} ms, '
+              f'p99 {timings[int(len(timings) * 0.99)]:.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
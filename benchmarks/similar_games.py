@@ -0,0 +1,52 @@
+"""Time the similar-games computation on a synthetic catalog.
+
+    python benchmarks/similar_games.py --games 1000000
+"""
+import argparse
+import os
+import sys
+import time
+import numpy as np
+import scipy.sparse as sp
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.similarity import top_similar  # noqa: E402
+
+# Rough shape of the MobyGames facet vocabulary: (values, max memberships per game)
+FACETS = [(60, 2), (40, 2), (120, 3), (30, 2), (10, 1), (20, 2), (15, 1), (50, 2), (10, 1)]
+
+
+def synthetic_catalog(n_games, seed=0):
+    rng = np.random.default_rng(seed)
+    rows, cols, offset = [], [], 0
+    for n_values, max_per_game in FACETS:
+        # Zipf-like popularity, so a few values (e.g. 'Action') cover much of the catalog
+        popularity = 1 / np.arange(1, n_values + 1)
+        popularity /= popularity.sum()
+        for _ in range(max_per_game):
+            has = rng.random(n_games) < 0.6
+            rows.append(np.flatnonzero(has))
+            cols.append(offset + rng.choice(n_values, size=has.sum(), p=popularity))
+        offset += n_values
+    rows, cols = np.concatenate(rows), np.concatenate(cols)
+    matrix = sp.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, cols)), shape=(n_games, offset))
+    matrix.data[:] = 1
+    return matrix, rng.uniform(1, 10, n_games).astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--games', type=int, default=100000)
+    parser.add_argument('--top-k', type=int, default=10)
+    args = parser.parse_args()
+
+    matrix, moby_scores = synthetic_catalog(args.games)
+    start = time.perf_counter()
+    games, _, _ = top_similar(matrix, moby_scores, args.top_k)
+    elapsed = time.perf_counter() - start
+    print(f'{args.games} games, {matrix.nnz} memberships: {len(games)} neighbours in {elapsed:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
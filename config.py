@@ -3,17 +3,117 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+
+def replica_binds(urls):
+    urls = [url.strip() for url in urls.split(',') if url.strip()]
+    return {f'replica_{i}': url for i, url in enumerate(urls)}
+
+
 class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SECRET_KEY = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
+    # After a write, the user's reads stay on the primary for this long (read-your-writes)
+    PRIMARY_PIN_SECONDS = int(os.getenv('PRIMARY_PIN_SECONDS', 5))
+    # Optional bearer token required to scrape /metrics
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+    # gunicorn workers open every pooled connection once the app is loaded; other processes never do
+    POOL_WARMUP = False
+    # Cover art, logos and profile pictures are proxied through /img and cached resized on disk
+    IMAGE_PROXY = os.getenv('IMAGE_PROXY', '1') == '1'
+    IMAGE_WIDTHS = (120, 240, 400, 800)
+    IMAGE_CACHE_DIR = os.getenv('IMAGE_CACHE_DIR')
+    IMAGE_CACHE_MAX_BYTES = int(os.getenv('IMAGE_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+    IMAGE_FETCH_TIMEOUT = 10
+    IMAGE_MAX_SOURCE_BYTES = 10 * 1024 * 1024
+    COMPRESS_MIN_SIZE = 500
+    COMPRESS_GZIP_LEVEL = 6
+    COMPRESS_BR_QUALITY = 5
+    STREAM_CHUNK_SIZE = 8 * 1024
+    FRAGMENT_MAX_AGE = int(os.getenv('FRAGMENT_MAX_AGE', 30))
+    # Item-item model built by `flask build-recommendations`, memory-mapped by every worker
+    RECOMMENDATIONS_DIR = os.getenv('RECOMMENDATIONS_DIR')
+    RECOMMENDATIONS_COUNT = 20
+    # Built by `flask build-catalog-snapshot` (gunicorn's master runs it on start and every
+    # CATALOG_SNAPSHOT_REFRESH seconds) and memory-mapped by every worker for /games and the top5 pages
+    CATALOG_SNAPSHOT_DIR = os.getenv('CATALOG_SNAPSHOT_DIR')
+    # Written by `flask build-sitemaps` (run it from cron; unchanged shards are left alone)
+    SITEMAP_DIR = os.getenv('SITEMAP_DIR')
+    SITEMAP_BASE_URL = os.getenv('SITEMAP_BASE_URL')
+    # With READ_SNAPSHOT, reads that touch no account or rating tables are served in-process from the SQLite
+    # file `flask build-read-snapshot` publishes in READ_SNAPSHOT_DIR; writes and sessions pinned after a write
+    # still go to MySQL
+    READ_SNAPSHOT = os.getenv('READ_SNAPSHOT', '0') == '1'
+    READ_SNAPSHOT_DIR = os.getenv('READ_SNAPSHOT_DIR')
+    READ_SNAPSHOT_POOL_SIZE = 16
+    # `flask prerender-pages` (run it from cron) writes entity and top 5 pages here as <path>/index.html plus a
+    # gzip copy, for the front server to try before the app; per-user parts load from /fragments/*.
+    # Served that way, those pages no longer require login: the front server hands them to anyone
+    PRERENDER_DIR = os.getenv('PRERENDER_DIR')
+    # /top5/trending: ratings decayed by half every TRENDING_HALF_LIFE_HOURS, tailed from RatingEvents at most
+    # once per TRENDING_POLL_INTERVAL seconds and checkpointed to TRENDING_DIR every TRENDING_CHECKPOINT_INTERVAL
+    TRENDING_DIR = os.getenv('TRENDING_DIR')
+    TRENDING_HALF_LIFE_HOURS = float(os.getenv('TRENDING_HALF_LIFE_HOURS', 48))
+    TRENDING_COUNT = 5
+    TRENDING_POLL_INTERVAL = 1.0
+    TRENDING_CHECKPOINT_INTERVAL = int(os.getenv('TRENDING_CHECKPOINT_INTERVAL', 300))
+    # /games filters run on in-memory bitmaps, rebuilt in the background once older than this
+    FACET_INDEX_TTL = int(os.getenv('FACET_INDEX_TTL', 300))
+    # Profile this fraction of requests (plus any carrying ?profile=<`flask profiles token`>): stacks sampled
+    # every PROFILE_INTERVAL seconds and the tracemalloc peak, kept as the newest PROFILE_MAX_FILES files in
+    # PROFILE_DIR and summarised by `flask profiles top`
+    PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+    PROFILE_DIR = os.getenv('PROFILE_DIR')
+    PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL', 0.005))
+    PROFILE_MAX_FILES = int(os.getenv('PROFILE_MAX_FILES', 2000))
+    PROFILE_TRACE_MEMORY = os.getenv('PROFILE_TRACE_MEMORY', '1') == '1'
+    PROFILE_TOKEN_MAX_AGE = int(os.getenv('PROFILE_TOKEN_MAX_AGE', 3600))
+    # Per worker: (concurrent requests, queued requests, seconds a request may queue) by route class.
+    # A queued request holds one of the worker's gunicorn threads, so each class's running plus queued
+    # requests fit in WORKER_THREADS and a full class answers 503 at once instead of never filling up.
+    # Together they stay below pool_size + max_overflow so the pool never makes anyone wait
+    WORKER_THREADS = int(os.getenv('GUNICORN_THREADS', 8))
+    ADMISSION_LIMITS = {
+        'cheap': (max(WORKER_THREADS // 2, 1), max(WORKER_THREADS // 4, 1), 5.0),
+        'heavy': (max(WORKER_THREADS // 4, 1), max(WORKER_THREADS // 4, 1), 2.0),
+        'write': (max(WORKER_THREADS // 4, 1), max(WORKER_THREADS // 4, 1), 5.0),
+    }
+    # Seconds of SELECT time a request may spend, by endpoint or else by route class; None means no limit.
+    # Reads past the budget are cut off at the database and answered from a stale result or a degraded page
+    STATEMENT_BUDGETS = {
+        'main.games': 3.0,
+        'cheap': 5.0,
+        'heavy': 15.0,
+        'write': None,
+    }
+    STALE_RESULTS_MAX_ROWS = int(os.getenv('STALE_RESULTS_MAX_ROWS', 200000))
+    # Identical concurrent queries run once per worker; with SINGLEFLIGHT_SHARED, once across workers
+    SINGLEFLIGHT_SHARED = os.getenv('SINGLEFLIGHT_SHARED', '0') == '1'
+    SINGLEFLIGHT_DIR = os.getenv('SINGLEFLIGHT_DIR')
+    SINGLEFLIGHT_WAIT = 30
+    # Assembled game/director/company/platform documents per worker, bounded by the rows they hold.
+    # Rating writes invalidate them; the age limit covers catalog edits made outside the app
+    DOCUMENT_CACHE_MAX_ROWS = int(os.getenv('DOCUMENT_CACHE_MAX_ROWS', 200000))
+    DOCUMENT_CACHE_MAX_AGE = int(os.getenv('DOCUMENT_CACHE_MAX_AGE', 3600))
+    # Per session and per worker process: (tokens per second, burst). Buckets live in each worker's memory,
+    # so a client spread over N workers can get up to N times this rate
+    RATE_LIMITS = {
+        'rating': (0.2, 10),
+        'aggregate': (0.5, 10),
+    }
 
 class DevelopmentConfig(Config):
     DEBUG = True
     SQLALCHEMY_DATABASE_URI = os.getenv('LOCAL_DATABASE_URL')
+    # A second local database instance can stand in for the replica
+    SQLALCHEMY_BINDS = replica_binds(os.getenv('LOCAL_REPLICA_DATABASE_URLS', ''))
+    SQLALCHEMY_REPLICA_BINDS = list(SQLALCHEMY_BINDS)
 
 class ProductionConfig(Config):
     DEBUG = False
     SQLALCHEMY_DATABASE_URI = os.getenv('AIVEN_DATABASE_URL')
+    SQLALCHEMY_BINDS = replica_binds(os.getenv('AIVEN_REPLICA_DATABASE_URLS', ''))
+    SQLALCHEMY_REPLICA_BINDS = list(SQLALCHEMY_BINDS)
+    POOL_WARMUP = True
     SQLALCHEMY_ENGINE_OPTIONS = {
         'pool_size': 10,
         'pool_recycle': 120,
@@ -0,0 +1,54 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+from prometheus_client import multiprocess
+
+# Threads let a worker queue cheap requests behind its admission limits instead of blocking on one slow page
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 8))
+
+# Seconds between catalog snapshot rebuilds by the master; 0 leaves snapshots to cron or a deploy step
+catalog_snapshot_refresh = int(os.getenv('CATALOG_SNAPSHOT_REFRESH', 0))
+# Workers serving reads from the embedded SQLite snapshot get it rebuilt on the same schedule
+snapshot_commands = ['build-catalog-snapshot'] + (['build-read-snapshot'] if os.getenv('READ_SNAPSHOT') == '1' else [])
+
+
+def build_catalog_snapshot(server):
+    # A child process, so the master never holds database connections its forked workers would inherit
+    for command in snapshot_commands:
+        result = subprocess.run([sys.executable, '-m', 'flask', '--app', 'run', command],
+                                capture_output=True, text=True)
+        if result.returncode:
+            server.log.error('%s failed: %s', command, result.stderr.strip()[-2000:])
+        else:
+            server.log.info(result.stdout.strip())
+
+
+def on_starting(server):
+    # Build before the first workers fork so they attach to a snapshot from their first request
+    if catalog_snapshot_refresh:
+        build_catalog_snapshot(server)
+
+
+def when_ready(server):
+    def refresh():
+        while True:
+            time.sleep(catalog_snapshot_refresh)
+            build_catalog_snapshot(server)
+
+    if catalog_snapshot_refresh:
+        threading.Thread(target=refresh, daemon=True).start()
+
+
+def post_worker_init(worker):
+    # Only serving workers warm their connection pools
+    from app.metrics import warm_worker
+    warm_worker(worker.wsgi)
+
+
+def child_exit(server, worker):
+    # Set PROMETHEUS_MULTIPROC_DIR so /metrics aggregates across workers
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        multiprocess.mark_process_dead(worker.pid)